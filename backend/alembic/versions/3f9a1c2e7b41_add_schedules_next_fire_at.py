@@ -0,0 +1,54 @@
+"""add schedules next_fire_at
+
+Revision ID: 3f9a1c2e7b41
+Revises: 754db4a067d8
+Create Date: 2026-10-18 09:12:04.118230
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from schedule_utils import compute_next_fire_at
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9a1c2e7b41'
+down_revision: Union[str, None] = '754db4a067d8'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('schedules', sa.Column('next_fire_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_schedules_next_fire_at'), 'schedules', ['next_fire_at'], unique=False)
+
+    # Backfill existing schedules from the owning user's timezone
+    bind = op.get_bind()
+    schedules = sa.table(
+        'schedules',
+        sa.column('id', sa.Integer),
+        sa.column('user_id', sa.Integer),
+        sa.column('day_of_week', sa.String),
+        sa.column('time_of_day', sa.Time),
+        sa.column('next_fire_at', sa.DateTime),
+    )
+    users = sa.table('users', sa.column('id', sa.Integer), sa.column('timezone', sa.String))
+    rows = bind.execute(
+        sa.select(schedules.c.id, schedules.c.day_of_week, schedules.c.time_of_day, users.c.timezone)
+        .select_from(schedules.join(users, schedules.c.user_id == users.c.id))
+    ).fetchall()
+    for row in rows:
+        if not row.day_of_week or row.time_of_day is None:
+            continue
+        bind.execute(
+            schedules.update()
+            .where(schedules.c.id == row.id)
+            .values(next_fire_at=compute_next_fire_at(row.day_of_week, row.time_of_day, row.timezone))
+        )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_schedules_next_fire_at'), table_name='schedules')
+    op.drop_column('schedules', 'next_fire_at')
@@ -0,0 +1,26 @@
+"""add generated_speeches feed index
+
+Revision ID: 5e0b7a93d1c6
+Revises: d4a8f61c2e93
+Create Date: 2026-10-18 16:03:44.871260
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '5e0b7a93d1c6'
+down_revision: Union[str, None] = 'd4a8f61c2e93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_generated_speeches_user_id_created_at_id', 'generated_speeches', ['user_id', 'created_at', 'id'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_generated_speeches_user_id_created_at_id', table_name='generated_speeches')
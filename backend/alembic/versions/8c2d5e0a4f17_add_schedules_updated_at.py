@@ -0,0 +1,29 @@
+"""add schedules updated_at
+
+Revision ID: 8c2d5e0a4f17
+Revises: 3f9a1c2e7b41
+Create Date: 2026-10-18 11:40:27.530914
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8c2d5e0a4f17'
+down_revision: Union[str, None] = '3f9a1c2e7b41'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('schedules', sa.Column('updated_at', sa.DateTime(), nullable=True))
+    op.create_index(op.f('ix_schedules_updated_at'), 'schedules', ['updated_at'], unique=False)
+    op.execute(sa.text("UPDATE schedules SET updated_at = CURRENT_TIMESTAMP"))
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_schedules_updated_at'), table_name='schedules')
+    op.drop_column('schedules', 'updated_at')
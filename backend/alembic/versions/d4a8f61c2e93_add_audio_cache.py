@@ -0,0 +1,31 @@
+"""add audio_cache
+
+Revision ID: d4a8f61c2e93
+Revises: b71e3d9c5a02
+Create Date: 2026-10-18 15:22:09.418305
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd4a8f61c2e93'
+down_revision: Union[str, None] = 'b71e3d9c5a02'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('audio_cache',
+    sa.Column('key', sa.String(length=64), nullable=False),
+    sa.Column('speech_url', sa.String(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('key')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('audio_cache')
@@ -0,0 +1,28 @@
+"""add email_outbox schedule
+
+Revision ID: e3b9d27f6a14
+Revises: c6f2a8d40e51
+Create Date: 2026-10-18 21:14:08.602317
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'e3b9d27f6a14'
+down_revision: Union[str, None] = 'c6f2a8d40e51'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.add_column('email_outbox', sa.Column('schedule_id', sa.Integer(), nullable=True))
+    op.add_column('email_outbox', sa.Column('schedule_next_fire_at', sa.DateTime(), nullable=True))
+
+
+def downgrade() -> None:
+    op.drop_column('email_outbox', 'schedule_next_fire_at')
+    op.drop_column('email_outbox', 'schedule_id')
@@ -0,0 +1,47 @@
+# backend/audio_cache.py
+import hashlib
+import json
+import logging
+import os
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from models import AudioCacheEntry
+from metrics import metrics
+
+load_dotenv()
+
+AUDIO_CACHE_ENABLED = os.getenv('AUDIO_CACHE_ENABLED', 'true').lower() == 'true'
+
+def audio_cache_key(text, voice, output_format):
+    payload = json.dumps({
+        "text": text,
+        "voice": getattr(voice, 'value', voice),
+        "format": getattr(output_format, 'name', str(output_format))
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+def audio_blob_name(key):
+    """Content-addressed blob name, so the same clip is never stored twice."""
+    return f"audio/{key}.mp3"
+
+def lookup_audio(db, key):
+    """Return the URL of an already synthesized clip, or None."""
+    if not AUDIO_CACHE_ENABLED:
+        return None
+    entry = db.get(AudioCacheEntry, key)
+    metrics.increment('tts.audio_cache.hit' if entry else 'tts.audio_cache.miss')
+    return entry.speech_url if entry else None
+
+def record_audio(db, key, speech_url):
+    """
+    Index an uploaded clip. Workers racing on the same key uploaded the same
+    bytes to the same blob, so losing the insert race is harmless.
+    """
+    if not AUDIO_CACHE_ENABLED:
+        return
+    db.add(AudioCacheEntry(key=key, speech_url=speech_url))
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        logging.info(f"Audio cache entry {key} was recorded concurrently")
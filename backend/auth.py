@@ -1,11 +1,13 @@
 # backend/auth.py
 import msal
-from fastapi import APIRouter, Request, Depends, HTTPException, status, Response
+from fastapi import APIRouter, Request, Depends, HTTPException, status, Response, Query
 from fastapi.responses import RedirectResponse, JSONResponse
+from typing import Optional
 from sqlalchemy.orm import Session
 from database import SessionLocal, get_db
 from models import User
-from utils import create_access_token, verify_token
+from utils import create_access_token, verify_token, parse_include, build_user_response, RECENT_SPEECHES_LIMIT
+from pagination import MAX_PAGE_SIZE
 from dotenv import load_dotenv
 import os
 import logging
@@ -91,7 +93,8 @@ async def callback(request: Request, response: Response, db: Session = Depends(g
         db.commit()
         db.refresh(user)
 
-    access_token = create_access_token(data={"sub": user.id})
+    # PyJWT requires the subject claim to be a string
+    access_token = create_access_token(data={"sub": str(user.id)})
 
     # Set the access token in a secure HTTP-only cookie
     response = RedirectResponse(url=FRONTEND_URL)  # Redirect to frontend home
@@ -117,13 +120,21 @@ def logout(request: Request, response: Response):
     # If origin doesn't match, redirect to https://algorithmspeaks.com
     return RedirectResponse(url=FRONTEND_URL)
 
-@router.get("/me", response_model=UserSchema)
-def get_current_user_endpoint(request: Request, db: Session = Depends(get_db)):
+@router.get("/me", response_model=UserSchema, response_model_exclude_unset=True)
+def get_current_user_endpoint(
+    request: Request,
+    include: Optional[str] = Query(None, description="Comma-separated relationships to expand: preferences, schedules, generated_speeches"),
+    speeches_limit: int = Query(RECENT_SPEECHES_LIMIT, ge=0, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db)
+):
     token = request.cookies.get('access_token')
     if not token:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
     user = verify_token(token, db)
     if not user:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    user_data = UserSchema.from_orm(user)
-    return user_data  # Let FastAPI handle serialization
+    try:
+        include = parse_include(include)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return build_user_response(db, user, include, speeches_limit)
@@ -1,61 +1,166 @@
 # backend/azure_storage.py
+import asyncio
 import os
-from urllib.parse import urlparse, parse_qs
-from azure.storage.blob import BlobServiceClient, BlobClient, ContainerClient
-from dotenv import load_dotenv
+import mimetypes
 import logging
+import tempfile
+from types import SimpleNamespace
+from urllib.parse import quote
+import requests
+from azure.core.pipeline.transport import RequestsTransport
+from azure.storage.blob import ContainerClient, ContentSettings
+from dotenv import load_dotenv
+from resilience import CircuitBreaker, hedged
 
 load_dotenv()
 
+# 'azure' for Azure Blob Storage, 'local' for a directory on disk (offline benchmarking)
+BLOB_STORAGE_BACKEND = os.getenv('BLOB_STORAGE_BACKEND', 'azure')
 CONTAINER_SAS_URL = os.getenv('AZURE_CONTAINER_SAS_URL')
+LOCAL_BLOB_DIR = os.path.abspath(os.getenv('LOCAL_BLOB_DIR', './blobs'))
+LOCAL_BLOB_BASE_URL = os.getenv('LOCAL_BLOB_BASE_URL', f"file://{LOCAL_BLOB_DIR}")
 
-if not CONTAINER_SAS_URL:
-    raise ValueError("AZURE_CONTAINER_SAS_URL environment variable is not set")
+# HTTP keep-alive pool shared by every upload in the process
+BLOB_POOL_SIZE = int(os.getenv('BLOB_POOL_SIZE', '32'))
+# Clips above the single-put size are uploaded as blocks, several at a time
+BLOB_MAX_SINGLE_PUT_SIZE = int(os.getenv('BLOB_MAX_SINGLE_PUT_SIZE', str(2 * 1024 * 1024)))
+BLOB_MAX_BLOCK_SIZE = int(os.getenv('BLOB_MAX_BLOCK_SIZE', str(1024 * 1024)))
+BLOB_UPLOAD_CONCURRENCY = int(os.getenv('BLOB_UPLOAD_CONCURRENCY', '4'))
+# Give up waiting for an upload after this long; start a second, identical
+# upload if the first hasn't finished after BLOB_HEDGE_AFTER_SECONDS (0 disables)
+BLOB_UPLOAD_DEADLINE_SECONDS = float(os.getenv('BLOB_UPLOAD_DEADLINE_SECONDS', '60'))
+BLOB_HEDGE_AFTER_SECONDS = float(os.getenv('BLOB_HEDGE_AFTER_SECONDS', '0'))
 
+blob_breaker = CircuitBreaker('blob')
+
+
+class LocalBlobClient:
+    def __init__(self, path, url):
+        self.path = path
+        self.url = url
+
+    def upload_blob(self, data, overwrite=False, **kwargs):
+        if not overwrite and os.path.exists(self.path):
+            raise FileExistsError(f"Blob already exists: {self.url}")
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # Write then rename so readers never see a partial blob. Each upload
+        # gets its own temporary file, as the same blob may be uploaded twice at once
+        with tempfile.NamedTemporaryFile(
+            dir=os.path.dirname(self.path), prefix=f"{os.path.basename(self.path)}.", suffix='.tmp', delete=False
+        ) as f:
+            try:
+                if isinstance(data, (bytes, bytearray, memoryview)):
+                    f.write(data)
+                else:
+                    for chunk in iter(lambda: data.read(BLOB_MAX_BLOCK_SIZE), b''):
+                        f.write(chunk)
+            except BaseException:
+                f.close()
+                os.remove(f.name)
+                raise
+        os.replace(f.name, self.path)
+
+
+class LocalContainerClient:
+    """
+    Filesystem stand-in for azure.storage.blob.ContainerClient, implementing
+    the subset of its interface this app uses.
+    """
+
+    def __init__(self, directory, base_url):
+        self.directory = directory
+        self.base_url = base_url.rstrip('/')
+        os.makedirs(directory, exist_ok=True)
+
+    def get_blob_client(self, blob):
+        path = os.path.normpath(os.path.join(self.directory, blob))
+        if not path.startswith(self.directory + os.sep):
+            raise ValueError(f"Invalid blob name: {blob}")
+        return LocalBlobClient(path, f"{self.base_url}/{quote(blob)}")
+
+    def list_blobs(self):
+        for root, _, files in os.walk(self.directory):
+            for file_name in sorted(files):
+                if file_name.endswith('.tmp'):
+                    continue
+                name = os.path.relpath(os.path.join(root, file_name), self.directory)
+                yield SimpleNamespace(name=name.replace(os.sep, '/'))
 
-def list_blobs():
-    try:
-        # Parse the SAS URL to extract necessary components
-        parsed_url = urlparse(CONTAINER_SAS_URL)
-        account_name = parsed_url.netloc.split('.')[0]
-        container_name = parsed_url.path.split('/')[-1]
-        sas_token = parsed_url.query
 
-        # Create the base URL for the storage account
-        account_url = f"https://{account_name}.blob.core.windows.net"
+def create_container_client():
+    if BLOB_STORAGE_BACKEND == 'local':
+        return LocalContainerClient(LOCAL_BLOB_DIR, LOCAL_BLOB_BASE_URL)
 
-        # Create BlobServiceClient using account URL and SAS token
-        blob_service_client = BlobServiceClient(account_url=account_url, credential=sas_token)
+    if not CONTAINER_SAS_URL:
+        raise ValueError("AZURE_CONTAINER_SAS_URL environment variable is not set")
 
-        # Get a client to interact with the container
-        container_client = blob_service_client.get_container_client(container_name)
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=BLOB_POOL_SIZE, pool_maxsize=BLOB_POOL_SIZE)
+    session.mount('https://', adapter)
+    return ContainerClient.from_container_url(
+        CONTAINER_SAS_URL,
+        transport=RequestsTransport(session=session, session_owner=False),
+        max_single_put_size=BLOB_MAX_SINGLE_PUT_SIZE,
+        max_block_size=BLOB_MAX_BLOCK_SIZE
+    )
 
+# One client per process; blob clients derived from it share its connection pool
+container_client = create_container_client()
+
+
+def list_blobs():
+    try:
         blobs = container_client.list_blobs()
         blob_urls = [container_client.get_blob_client(blob.name).url.split('?')[0] for blob in blobs]
         return blob_urls
     except Exception as e:
         logging.error(f"Error listing blobs: {e}")
         return []
-    
-def upload_file_to_blob(local_file_path, blob_name='speech.wav'):
-    try:
-        # Extract the container URL and the SAS token
-        container_url, sas_token = CONTAINER_SAS_URL.split("?")
 
-        # Construct the blob URL by appending the blob name to the container URL
-        blob_url_with_sas = f"{container_url}/{blob_name}?{sas_token}"
+def blob_url(blob_name):
+    """The public URL a blob is (or will be) available at, without the SAS token."""
+    return container_client.get_blob_client(blob_name).url.split('?')[0]
 
-        # Create a BlobClient using the constructed blob URL with SAS
-        blob_client = BlobClient.from_blob_url(blob_url_with_sas)
+def _upload(data, blob_name, content_type):
+    blob_client = container_client.get_blob_client(blob_name)
+    blob_client.upload_blob(
+        data,
+        overwrite=True,
+        max_concurrency=BLOB_UPLOAD_CONCURRENCY,
+        content_settings=ContentSettings(content_type=content_type)
+    )
+    # Return the blob's URL without the SAS token for public access
+    return blob_client.url.split('?')[0]
 
-        # Upload the file
+def upload_file_to_blob(local_file_path, blob_name='speech.wav'):
+    try:
+        content_type = mimetypes.guess_type(blob_name)[0] or 'application/octet-stream'
         with open(local_file_path, "rb") as data:
-            blob_client.upload_blob(data, overwrite=True)
+            return _upload(data, blob_name, content_type)
+    except Exception as e:
+        logging.error(f"Error uploading to blob: {e}")
+        return None
 
-        # Retrieve and return the blob's URL without the SAS token for public access
-        blob_url_without_sas = f"{container_url}/{blob_name}"
-        #print(f"File uploaded successfully to {blob_url_without_sas}")
-        return blob_url_without_sas
+async def run_upload(upload, *args):
+    """
+    Run a blocking upload function such as upload_bytes_to_blob on a thread,
+    behind the blob circuit breaker and deadline. Uploads overwrite the same
+    blob, so a slow one may be hedged with a second attempt. A thread can't be
+    cancelled: the losing attempt, like one past the deadline, keeps running
+    to completion and writes the same data again, so each upload must be safe
+    to run concurrently with itself (LocalBlobClient writes through its own
+    temporary file).
+    """
+    not_stored = lambda url: not url
+    return await blob_breaker.call(
+        hedged(lambda: asyncio.to_thread(upload, *args), BLOB_HEDGE_AFTER_SECONDS, is_failure=not_stored, name='blob'),
+        deadline=BLOB_UPLOAD_DEADLINE_SECONDS,
+        is_failure=not_stored
+    )
+
+def upload_bytes_to_blob(data, blob_name, content_type='audio/mpeg'):
+    try:
+        return _upload(data, blob_name, content_type)
     except Exception as e:
-        logging.error(f"Failed to upload blob: {e}")
-        return None
\ No newline at end of file
+        logging.error(f"Error uploading to blob: {e}")
+        return None
@@ -0,0 +1,72 @@
+# backend/benchmark_pipeline.py
+"""
+Compare sequential and sentence-pipelined speech generation end to end on
+the offline providers (LLM_BACKEND=fake, TTS_BACKEND=fake, see providers.py),
+so the effect of TTS_PIPELINE_ENABLED can be measured without Azure
+credentials. The runs go through the real llm_utils and tts_utils code,
+including the TTS worker pool, governors and circuit breakers.
+
+    python benchmark_pipeline.py --runs 5 --repeat 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+async def run_sequential(llm_utils, tts_utils, messages):
+    text = await llm_utils.generate_speech_text(messages)
+    result = await tts_utils.tts_executor.synthesize(text, 'Ava')
+    return result.audio_data
+
+async def run_pipelined(llm_utils, tts_utils, messages, min_chars):
+    pipeline = tts_utils.SpeechPipeline('Ava', min_chars=min_chars)
+    async for delta in llm_utils.stream_speech_text(messages):
+        pipeline.feed(delta)
+    return await pipeline.finish()
+
+async def main(args):
+    # The providers read their settings when imported
+    import llm_utils
+    import tts_utils
+    from mp3_utils import iter_frames
+
+    print(f"{'mode':<12}{'mean s':>10}{'median s':>10}{'min s':>10}{'frames':>10}")
+    for mode in ('sequential', 'pipelined'):
+        timings = []
+        for run in range(args.runs):
+            messages = [{"role": "user", "content": f"Benchmark run {run}"}]
+            started_at = time.monotonic()
+            if mode == 'sequential':
+                audio = await run_sequential(llm_utils, tts_utils, messages)
+            else:
+                audio = await run_pipelined(llm_utils, tts_utils, messages, args.min_chars)
+            timings.append(time.monotonic() - started_at)
+        frames = sum(1 for _ in iter_frames(audio))
+        print(f"{mode:<12}{statistics.mean(timings):>10.3f}{statistics.median(timings):>10.3f}{min(timings):>10.3f}{frames:>10}")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark sequential vs pipelined speech generation on the offline providers.")
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--repeat', type=int, default=4, help="Times the canned speech is repeated, to model longer speeches")
+    parser.add_argument('--first-token-ms', type=float, default=400)
+    parser.add_argument('--token-ms', type=float, default=15)
+    parser.add_argument('--tts-latency-ms', type=float, default=300)
+    parser.add_argument('--tts-char-ms', type=float, default=2)
+    parser.add_argument('--tts-workers', type=int, default=4)
+    parser.add_argument('--min-chars', type=int, default=80)
+    args = parser.parse_args()
+    os.environ.update({
+        'LLM_BACKEND': 'fake',
+        'TTS_BACKEND': 'fake',
+        'FAKE_LLM_REPEAT': str(args.repeat),
+        'FAKE_LLM_LATENCY_SECONDS': str(args.first_token_ms / 1000),
+        'FAKE_LLM_TOKEN_SECONDS': str(args.token_ms / 1000),
+        'FAKE_TTS_LATENCY_SECONDS': str(args.tts_latency_ms / 1000),
+        'FAKE_TTS_CHAR_SECONDS': str(args.tts_char_ms / 1000),
+        'TTS_WORKERS': str(args.tts_workers),
+        # Keep the shared rate limits out of the measurement
+        'LLM_REQUESTS_PER_SECOND': '0',
+        'TTS_REQUESTS_PER_SECOND': '0',
+    })
+    asyncio.run(main(args))
@@ -1,22 +1,78 @@
 # email_utils.py
 import os
+import threading
 from dotenv import load_dotenv
 import logging
 from azure.communication.email import EmailClient
 from azure.core.exceptions import AzureError
 import base64
+import html
+from metrics import metrics
+from resilience import CircuitBreaker
+from providers import LocalEmailClient
 
 
 load_dotenv()
 
+# 'azure' for Azure Communication Services, 'local' to write each email to LOCAL_MAIL_DIR instead
+EMAIL_BACKEND = os.getenv('EMAIL_BACKEND', 'azure')
 CONNECTION_STRING = os.getenv('AZURE_COMMUNICATION_CONNECTION_STRING')
 SENDER_ADDRESS = os.getenv('SENDER_EMAIL_ADDRESS')
 
-def send_email(to_email, subject, content, url=None, attachments=None):
+# Larger attachments are replaced by the speech link when there is one
+EMAIL_ATTACHMENT_MAX_BYTES = int(os.getenv('EMAIL_ATTACHMENT_MAX_BYTES', str(4 * 1024 * 1024)))
+# Stop waiting for a send after this long; it is retried like a failed one
+EMAIL_SEND_DEADLINE_SECONDS = float(os.getenv('EMAIL_SEND_DEADLINE_SECONDS', '60'))
+
+email_breaker = CircuitBreaker('email')
+
+_client = None
+_client_lock = threading.Lock()
+
+def create_email_client():
+    if EMAIL_BACKEND == 'local':
+        return LocalEmailClient()
+    return EmailClient.from_connection_string(CONNECTION_STRING)
+
+def get_email_client():
+    """One EmailClient per process, so sends reuse its HTTP connections."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = create_email_client()
+        return _client
+
+def build_attachment(item):
+    """Attachment dict for a file path or an in-memory (file_name, data) pair."""
+    if isinstance(item, tuple):
+        file_name, file_data = item
+    else:
+        file_name = os.path.basename(item)
+        with open(item, 'rb') as f:
+            file_data = f.read()
+    return {
+        "name": file_name,
+        "contentType": "audio/mpeg",
+        "contentInBase64": base64.b64encode(file_data).decode('ascii')
+    }
+
+def attachment_size(item):
+    return len(item[1]) if isinstance(item, tuple) else os.path.getsize(item)
+
+def send_email(to_email, subject, content, url=None, attachments=None, client=None):
+    """
+    Send the email and return True, or log the error and return False. When
+    `url` is given the email links to it, and attachments larger than
+    EMAIL_ATTACHMENT_MAX_BYTES are left out in favour of the link.
+    """
     try:
-        client = EmailClient.from_connection_string(CONNECTION_STRING)
+        client = client or create_email_client()
 
         formatted_content = content.replace('\n', '<br>')
+        plain_text = content
+        if url:
+            plain_text += f"\n\nListen online: {url}"
+            formatted_content += f'<br><br><a href="{html.escape(url, quote=True)}">Listen online</a>'
 
         message = {
             "senderAddress": SENDER_ADDRESS,
@@ -25,7 +81,7 @@ def send_email(to_email, subject, content, url=None, attachments=None):
             },
             "content": {
                 "subject": subject,
-                "plainText": content,
+                "plainText": plain_text,
                 "html": f"""
                 <html>
                     <body>
@@ -35,24 +91,25 @@ def send_email(to_email, subject, content, url=None, attachments=None):
             }
         }
 
-        # Attach files if any
+        # Attach files if any; each is a file path or an in-memory (file_name, data) pair
         if attachments:
             message["attachments"] = []
-            for file_path in attachments:
-                with open(file_path, 'rb') as f:
-                    file_data = f.read()
-                    file_name = os.path.basename(file_path)
-                    attachment = {
-                        "name": file_name,
-                        "contentType": "audio/mpeg",
-                        "contentInBase64": base64.b64encode(file_data).decode('utf-8')
-                    }
-                message["attachments"].append(attachment)
+            for item in attachments:
+                size = attachment_size(item)
+                if url and size > EMAIL_ATTACHMENT_MAX_BYTES:
+                    metrics.increment('email.attachments.link_only')
+                    logging.info(f"Attachment of {size} bytes to {to_email} replaced by a link")
+                    continue
+                message["attachments"].append(build_attachment(item))
+                metrics.increment('email.attachments.attached')
+                metrics.increment('email.attachments.bytes', size)
 
         poller = client.begin_send(message)
         result = poller.result()
         logging.info(f"Email sent to {to_email}.")
+        return True
     except AzureError as e:
         logging.error(f"Azure error sending email to {to_email}: {e}")
     except Exception as e:
-        logging.error(f"Error sending email to {to_email}: {e}")
\ No newline at end of file
+        logging.error(f"Error sending email to {to_email}: {e}")
+    return False
\ No newline at end of file
@@ -0,0 +1,145 @@
+# backend/encoding.py
+import gzip
+import json
+import os
+import time
+from dotenv import load_dotenv
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from metrics import metrics
+
+try:
+    import orjson
+except ImportError:  # in requirements.txt; without it the standard library encoder is used
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # in requirements.txt; without it only gzip is offered
+    brotli = None
+
+load_dotenv()
+
+RESPONSE_COMPRESSION_ENABLED = os.getenv('RESPONSE_COMPRESSION_ENABLED', 'true').lower() == 'true'
+# Bodies smaller than this are sent as they are; compressing them costs more than it saves
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.getenv('RESPONSE_COMPRESSION_MIN_SIZE', '1024'))
+GZIP_LEVEL = int(os.getenv('GZIP_LEVEL', '6'))
+BROTLI_QUALITY = int(os.getenv('BROTLI_QUALITY', '5'))
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/')
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    JSONResponse rendered with orjson when it is installed, for endpoints that
+    build their content by hand. Endpoints with a response_model are already
+    serialized straight to bytes by pydantic-core and don't need it.
+    """
+
+    def render(self, content) -> bytes:
+        if orjson is not None:
+            return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+        return json.dumps(content, ensure_ascii=False, separators=(',', ':'), default=str).encode('utf-8')
+
+
+def negotiate_encoding(accept_encoding):
+    """Pick 'br' or 'gzip' from an Accept-Encoding header, or None for identity."""
+    preferences = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.strip().partition(';')
+        quality = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        if name:
+            preferences[name.strip().lower()] = quality
+
+    best, best_quality = None, 0.0
+    for encoding in (('br', 'gzip') if brotli is not None else ('gzip',)):
+        quality = preferences.get(encoding, preferences.get('*', 0.0))
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def compress(body, encoding):
+    if encoding == 'br':
+        return brotli.compress(body, quality=BROTLI_QUALITY)
+    return gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete JSON and text responses above the size threshold with
+    the best encoding the client accepts. Streaming responses pass through
+    untouched so events reach the client as they are produced.
+    """
+
+    def __init__(self, app, minimum_size=RESPONSE_COMPRESSION_MIN_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RESPONSE_COMPRESSION_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        request_headers = Headers(scope=scope)
+        encoding = negotiate_encoding(request_headers.get('accept-encoding', ''))
+        start_message = None
+
+        async def send_compressed(message):
+            nonlocal start_message
+            if message["type"] == "http.response.start" and message["status"] == 304:
+                # Revalidating a compressed copy: answer with the validator it was sent with
+                headers = MutableHeaders(raw=message["headers"])
+                etag = headers.get('etag')
+                if etag and f"W/{etag}" in request_headers.get('if-none-match', ''):
+                    headers['ETag'] = f"W/{etag}"
+                await send(message)
+                return
+            if message["type"] == "http.response.start":
+                # Hold the headers until the body shows whether to compress
+                start_message = message
+                return
+            if message["type"] != "http.response.body" or start_message is None:
+                await send(message)
+                return
+
+            start, start_message = start_message, None
+            headers = MutableHeaders(raw=start["headers"])
+            body = message.get("body", b"")
+            compressible = (
+                headers.get('content-type', '').startswith(COMPRESSIBLE_TYPES)
+                and 'content-encoding' not in headers
+            )
+            if compressible:
+                headers.add_vary_header('Accept-Encoding')
+            if not compressible or encoding is None or message.get("more_body", False) or len(body) < self.minimum_size:
+                if compressible and not message.get("more_body", False):
+                    metrics.increment('http.compression.uncompressed_bytes', len(body))
+                await send(start)
+                await send(message)
+                return
+
+            started_at = time.monotonic()
+            compressed = compress(body, encoding)
+            metrics.observe('http.compression', time.monotonic() - started_at)
+            metrics.increment(f'http.compression.{encoding}.responses')
+            metrics.increment('http.compression.bytes_in', len(body))
+            metrics.increment('http.compression.bytes_out', len(compressed))
+
+            headers['Content-Encoding'] = encoding
+            headers['Content-Length'] = str(len(compressed))
+            # The compressed bytes are a different representation of the same
+            # entity, so a strong validator becomes weak (as nginx does)
+            etag = headers.get('etag')
+            if etag and not etag.startswith('W/'):
+                headers['ETag'] = f"W/{etag}"
+            await send(start)
+            await send({"type": "http.response.body", "body": compressed})
+
+        await self.app(scope, receive, send_compressed)
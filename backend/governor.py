@@ -0,0 +1,249 @@
+# backend/governor.py
+import asyncio
+import datetime
+import logging
+import random
+import time
+from contextlib import asynccontextmanager
+from sqlalchemy.exc import IntegrityError
+from database import SessionLocal
+from models import RateLimitBucket
+from metrics import metrics
+from resilience import DeadlineExceededError
+
+# Every governor in the process, by name, for GET /metrics/
+governors = {}
+
+def take_token(db, name, rate, burst, now):
+    """
+    Take one token from the shared bucket `name`, refilled at `rate` per second
+    up to `burst`. Returns 0 if a token was taken, the seconds until one is
+    available if not, or None if another process updated the bucket first.
+    """
+    bucket = db.get(RateLimitBucket, name, populate_existing=True)
+    if bucket is None:
+        db.add(RateLimitBucket(name=name, tokens=burst - 1, updated_at=now, version=0))
+        try:
+            db.commit()
+        except IntegrityError:
+            db.rollback()
+            return None
+        return 0
+
+    elapsed = max((now - bucket.updated_at).total_seconds(), 0)
+    tokens = min(burst, bucket.tokens + elapsed * rate)
+    if tokens < 1:
+        db.commit()
+        return (1 - tokens) / rate
+    taken = (
+        db.query(RateLimitBucket)
+        .filter(RateLimitBucket.name == name, RateLimitBucket.version == bucket.version)
+        .update(
+            {RateLimitBucket.tokens: tokens - 1, RateLimitBucket.updated_at: now, RateLimitBucket.version: bucket.version + 1},
+            synchronize_session=False
+        )
+    )
+    db.commit()
+    return 0 if taken else None
+
+def drain_bucket(db, name, rate, seconds, now):
+    """Empty the shared bucket so no process calls the provider for `seconds`, e.g. after a 429."""
+    values = {RateLimitBucket.tokens: -rate * seconds, RateLimitBucket.updated_at: now, RateLimitBucket.version: RateLimitBucket.version + 1}
+    db.query(RateLimitBucket).filter(RateLimitBucket.name == name, RateLimitBucket.tokens > -rate * seconds).update(values, synchronize_session=False)
+    db.commit()
+
+class ProviderBusyError(Exception):
+    """Too many calls are already waiting for the provider; the caller should back off."""
+
+    def __init__(self, name):
+        super().__init__(f"Too many calls waiting for {name}")
+        self.name = name
+
+def retry_after_seconds(error):
+    response = getattr(error, 'response', None)
+    try:
+        return float(response.headers['retry-after'])
+    except (AttributeError, KeyError, TypeError, ValueError):
+        return None
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit: each call that finishes within the latency target
+    raises the limit by 1/limit (about one per round of calls), and a throttled
+    or slow call halves it, down to `min_limit`. At most `max_waiting` callers
+    wait for a slot (None for no bound).
+    """
+
+    def __init__(self, min_limit, max_limit, latency_target=None, max_waiting=None):
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.latency_target = latency_target
+        self.max_waiting = max_waiting
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self.waiting = 0
+        self._condition = None
+        self._loop = None
+
+    def _get_condition(self):
+        # An asyncio.Condition belongs to one event loop, so make one per loop
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._condition = asyncio.Condition()
+            self._loop = loop
+        return self._condition
+
+    async def acquire(self, timeout=None):
+        """
+        Take a slot, waiting up to `timeout` seconds for one. Returns False
+        without waiting if `max_waiting` callers already are; raises
+        asyncio.TimeoutError if the wait times out.
+        """
+        condition = self._get_condition()
+        async with condition:
+            has_slot = lambda: self.in_flight < int(self.limit)
+            if not has_slot():
+                if self.max_waiting is not None and self.waiting >= self.max_waiting:
+                    return False
+                self.waiting += 1
+                try:
+                    await asyncio.wait_for(condition.wait_for(has_slot), timeout)
+                finally:
+                    self.waiting -= 1
+            self.in_flight += 1
+            return True
+
+    async def release(self):
+        condition = self._get_condition()
+        async with condition:
+            self.in_flight -= 1
+            condition.notify_all()
+
+    def on_success(self, latency):
+        if self.latency_target and latency > self.latency_target:
+            self.on_overload()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def on_overload(self):
+        self.limit = max(self.min_limit, self.limit / 2)
+
+class Permit:
+    """Handed to the caller of ProviderGovernor.acquire() to report a throttled call."""
+
+    def __init__(self):
+        self.throttled = False
+        self.failed = False
+        self.retry_after = None
+
+    def throttle(self, retry_after=None):
+        self.throttled = True
+        self.retry_after = retry_after
+
+class ProviderGovernor:
+    """
+    Governs calls to one provider deployment: a token bucket shared through
+    the database caps the request rate across every worker and the scheduler,
+    and an AIMD limit adapts this process's concurrency to the latency and
+    throttling it observes. A rate of 0 disables the shared bucket. Beyond
+    `max_waiting` callers waiting for a slot, acquire() fails fast with
+    ProviderBusyError. With `register` the governor is reported by GET /metrics/.
+    """
+
+    def __init__(self, name, rate, burst, min_concurrency, max_concurrency, latency_target=None, throttle_seconds=10,
+                 max_waiting=None, register=True):
+        self.name = name
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self.throttle_seconds = throttle_seconds
+        self.concurrency = AdaptiveConcurrency(min_concurrency, max_concurrency, latency_target, max_waiting)
+        if register:
+            governors[name] = self
+
+    def snapshot(self):
+        return {
+            "rate": self.rate,
+            "limit": round(self.concurrency.limit, 2),
+            "in_flight": self.concurrency.in_flight,
+            "waiting": self.concurrency.waiting
+        }
+
+    def _take_token_now(self):
+        db = SessionLocal()
+        try:
+            return take_token(db, self.name, self.rate, self.burst, datetime.datetime.utcnow())
+        finally:
+            db.close()
+
+    async def _take_token(self):
+        # The bucket is read and written on a thread, off the event loop
+        while True:
+            wait = await asyncio.to_thread(self._take_token_now)
+            if wait == 0:
+                return
+            if wait is None:
+                # Another process took a token first; the next one is about
+                # 1/rate away, and the jitter spreads out the processes racing for it
+                wait = random.uniform(0, 1 / self.rate)
+            await asyncio.sleep(wait)
+
+    def _drain_now(self, seconds):
+        db = SessionLocal()
+        try:
+            drain_bucket(db, self.name, self.rate, seconds, datetime.datetime.utcnow())
+        finally:
+            db.close()
+
+    async def _drain(self, seconds):
+        await asyncio.to_thread(self._drain_now, seconds)
+
+    def _timed_out(self, timeout):
+        metrics.increment(f'governor.{self.name}.timed_out')
+        return DeadlineExceededError(self.name, timeout)
+
+    @asynccontextmanager
+    async def acquire(self, timeout=None):
+        """
+        Wait up to `timeout` seconds (None for no limit) for capacity to make
+        one call, raising DeadlineExceededError after that. Exceptions with a
+        429 status, and calls whose permit is marked throttled, count as
+        throttling.
+        """
+        waited_from = time.monotonic()
+        try:
+            admitted = await self.concurrency.acquire(timeout)
+        except asyncio.TimeoutError:
+            raise self._timed_out(timeout)
+        if not admitted:
+            metrics.increment(f'governor.{self.name}.rejected')
+            raise ProviderBusyError(self.name)
+        try:
+            if self.rate > 0:
+                remaining = None if timeout is None else max(timeout - (time.monotonic() - waited_from), 0.001)
+                try:
+                    await asyncio.wait_for(self._take_token(), remaining)
+                except asyncio.TimeoutError:
+                    raise self._timed_out(timeout)
+            metrics.observe(f'governor.{self.name}.wait', time.monotonic() - waited_from)
+
+            permit = Permit()
+            started_at = time.monotonic()
+            try:
+                yield permit
+            except BaseException as e:
+                if getattr(e, 'status_code', None) == 429:
+                    permit.throttle(retry_after_seconds(e))
+                else:
+                    permit.failed = True
+                raise
+            finally:
+                if permit.throttled:
+                    metrics.increment(f'governor.{self.name}.throttled')
+                    self.concurrency.on_overload()
+                    if self.rate > 0:
+                        logging.warning(f"Provider {self.name} throttled, pausing all workers")
+                        await self._drain(permit.retry_after or self.throttle_seconds)
+                elif not permit.failed:
+                    self.concurrency.on_success(time.monotonic() - started_at)
+        finally:
+            await self.concurrency.release()
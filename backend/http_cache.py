@@ -0,0 +1,55 @@
+# backend/http_cache.py
+import datetime
+import hashlib
+import json
+import os
+from email.utils import format_datetime, parsedate_to_datetime
+from dotenv import load_dotenv
+from fastapi import Request, Response, status
+
+load_dotenv()
+
+# The public feed grows as speeches are generated, so clients revalidate it often;
+# a single speech never changes once written
+PUBLIC_LIST_MAX_AGE = int(os.getenv('PUBLIC_LIST_MAX_AGE', '10'))
+PUBLIC_SPEECH_MAX_AGE = int(os.getenv('PUBLIC_SPEECH_MAX_AGE', '86400'))
+
+def make_etag(*parts):
+    """Strong ETag over the given JSON-serializable validator parts."""
+    digest = hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+    return f'"{digest[:32]}"'
+
+def http_date(dt):
+    # Timestamps are stored as naive UTC
+    return format_datetime(dt.replace(tzinfo=datetime.timezone.utc, microsecond=0), usegmt=True)
+
+def cache_headers(etag, last_modified=None, max_age=0):
+    headers = {"ETag": etag, "Cache-Control": f"public, max-age={max_age}"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+    return headers
+
+def is_not_modified(request: Request, etag, last_modified=None):
+    """
+    Evaluate If-None-Match, or If-Modified-Since when no If-None-Match was
+    sent (RFC 9110 section 13.2.2).
+    """
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match is not None:
+        # If-None-Match uses the weak comparison, so a W/ prefix is ignored
+        candidates = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in candidates or etag in candidates
+
+    if_modified_since = request.headers.get('if-modified-since')
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=datetime.timezone.utc)
+    return last_modified.replace(tzinfo=datetime.timezone.utc, microsecond=0) <= since
+
+def not_modified(headers):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
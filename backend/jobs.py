@@ -0,0 +1,205 @@
+# backend/jobs.py
+import asyncio
+import datetime
+import logging
+import os
+import uuid
+from dotenv import load_dotenv
+from database import SessionLocal
+from models import SpeechJob
+from metrics import metrics
+
+load_dotenv()
+
+SPEECH_JOB_WORKERS = int(os.getenv('SPEECH_JOB_WORKERS', '4'))
+SPEECH_JOB_POLL_SECONDS = float(os.getenv('SPEECH_JOB_POLL_SECONDS', '1'))
+# A running job older than this is assumed lost with its worker and is requeued
+SPEECH_JOB_TIMEOUT_SECONDS = int(os.getenv('SPEECH_JOB_TIMEOUT_SECONDS', '600'))
+SPEECH_JOB_MAX_ATTEMPTS = int(os.getenv('SPEECH_JOB_MAX_ATTEMPTS', '3'))
+# How often each process looks for stale running jobs
+SPEECH_JOB_SWEEP_SECONDS = float(os.getenv('SPEECH_JOB_SWEEP_SECONDS', '60'))
+# A job that failed transiently is retried after this, doubling with each attempt
+SPEECH_JOB_RETRY_BACKOFF_SECONDS = float(os.getenv('SPEECH_JOB_RETRY_BACKOFF_SECONDS', '5'))
+
+class RetryJobLater(Exception):
+    def __init__(self, delay_seconds):
+        super().__init__(f"Retry in {delay_seconds}s")
+        self.delay_seconds = delay_seconds
+
+def enqueue_job(db, kind, user_id, request_payload):
+    job = SpeechJob(
+        id=uuid.uuid4().hex,
+        kind=kind,
+        user_id=user_id,
+        status='queued',
+        request_payload=request_payload
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    metrics.increment('jobs.enqueued')
+    return job
+
+def retry_delay(attempts):
+    """Seconds to wait before running a job again after its `attempts`-th attempt failed."""
+    return SPEECH_JOB_RETRY_BACKOFF_SECONDS * 2 ** max(attempts - 1, 0)
+
+def requeue_stale_jobs(db, now):
+    """
+    Requeue running jobs whose worker appears to have died, or fail them once
+    they have used up their attempts. Only writes if there are any.
+    """
+    cutoff = now - datetime.timedelta(seconds=SPEECH_JOB_TIMEOUT_SECONDS)
+    stale = db.query(SpeechJob).filter(SpeechJob.status == 'running', SpeechJob.started_at < cutoff)
+    if stale.first() is None:
+        db.rollback()
+        return
+    failed = stale.filter(SpeechJob.attempts >= SPEECH_JOB_MAX_ATTEMPTS).update(
+        {SpeechJob.status: 'failed', SpeechJob.error: "Timed out", SpeechJob.finished_at: now},
+        synchronize_session=False
+    )
+    requeued = stale.filter(SpeechJob.attempts < SPEECH_JOB_MAX_ATTEMPTS).update(
+        {SpeechJob.status: 'queued', SpeechJob.run_after: now},
+        synchronize_session=False
+    )
+    db.commit()
+    if failed or requeued:
+        logging.warning(f"Recovered stale speech jobs: {requeued} requeued, {failed} failed")
+
+def claim_next_job(db, now):
+    """
+    Mark the oldest runnable job as running and return it. The update is
+    conditional on the job still being queued, so concurrent workers in any
+    process never claim the same job.
+    """
+    job = (
+        db.query(SpeechJob)
+        .filter(SpeechJob.status == 'queued', SpeechJob.run_after <= now)
+        .order_by(SpeechJob.run_after)
+        .first()
+    )
+    if job is None:
+        # Nothing to claim, so nothing to write
+        db.rollback()
+        return None
+    claimed = (
+        db.query(SpeechJob)
+        .filter(SpeechJob.id == job.id, SpeechJob.status == 'queued')
+        .update(
+            {SpeechJob.status: 'running', SpeechJob.started_at: now, SpeechJob.attempts: SpeechJob.attempts + 1},
+            synchronize_session=False
+        )
+    )
+    db.commit()
+    if not claimed:
+        return None
+    db.refresh(job)
+    return job
+
+class JobWorkerPool:
+    """
+    Background workers that drain the speech_jobs table. `handler(job, db)`
+    runs the job and returns the id of the GeneratedSpeech it produced.
+    Exceptions of the types in `retry_on` are transient: the job is retried
+    with exponential backoff until it has had SPEECH_JOB_MAX_ATTEMPTS.
+    """
+
+    def __init__(self, handler, workers=SPEECH_JOB_WORKERS, poll_seconds=SPEECH_JOB_POLL_SECONDS,
+                 sweep_seconds=SPEECH_JOB_SWEEP_SECONDS, retry_on=()):
+        self.handler = handler
+        self.workers = workers
+        self.poll_seconds = poll_seconds
+        self.sweep_seconds = sweep_seconds
+        self.retry_on = retry_on
+        self._tasks = []
+        self._wakeup = None
+
+    def start(self):
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+        if self._tasks:
+            # One sweeper per process is enough to recover jobs lost with a worker
+            self._tasks.append(asyncio.create_task(self._sweep()))
+            logging.info(f"Started {self.workers} speech job workers")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake the workers without waiting for the next poll, e.g. right after enqueueing."""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            try:
+                ran = await self._run_one()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logging.error(f"Speech job worker error: {e}")
+                ran = False
+            if not ran:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+                self._wakeup.clear()
+
+    async def _sweep(self):
+        while True:
+            db = SessionLocal()
+            try:
+                requeue_stale_jobs(db, datetime.datetime.utcnow())
+            except Exception as e:
+                logging.error(f"Speech job sweep error: {e}")
+            finally:
+                db.close()
+            await asyncio.sleep(self.sweep_seconds)
+
+    async def _run_one(self):
+        db = SessionLocal()
+        try:
+            job = claim_next_job(db, datetime.datetime.utcnow())
+            if job is None:
+                return False
+            metrics.observe('jobs.queue_wait', (job.started_at - job.created_at).total_seconds())
+
+            try:
+                job.generated_speech_id = await self.handler(job, db)
+                job.status = 'succeeded'
+                job.error = None
+            except RetryJobLater as e:
+                job.status = 'queued'
+                job.run_after = datetime.datetime.utcnow() + datetime.timedelta(seconds=e.delay_seconds)
+                # A back-pressure retry shouldn't use up the job's attempts
+                job.attempts -= 1
+                metrics.increment('jobs.deferred')
+            except self.retry_on as e:
+                db.rollback()
+                if job.attempts < SPEECH_JOB_MAX_ATTEMPTS:
+                    job.status = 'queued'
+                    job.run_after = datetime.datetime.utcnow() + datetime.timedelta(seconds=retry_delay(job.attempts))
+                    metrics.increment('jobs.retried')
+                    logging.warning(f"Speech job {job.id} failed on attempt {job.attempts}, retrying: {e}")
+                else:
+                    job.status = 'failed'
+                    job.error = getattr(e, 'detail', None) or "Internal Server Error"
+                    logging.error(f"Speech job {job.id} failed after {job.attempts} attempts: {e}")
+            except Exception as e:
+                db.rollback()
+                job.status = 'failed'
+                job.error = getattr(e, 'detail', None) or "Internal Server Error"
+                logging.error(f"Speech job {job.id} failed: {e}")
+
+            if job.status != 'queued':
+                job.finished_at = datetime.datetime.utcnow()
+                metrics.increment(f'jobs.{job.status}')
+                metrics.observe('jobs.run', (job.finished_at - job.started_at).total_seconds())
+            db.commit()
+            return True
+        finally:
+            db.close()
@@ -0,0 +1,252 @@
+# backend/llm_utils.py
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from dotenv import load_dotenv
+from openai import AsyncAzureOpenAI
+from metrics import metrics
+from governor import ProviderBusyError, ProviderGovernor
+from resilience import CircuitBreaker, with_deadline
+from providers import FakeChatClient
+
+load_dotenv()
+
+AZURE_OPENAI_API_VERSION = "2024-02-15-preview"
+# 'azure' for Azure OpenAI, 'fake' for canned offline completions (see providers.py)
+LLM_BACKEND = os.getenv('LLM_BACKEND', 'azure')
+
+SPEECH_TEXT_CACHE_TTL_SECONDS = int(os.getenv('SPEECH_TEXT_CACHE_TTL_SECONDS', '21600'))
+SPEECH_TEXT_CACHE_MAX_ENTRIES = int(os.getenv('SPEECH_TEXT_CACHE_MAX_ENTRIES', '1024'))
+# Callers allowed to reuse a cached text: 'public', 'personal' and/or 'scheduled'
+SPEECH_TEXT_CACHE_SCOPES = {scope.strip() for scope in os.getenv('SPEECH_TEXT_CACHE_SCOPES', 'public').split(',') if scope.strip()}
+
+# Completions per second for the deployment across every process (0 disables the
+# shared limit), and the range this process's adaptive concurrency moves in
+LLM_REQUESTS_PER_SECOND = float(os.getenv('LLM_REQUESTS_PER_SECOND', '0'))
+LLM_BURST = int(os.getenv('LLM_BURST', '10'))
+LLM_MIN_CONCURRENCY = int(os.getenv('LLM_MIN_CONCURRENCY', '1'))
+LLM_MAX_CONCURRENCY = int(os.getenv('LLM_MAX_CONCURRENCY', '32'))
+# Completions that may wait for the governor; beyond that callers are told to retry
+LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '32'))
+LLM_RETRY_AFTER_SECONDS = int(os.getenv('LLM_RETRY_AFTER_SECONDS', '5'))
+# Completions slower than this count as overload and halve the concurrency (0 disables)
+LLM_LATENCY_TARGET_SECONDS = float(os.getenv('LLM_LATENCY_TARGET_SECONDS', '30'))
+
+# Longest wait for a completion, counting the wait for the governor, or for
+# the next chunk of a streamed one
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', '60'))
+
+llm_breaker = CircuitBreaker('llm')
+
+llm_governor = ProviderGovernor(
+    f"openai:{os.getenv('AZURE_OPENAI_DEPLOYMENT')}",
+    rate=LLM_REQUESTS_PER_SECOND,
+    burst=LLM_BURST,
+    min_concurrency=LLM_MIN_CONCURRENCY,
+    max_concurrency=LLM_MAX_CONCURRENCY,
+    latency_target=LLM_LATENCY_TARGET_SECONDS,
+    max_waiting=LLM_MAX_QUEUE
+)
+
+class LLMQueueFullError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Speech text queue is full")
+        self.retry_after = retry_after
+
+def deadline_left(started_at):
+    """What is left of LLM_DEADLINE_SECONDS since `started_at`, or None if there is no deadline."""
+    if not LLM_DEADLINE_SECONDS:
+        return None
+    return max(LLM_DEADLINE_SECONDS - (time.monotonic() - started_at), 0.001)
+
+# One client per event loop, so HTTP connections are reused across requests
+# without being shared between loops
+_clients = weakref.WeakKeyDictionary()
+
+def get_openai_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        if LLM_BACKEND == 'fake':
+            client = FakeChatClient()
+        else:
+            client = AsyncAzureOpenAI(
+                api_key=os.getenv("AZURE_OPENAI_API_KEY"),
+                api_version=AZURE_OPENAI_API_VERSION,
+                azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
+            )
+        _clients[loop] = client
+    return client
+
+def generate_prompt(user, preferences):
+    system_prompt = f"You are speaking to {user.first_name}"
+    if user.user_profile:
+        system_prompt += f", whose motivational profile is:\n{user.user_profile}\n"
+    system_prompt += f"\nYou are a motivational coach with the following profile:\n{preferences.persona}:{preferences.tone}\n\nYou reply only in plain text.\nDon't use markdown."
+    prompt = f"\nPlease write a motivational speech for {user.first_name} in the {preferences.persona} style and focus on using the correct triggers from {user.first_name}'s profile to target the speech for just him/her."
+
+    return [
+                {"role": "system", "content": system_prompt},
+                {"role": "user", "content": prompt}
+            ]
+
+class SpeechTextCache:
+    """
+    Per-process LRU of generated speech texts with a TTL, keyed by a hash of
+    the deployment and the normalized prompt messages.
+    """
+
+    def __init__(self, ttl_seconds=SPEECH_TEXT_CACHE_TTL_SECONDS, max_entries=SPEECH_TEXT_CACHE_MAX_ENTRIES, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @staticmethod
+    def key_for(messages, deployment=None):
+        normalized = [{"role": m["role"], "content": " ".join(m["content"].split())} for m in messages]
+        payload = json.dumps({"deployment": deployment, "messages": normalized}, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            expires_at, text = entry
+            if expires_at <= self._clock():
+                del self._entries[key]
+                metrics.increment('llm.text_cache.expired')
+                return None
+            self._entries.move_to_end(key)
+            return text
+
+    def put(self, key, text):
+        with self._lock:
+            self._entries[key] = (self._clock() + self.ttl_seconds, text)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                metrics.increment('llm.text_cache.evicted')
+
+text_cache = SpeechTextCache()
+
+# Misses currently being generated, so identical concurrent requests share one completion
+_in_flight = {}
+
+async def _complete(messages):
+    started_at = time.monotonic()
+    try:
+        async with llm_governor.acquire(timeout=deadline_left(started_at)):
+            response = await llm_breaker.call(
+                lambda: get_openai_client().chat.completions.create(
+                    model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+                    messages=messages
+                ),
+                deadline=deadline_left(started_at)
+            )
+    except ProviderBusyError:
+        raise LLMQueueFullError(LLM_RETRY_AFTER_SECONDS)
+    return response.choices[0].message.content
+
+def cached_speech_text(messages, cache_scope=None):
+    """
+    The cached text for the prompt messages if `cache_scope` may reuse one,
+    else None. Lets callers skip streaming a text they already have.
+    """
+    if cache_scope not in SPEECH_TEXT_CACHE_SCOPES:
+        return None
+    speech_text = text_cache.get(SpeechTextCache.key_for(messages, os.getenv("AZURE_OPENAI_DEPLOYMENT")))
+    if speech_text is not None:
+        metrics.increment('llm.text_cache.hit')
+    return speech_text
+
+async def generate_speech_text(messages, cache_scope=None):
+    """
+    Generate a speech text for the prompt messages. When `cache_scope` is in
+    SPEECH_TEXT_CACHE_SCOPES a previously generated text for the same prompt
+    may be returned instead of calling the model.
+    """
+    if cache_scope not in SPEECH_TEXT_CACHE_SCOPES:
+        return await _complete(messages)
+
+    key = SpeechTextCache.key_for(messages, os.getenv("AZURE_OPENAI_DEPLOYMENT"))
+    speech_text = text_cache.get(key)
+    if speech_text is not None:
+        metrics.increment('llm.text_cache.hit')
+        return speech_text
+    metrics.increment('llm.text_cache.miss')
+
+    task = _in_flight.get(key)
+    if task is None or task.get_loop() is not asyncio.get_running_loop():
+        task = asyncio.ensure_future(_complete(messages))
+        _in_flight[key] = task
+        task.add_done_callback(lambda t: _in_flight.pop(key, None) if _in_flight.get(key) is t else None)
+    speech_text = await asyncio.shield(task)
+    text_cache.put(key, speech_text)
+    return speech_text
+
+async def stream_speech_text(messages, cache_scope=None):
+    """
+    Yield the speech text in pieces as the model produces them. A cached text
+    for an allowed `cache_scope` is yielded whole, and a completed stream is
+    added to the cache.
+    """
+    use_cache = cache_scope in SPEECH_TEXT_CACHE_SCOPES
+    if use_cache:
+        speech_text = cached_speech_text(messages, cache_scope)
+        if speech_text is not None:
+            yield speech_text
+            return
+        metrics.increment('llm.text_cache.miss')
+        key = SpeechTextCache.key_for(messages, os.getenv("AZURE_OPENAI_DEPLOYMENT"))
+
+    parts = []
+    started_at = time.monotonic()
+    try:
+        async with llm_governor.acquire(timeout=deadline_left(started_at)):
+            llm_breaker.before_call()
+            try:
+                stream = await with_deadline(
+                    get_openai_client().chat.completions.create(
+                        model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
+                        messages=messages,
+                        stream=True
+                    ),
+                    # What is left after waiting for the governor
+                    deadline_left(started_at), 'llm'
+                )
+                chunks = stream.__aiter__()
+                while True:
+                    try:
+                        chunk = await with_deadline(chunks.__anext__(), LLM_DEADLINE_SECONDS, 'llm')
+                    except StopAsyncIteration:
+                        break
+                    # Azure sends a first chunk with no choices, carrying only content filter results
+                    if not chunk.choices:
+                        continue
+                    delta = chunk.choices[0].delta.content
+                    if delta:
+                        parts.append(delta)
+                        yield delta
+            except (GeneratorExit, asyncio.CancelledError):
+                # The caller stopped reading or was cancelled; that says nothing about the service
+                llm_breaker.cancel_call()
+                raise
+            except BaseException:
+                llm_breaker.record(False)
+                raise
+            llm_breaker.record(True)
+    except ProviderBusyError:
+        raise LLMQueueFullError(LLM_RETRY_AFTER_SECONDS)
+    if use_cache:
+        text_cache.put(key, "".join(parts))
@@ -1,7 +1,7 @@
 # backend/main.py
-from fastapi import FastAPI, Depends, HTTPException, status, Request, Path
-from fastapi.responses import JSONResponse
-from typing import Optional, List
+from fastapi import FastAPI, Depends, HTTPException, status, Request, Response, Path, Query
+from typing import Optional, List, Literal
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from dotenv import load_dotenv
 import os
@@ -9,9 +9,12 @@ import logging
 from logging.handlers import RotatingFileHandler
 import datetime
 import asyncio
+import json
 import re
+import time
+from contextlib import asynccontextmanager
 
-from models import User, Preference, Schedule, GeneratedSpeech
+from models import User, Preference, Schedule, GeneratedSpeech, SpeechJob
 from schemas import (
     PreferenceCreate,
     ScheduleCreate,
@@ -22,20 +25,34 @@ from schemas import (
     GeneratedSpeechSchema,
     UserSchema,
     SpeechRequest,
-    ScheduleSchema
+    ScheduleSchema,
+    SpeechJobSchema
 )
 from database import SessionLocal, engine, Base, get_db
 from auth import router as auth_router
-from utils import verify_token, create_access_token
-from azure_storage import upload_file_to_blob
+from utils import verify_token, create_access_token, principal_cache, parse_include, build_user_response, RECENT_SPEECHES_LIMIT
+from azure_storage import upload_bytes_to_blob, blob_url, run_upload
 from email_utils import send_email
+from outbox import cancel_scheduled_emails
+from schedule_utils import DAYS_OF_WEEK, compute_next_fire_at, refresh_next_fire_at
+from jobs import JobWorkerPool, RetryJobLater, enqueue_job
+from http_cache import PUBLIC_LIST_MAX_AGE, PUBLIC_SPEECH_MAX_AGE, make_etag, cache_headers, is_not_modified, not_modified
+from pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE, SPEECH_PREVIEW_LENGTH, InvalidCursorError, paginate_newest_first
 
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse, RedirectResponse
 
 # Azure OpenAI and Speech imports
-from azure.cognitiveservices.speech import SpeechConfig, SpeechSynthesizer, ResultReason, SpeechSynthesisOutputFormat
-from azure.cognitiveservices.speech.audio import AudioOutputConfig
-from openai import AzureOpenAI
+import openai
+from azure.cognitiveservices.speech import ResultReason
+from llm_utils import generate_prompt, generate_speech_text, stream_speech_text, cached_speech_text, text_cache, SPEECH_TEXT_CACHE_SCOPES, LLMQueueFullError
+from tts_utils import tts_executor, TTSQueueFullError, SpeechSynthesisFailedError, DEFAULT_OUTPUT_FORMAT, TTS_PIPELINE_ENABLED, SpeechPipeline
+from audio_cache import audio_cache_key, audio_blob_name, lookup_audio, record_audio
+from metrics import metrics
+from encoding import CompressionMiddleware, FastJSONResponse
+from governor import governors
+from resilience import breakers, CircuitOpenError, DeadlineExceededError
+from providers import FakeProviderError
 
 from typing import List  # Added for typing List
 
@@ -49,7 +66,17 @@ logging.basicConfig(handlers=[handler], level=logging.INFO, format='%(asctime)s
 
 Base.metadata.create_all(bind=engine)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Background workers for asynchronous speech jobs
+    job_pool.start()
+    yield
+    await job_pool.stop()
+    # Let streamed speeches whose client went away finish storing their clip
+    if stream_tasks:
+        await asyncio.gather(*stream_tasks, return_exceptions=True)
+
+app = FastAPI(lifespan=lifespan)
 
 ALLOWED_ORIGINS = os.getenv('ALLOWED_ORIGINS', '').split(',')
 
@@ -59,25 +86,37 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Speech-Url"],
 )
+app.add_middleware(CompressionMiddleware)
 
 app.include_router(auth_router)
 
-# Environment variables
-AZURE_SPEECH_SUBSCRIPTION_KEY = os.getenv('AZURE_SPEECH_SUBSCRIPTION_KEY')
-AZURE_SPEECH_REGION = os.getenv('AZURE_SPEECH_REGION')
-
-def get_current_user(request: Request, db: Session = Depends(get_db)):
-    if request.method == "OPTIONS":
-        # Skip authentication for preflight requests
-        return None
-    token = request.cookies.get('access_token')
-    if not token:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
-    user = verify_token(token, db)
-    if not user:
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
-    return user
+def current_user_loader(*options, fresh=False):
+    """
+    Build a dependency that authenticates the request and loads the user with
+    the given loader options, so each endpoint eager-loads only the
+    relationships it returns. With `fresh` the principal cache is bypassed.
+    """
+    def get_user(request: Request, db: Session = Depends(get_db)):
+        if request.method == "OPTIONS":
+            # Skip authentication for preflight requests
+            return None
+        token = request.cookies.get('access_token')
+        if not token:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Not authenticated")
+        user = verify_token(token, db, options, fresh=fresh)
+        if not user:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token")
+        return user
+    return get_user
+
+# Just the user's own columns, for endpoints that only need the principal
+get_current_user = current_user_loader()
+
+# The user as currently stored, for endpoints that update it or compute from
+# its columns; a cached copy may predate another worker's update
+get_current_user_for_update = current_user_loader(fresh=True)
 
 def sanitize_filename(filename: str, max_length: int = 32) -> str:
     # Remove invalid characters
@@ -85,17 +124,37 @@ def sanitize_filename(filename: str, max_length: int = 32) -> str:
     # Truncate to max_length
     return filename[:max_length]
 
-@app.patch("/preferences/", response_model=UserSchema)
-def update_preferences(preferences: PreferencesUpdate, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+@app.patch("/preferences/", response_model=UserSchema, response_model_exclude_unset=True)
+def update_preferences(
+    preferences: PreferencesUpdate,
+    include: Optional[str] = Query(None, description="Comma-separated relationships to expand: preferences, schedules, generated_speeches"),
+    speeches_limit: int = Query(RECENT_SPEECHES_LIMIT, ge=0, le=MAX_PAGE_SIZE),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user_for_update)
+):
+    try:
+        include = parse_include(include)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
     try:
         # Update user info
+        timezone_changed = user.timezone != preferences.timezone
+        prompt_changed = (user.first_name, user.user_profile) != (preferences.first_name, preferences.user_profile)
         user.first_name = preferences.first_name
         user.user_profile = preferences.user_profile
         user.timezone = preferences.timezone
 
+        # Schedules fire in the user's local time, so move them with the timezone
+        if timezone_changed:
+            schedules = db.query(Schedule).filter(Schedule.user_id == user.id).all()
+            refresh_next_fire_at(schedules, user.timezone)
+
         # Update or create preferences
         db_pref = db.query(Preference).filter(Preference.user_id == user.id).first()
         if db_pref:
+            prompt_changed = prompt_changed or (db_pref.persona, db_pref.tone, getattr(db_pref.voice, 'value', db_pref.voice)) != (
+                preferences.persona, preferences.tone, preferences.voice
+            )
             db_pref.persona = preferences.persona
             db_pref.tone = preferences.tone
             db_pref.voice = preferences.voice
@@ -103,9 +162,14 @@ def update_preferences(preferences: PreferencesUpdate, db: Session = Depends(get
             db_pref = Preference(user_id=user.id, persona=preferences.persona, tone=preferences.tone, voice=preferences.voice)
             db.add(db_pref)
 
+        # Scheduled speeches generated ahead of time with the old settings are not
+        # sent; they are generated again
+        if prompt_changed or timezone_changed:
+            cancel_scheduled_emails(db, user.id)
+
         db.commit()
-        db.refresh(user)
-        return user
+        principal_cache.invalidate(user.id)
+        return build_user_response(db, user, include, speeches_limit)
     except Exception as e:
         logging.error(f"Error updating preferences: {e}")
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Internal Server Error")
@@ -119,148 +183,475 @@ def get_voices():
         'Michelle', 'Monica', 'Roger', 'Steffan'
     ]
     
-    return JSONResponse(content={"voices": voices})
+    return FastJSONResponse(content={"voices": voices})
 
-@app.post("/generate_speech", response_model=GeneratedSpeechSchema)
-async def generate_speech_endpoint(speech_request: SpeechRequest, db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+@app.get("/metrics/")
+def get_metrics():
+    """
+    In-process counters and timings for the worker that serves the request.
+    """
+    snapshot = metrics.snapshot()
+    snapshot["tts"] = {"workers": tts_executor.workers, "max_queue": tts_executor.max_queue, "pending": tts_executor.pending}
+    snapshot["text_cache"] = {"entries": len(text_cache), "max_entries": text_cache.max_entries, "scopes": sorted(SPEECH_TEXT_CACHE_SCOPES)}
+    snapshot["governors"] = {name: governor.snapshot() for name, governor in governors.items()}
+    snapshot["breakers"] = {name: breaker.snapshot() for name, breaker in breakers.items()}
+    return FastJSONResponse(content=snapshot)
+
+async def create_generated_speech(speech_request: SpeechRequest, user_id: Optional[int], db: Session) -> GeneratedSpeech:
+    """
+    Generate the text, synthesize it, upload the clip and store the row.
+    Shared by the speech endpoints and the background job workers.
+    """
+    # Generate speech text with Azure OpenAI without blocking the event loop.
+    # SpeechRequest carries both the user and the preference fields of the prompt.
+    cache_scope = 'public' if user_id is None else 'personal'
+    messages = generate_prompt(speech_request, speech_request)
+    if not TTS_PIPELINE_ENABLED:
+        speech_text = await generate_speech_text(messages, cache_scope=cache_scope)
+        return await store_generated_speech(speech_text, speech_request, user_id, db)
+
+    # A cached text is synthesized whole, or its clip reused, without a pipeline
+    speech_text = cached_speech_text(messages, cache_scope)
+    if speech_text is not None:
+        return await store_generated_speech(speech_text, speech_request, user_id, db)
+
+    # Synthesize each sentence while the rest of the text is being generated
+    pipeline = SpeechPipeline(speech_request.voice)
     try:
-        # Generate speech text
-        system_prompt = f"You are speaking to {speech_request.first_name}"
-        if speech_request.user_profile:
-            system_prompt += f", whose motivational profile is:\n{speech_request.user_profile}\n"
-        system_prompt += f"\nYou are a motivational coach with the following profile:\n{speech_request.persona}:{speech_request.tone}\n\nYou reply only in plain text.\nDon't use markdown."
-        prompt = f"\nPlease write a motivational speech for {speech_request.first_name} in the {speech_request.persona} style and focus on using the correct triggers from {speech_request.first_name}'s profile to target the speech for just him/her."
-
-        # Use Azure OpenAI to generate speech text
-        client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version="2024-02-15-preview",
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
-        
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        speech_text = response.choices[0].message.content
-
-        # Convert text to speech using Azure TTS
-        speech_config = SpeechConfig(subscription=AZURE_SPEECH_SUBSCRIPTION_KEY, region=AZURE_SPEECH_REGION)
-        speech_config.set_speech_synthesis_output_format(SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3)
-        speech_config.speech_synthesis_voice_name = f"en-US-{speech_request.voice}Neural"
-        timestamp = datetime.datetime.now().isoformat().replace(":", "-")
-        filename = f"speech_{sanitize_filename(speech_request.first_name)}_{timestamp}.mp3"
-        audio_config = AudioOutputConfig(filename=filename)
-        synthesizer = SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-        result = synthesizer.speak_text_async(speech_text).get()
-        if result.reason != ResultReason.SynthesizingAudioCompleted:
-            logging.error(f"Speech synthesis failed")
+        async for delta in stream_speech_text(messages, cache_scope=cache_scope):
+            pipeline.feed(delta)
+    except BaseException:
+        pipeline.cancel()
+        raise
+    return await store_generated_speech(pipeline.text, speech_request, user_id, db, pipeline)
+
+async def store_generated_speech(
+    speech_text: str,
+    speech_request: SpeechRequest,
+    user_id: Optional[int],
+    db: Session,
+    pipeline: Optional[SpeechPipeline] = None
+) -> GeneratedSpeech:
+    """
+    Synthesize an already generated text, upload the clip and store the row.
+    With a `pipeline` the text has already been fed to it as it was generated.
+    """
+    # Reuse the clip if this text was already synthesized with the same voice
+    cache_key = audio_cache_key(speech_text, speech_request.voice, DEFAULT_OUTPUT_FORMAT)
+    url = lookup_audio(db, cache_key)
+    if url is not None and pipeline is not None:
+        pipeline.cancel()
+    elif url is None:
+        if pipeline is not None:
+            audio_data = await pipeline.finish()
+        else:
+            # Convert text to speech using Azure TTS on the TTS worker pool
+            result = await tts_executor.synthesize(speech_text, speech_request.voice)
+            audio_data = result.audio_data if result.reason == ResultReason.SynthesizingAudioCompleted else None
+        if audio_data is None:
+            logging.error(f"Speech synthesis failed for clip {cache_key}")
             raise HTTPException(status_code=500, detail="Speech synthesis failed")
 
-        # Upload file to Azure Blob Storage
-        blob_name = filename
-        url = upload_file_to_blob(filename, blob_name)
+        # Upload the in-memory clip to Azure Blob Storage
+        url = await run_upload(upload_bytes_to_blob, audio_data, audio_blob_name(cache_key))
         if not url:
             raise HTTPException(status_code=500, detail="Failed to upload speech to storage")
-
-        # Save to generated_speeches table
-        generated_speech = GeneratedSpeech(
-            user_id=user.id,
-            speech_text=speech_text,
-            speech_url=url
+        record_audio(db, cache_key, url)
+
+    # Save to generated_speeches table; public speeches have user_id = None
+    generated_speech = GeneratedSpeech(
+        user_id=user_id,
+        speech_text=speech_text,
+        speech_url=url
+    )
+    db.add(generated_speech)
+    db.commit()
+    db.refresh(generated_speech)
+    return generated_speech
+
+def busy_error(e) -> HTTPException:
+    """503 for a request turned away because the TTS or LLM queue is full."""
+    logging.warning(f"Rejected speech request: {e}")
+    return HTTPException(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        detail="Speech synthesis is busy, please try again shortly",
+        headers={"Retry-After": str(e.retry_after)}
+    )
+
+def upstream_error(e: Exception) -> HTTPException:
+    """503 for a dependency whose circuit is open, 504 for one that missed its deadline."""
+    logging.warning(f"Upstream failure: {e}")
+    if isinstance(e, CircuitOpenError):
+        return HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="A speech service is temporarily unavailable, please try again shortly",
+            headers={"Retry-After": str(e.retry_after)}
         )
-        db.add(generated_speech)
-        db.commit()
-        db.refresh(generated_speech)
+    return HTTPException(status_code=status.HTTP_504_GATEWAY_TIMEOUT, detail="A speech service did not respond in time")
+
+def job_to_schema(job: SpeechJob) -> SpeechJobSchema:
+    return SpeechJobSchema(
+        id=job.id,
+        status=job.status,
+        created_at=job.created_at,
+        started_at=job.started_at,
+        finished_at=job.finished_at,
+        queue_seconds=(job.started_at - job.created_at).total_seconds() if job.started_at else None,
+        run_seconds=(job.finished_at - job.started_at).total_seconds() if job.finished_at and job.started_at else None,
+        error=job.error,
+        result=GeneratedSpeechSchema.model_validate(job.generated_speech) if job.generated_speech else None
+    )
+
+def accept_speech_job(db: Session, kind: str, user_id: Optional[int], speech_request: SpeechRequest) -> FastJSONResponse:
+    job = enqueue_job(db, kind, user_id, speech_request.model_dump_json())
+    job_pool.notify()
+    return FastJSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content=job_to_schema(job).model_dump(mode='json'),
+        headers={"Location": f"/jobs/{job.id}"}
+    )
+
+async def process_speech_job(job: SpeechJob, db: Session) -> int:
+    speech_request = SpeechRequest.model_validate_json(job.request_payload)
+    try:
+        generated_speech = await create_generated_speech(speech_request, job.user_id, db)
+    except (TTSQueueFullError, LLMQueueFullError, CircuitOpenError) as e:
+        raise RetryJobLater(e.retry_after)
+    return generated_speech.id
+
+# Provider errors worth another attempt later; anything else fails the job at once
+TRANSIENT_JOB_ERRORS = (
+    DeadlineExceededError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    FakeProviderError
+)
 
-        # Optionally, delete local file
-        os.remove(filename)
+job_pool = JobWorkerPool(process_speech_job, retry_on=TRANSIENT_JOB_ERRORS)
 
-        return generated_speech
+@app.post("/generate_speech", response_model=GeneratedSpeechSchema, responses={202: {"model": SpeechJobSchema}})
+async def generate_speech_endpoint(
+    speech_request: SpeechRequest,
+    async_mode: bool = Query(False, description="Return 202 with a job id instead of waiting for the speech"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    try:
+        if async_mode:
+            return accept_speech_job(db, 'personal', user.id, speech_request)
+        return await create_generated_speech(speech_request, user.id, db)
+    except (TTSQueueFullError, LLMQueueFullError) as e:
+        raise busy_error(e)
+    except (CircuitOpenError, DeadlineExceededError) as e:
+        raise upstream_error(e)
+    except HTTPException as he:
+        raise he
     except Exception as e:
         logging.error(f"Error generating speech: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.post("/generate_public_speech", response_model=GeneratedSpeechSchema)
-async def generate_public_speech_endpoint(speech_request: SpeechRequest, db: Session = Depends(get_db)):
+@app.post("/generate_public_speech", response_model=GeneratedSpeechSchema, responses={202: {"model": SpeechJobSchema}})
+async def generate_public_speech_endpoint(
+    speech_request: SpeechRequest,
+    async_mode: bool = Query(False, description="Return 202 with a job id instead of waiting for the speech"),
+    db: Session = Depends(get_db)
+):
     try:
-        # Generate speech text
-        system_prompt = f"You are speaking to {speech_request.first_name}"
-        if speech_request.user_profile:
-            system_prompt += f", whose motivational profile is:\n{speech_request.user_profile}\n"
-        system_prompt += f"\nYou are a motivational coach with the following profile:\n{speech_request.persona}:{speech_request.tone}\n\nYou reply only in plain text.\nDon't use markdown."
-        prompt = f"\nPlease write a motivational speech for {speech_request.first_name} in the {speech_request.persona} style and focus on using the correct triggers from {speech_request.first_name}'s profile to target the speech for just him/her."
-
-        # Use Azure OpenAI to generate speech text
-        client = AzureOpenAI(
-            api_key=os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version="2024-02-15-preview",
-            azure_endpoint=os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
-        
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
-        )
-        speech_text = response.choices[0].message.content
-
-        # Convert text to speech using Azure TTS
-        speech_config = SpeechConfig(subscription=AZURE_SPEECH_SUBSCRIPTION_KEY, region=AZURE_SPEECH_REGION)
-        speech_config.set_speech_synthesis_output_format(SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3)
-        speech_config.speech_synthesis_voice_name = f"en-US-{speech_request.voice}Neural"
-        timestamp = datetime.datetime.now().isoformat().replace(":", "-")
-        filename = f"speech_public_{sanitize_filename(speech_request.first_name)}_{timestamp}.mp3"
-        audio_config = AudioOutputConfig(filename=filename)
-        synthesizer = SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-        result = synthesizer.speak_text_async(speech_text).get()
-        if result.reason != ResultReason.SynthesizingAudioCompleted:
-            logging.error(f"Speech synthesis failed for public speech")
-            raise HTTPException(status_code=500, detail="Speech synthesis failed")
+        if async_mode:
+            return accept_speech_job(db, 'public', None, speech_request)
+        return await create_generated_speech(speech_request, None, db)
+    except (TTSQueueFullError, LLMQueueFullError) as e:
+        raise busy_error(e)
+    except (CircuitOpenError, DeadlineExceededError) as e:
+        raise upstream_error(e)
+    except HTTPException as he:
+        raise he
+    except Exception as e:
+        logging.error(f"Error generating public speech: {e}")
+        raise HTTPException(status_code=500, detail="Internal Server Error")
 
-        # Upload file to Azure Blob Storage
-        blob_name = filename
-        url = upload_file_to_blob(filename, blob_name)
-        if not url:
-            raise HTTPException(status_code=500, detail="Failed to upload speech to storage")
+# Streamed speeches still being synthesized or stored, kept referenced until done
+stream_tasks = set()
 
-        # Save to generated_speeches table with user_id = None
-        generated_speech = GeneratedSpeech(
-            user_id=None,
-            speech_text=speech_text,
-            speech_url=url
-        )
+def sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+async def produce_streamed_speech(speech_request: SpeechRequest, user_id: Optional[int], queue: asyncio.Queue):
+    """
+    Forward text deltas to `queue` as they arrive, then synthesize and store
+    the speech. Runs as its own task with its own session, so the clip is
+    still stored if the client disconnects mid-stream.
+    """
+    db = SessionLocal()
+    pipeline = None
+    try:
+        cache_scope = 'public' if user_id is None else 'personal'
+        messages = generate_prompt(speech_request, speech_request)
+        speech_text = cached_speech_text(messages, cache_scope)
+        if speech_text is not None:
+            # Sent as one delta, and never fed to a pipeline
+            queue.put_nowait(sse_event('delta', {"text": speech_text}))
+        else:
+            pipeline = SpeechPipeline(speech_request.voice) if TTS_PIPELINE_ENABLED else None
+            started_at = time.monotonic()
+            parts = []
+            async for delta in stream_speech_text(messages, cache_scope=cache_scope):
+                if not parts:
+                    metrics.observe('llm.time_to_first_token', time.monotonic() - started_at)
+                parts.append(delta)
+                if pipeline is not None:
+                    pipeline.feed(delta)
+                queue.put_nowait(sse_event('delta', {"text": delta}))
+            metrics.observe('llm.stream', time.monotonic() - started_at)
+            speech_text = "".join(parts)
+
+        generated_speech = await store_generated_speech(speech_text, speech_request, user_id, db, pipeline)
+        queue.put_nowait(sse_event('done', GeneratedSpeechSchema.model_validate(generated_speech).model_dump(mode='json')))
+    except (TTSQueueFullError, LLMQueueFullError) as e:
+        logging.warning(f"Rejected streamed speech: {e}")
+        queue.put_nowait(sse_event('error', {"detail": "Speech synthesis is busy, please try again shortly", "retry_after": e.retry_after}))
+    except (CircuitOpenError, DeadlineExceededError) as e:
+        he = upstream_error(e)
+        queue.put_nowait(sse_event('error', {"detail": he.detail, "retry_after": getattr(e, 'retry_after', None)}))
+    except HTTPException as he:
+        queue.put_nowait(sse_event('error', {"detail": he.detail}))
+    except Exception as e:
+        logging.error(f"Error streaming speech: {e}")
+        queue.put_nowait(sse_event('error', {"detail": "Internal Server Error"}))
+    finally:
+        if pipeline is not None:
+            pipeline.cancel()
+        db.close()
+        queue.put_nowait(None)
+
+@app.post("/generate_speech/stream", response_class=StreamingResponse)
+async def generate_speech_stream_endpoint(
+    speech_request: SpeechRequest,
+    user: User = Depends(get_current_user)
+):
+    """
+    Server-Sent Events: `delta` events carry the speech text as the model
+    writes it, then one `done` event carries the stored speech, or an `error`
+    event if it could not be produced.
+    """
+    queue = asyncio.Queue()
+    task = asyncio.create_task(produce_streamed_speech(speech_request, user.id, queue))
+    stream_tasks.add(task)
+    task.add_done_callback(stream_tasks.discard)
+
+    async def events():
+        while (event := await queue.get()) is not None:
+            yield event
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+async def produce_streamed_audio(speech_text: str, speech_request: SpeechRequest, user_id: int, cache_key: str, url: str, queue: asyncio.Queue):
+    """
+    Forward audio chunks to `queue` as they are synthesized, then upload the
+    clip and store the row in parallel. Runs as its own task, so the clip is
+    still stored if the client disconnects. A failure is put on the queue.
+    """
+    started_at = time.monotonic()
+    chunks = []
+    try:
+        async for data in tts_executor.stream(speech_text, speech_request.voice):
+            if not chunks:
+                metrics.observe('tts.time_to_first_audio', time.monotonic() - started_at)
+            chunks.append(data)
+            queue.put_nowait(data)
+    except Exception as e:
+        queue.put_nowait(e)
+        return
+    queue.put_nowait(None)
+
+    db = SessionLocal()
+    try:
+        upload = asyncio.create_task(run_upload(upload_bytes_to_blob, b"".join(chunks), audio_blob_name(cache_key)))
+        generated_speech = GeneratedSpeech(user_id=user_id, speech_text=speech_text, speech_url=url)
         db.add(generated_speech)
         db.commit()
-        db.refresh(generated_speech)
-
-        # Optionally, delete local file
-        os.remove(filename)
+        try:
+            uploaded_url = await upload
+        except (CircuitOpenError, DeadlineExceededError) as e:
+            logging.warning(f"Upload of streamed speech {generated_speech.id} failed: {e}")
+            uploaded_url = None
+        if uploaded_url:
+            record_audio(db, cache_key, uploaded_url)
+        else:
+            # Don't leave a speech pointing at a clip that was never stored
+            logging.error(f"Failed to upload streamed speech {generated_speech.id}")
+            db.delete(generated_speech)
+            db.commit()
+    except Exception as e:
+        logging.error(f"Error storing streamed speech: {e}")
+    finally:
+        db.close()
 
-        return generated_speech
+@app.post("/generate_speech/audio", response_class=StreamingResponse, responses={200: {"content": {"audio/mpeg": {}}}, 303: {"description": "The clip is already stored"}})
+async def generate_speech_audio_endpoint(
+    speech_request: SpeechRequest,
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
+    """
+    The speech as an MP3 streamed while it is synthesized, so playback can
+    start before the clip is complete. X-Speech-Url is where the clip is
+    stored once the stream ends. A clip that is already stored is redirected
+    to instead.
+    """
+    try:
+        speech_text = await generate_speech_text(generate_prompt(speech_request, speech_request), cache_scope='personal')
+        cache_key = audio_cache_key(speech_text, speech_request.voice, DEFAULT_OUTPUT_FORMAT)
+        url = lookup_audio(db, cache_key)
+        if url is not None:
+            db.add(GeneratedSpeech(user_id=user.id, speech_text=speech_text, speech_url=url))
+            db.commit()
+            return RedirectResponse(url, status_code=status.HTTP_303_SEE_OTHER, headers={"X-Speech-Url": url})
+
+        url = blob_url(audio_blob_name(cache_key))
+        queue = asyncio.Queue()
+        task = asyncio.create_task(produce_streamed_audio(speech_text, speech_request, user.id, cache_key, url, queue))
+        stream_tasks.add(task)
+        task.add_done_callback(stream_tasks.discard)
+        # Wait for the first chunk, so a synthesis that fails up front still gets an error status
+        first = await queue.get()
+        if isinstance(first, Exception):
+            raise first
+    except (TTSQueueFullError, LLMQueueFullError) as e:
+        raise busy_error(e)
+    except (CircuitOpenError, DeadlineExceededError) as e:
+        raise upstream_error(e)
+    except SpeechSynthesisFailedError:
+        logging.error("Speech synthesis failed for a streamed speech")
+        raise HTTPException(status_code=500, detail="Speech synthesis failed")
+    except HTTPException as he:
+        raise he
     except Exception as e:
-        logging.error(f"Error generating public speech: {e}")
+        logging.error(f"Error streaming speech audio: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.get("/public_speeches/", response_model=List[GeneratedSpeechSchema])
-def get_public_speeches(db: Session = Depends(get_db)):
+    async def audio():
+        data = first
+        while data is not None:
+            if isinstance(data, Exception):
+                # The status is already sent; end the stream early instead
+                logging.error(f"Speech synthesis failed mid-stream: {data}")
+                return
+            yield data
+            data = await queue.get()
+
+    return StreamingResponse(
+        audio(),
+        media_type="audio/mpeg",
+        headers={"X-Speech-Url": url, "Cache-Control": "no-store"}
+    )
+
+@app.get("/jobs/{job_id}", response_model=SpeechJobSchema)
+def get_job(
+    request: Request,
+    job_id: str = Path(..., description="The id returned when the job was accepted"),
+    db: Session = Depends(get_db)
+):
+    """
+    Status and timing of an asynchronous speech job, with the speech once it has succeeded.
+    Personal jobs are only visible to the user who submitted them.
+    """
+    job = db.query(SpeechJob).filter(SpeechJob.id == job_id).first()
+    if job and job.user_id is not None:
+        token = request.cookies.get('access_token')
+        user = verify_token(token, db) if token else None
+        if not user or user.id != job.user_id:
+            job = None
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found")
+    return job_to_schema(job)
+
+def speech_page(db: Session, user_id: Optional[int], limit: int, cursor: Optional[str], fields: str, response: Response, headers: Optional[dict] = None):
+    if fields == "summary":
+        # Only the listed columns and a prefix of the text leave the database
+        query = db.query(
+            GeneratedSpeech.id,
+            GeneratedSpeech.user_id,
+            GeneratedSpeech.speech_url,
+            func.substr(GeneratedSpeech.speech_text, 1, SPEECH_PREVIEW_LENGTH).label("speech_preview"),
+            GeneratedSpeech.created_at
+        )
+    else:
+        query = db.query(GeneratedSpeech)
+    query = query.filter(GeneratedSpeech.user_id == user_id)
+    try:
+        speeches, next_cursor = paginate_newest_first(query, GeneratedSpeech, limit, cursor)
+    except InvalidCursorError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+    # The body stays a plain list; the cursor for the next page travels in a header
+    headers = dict(headers or {})
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+    if fields == "summary":
+        # Plain rows go straight to JSON, without ORM entities or per-row validation
+        content = [
+            {
+                "id": row.id,
+                "user_id": row.user_id,
+                "speech_url": row.speech_url,
+                "speech_preview": row.speech_preview,
+                "created_at": row.created_at.isoformat() if row.created_at else None
+            }
+            for row in speeches
+        ]
+        return FastJSONResponse(content=content, headers=headers)
+    response.headers.update(headers)
+    return speeches
+
+SPEECH_LIST_RESPONSES = {200: {"description": "Full speeches, or GeneratedSpeechSummarySchema items with ?fields=summary"}}
+
+@app.get("/public_speeches/", response_model=List[GeneratedSpeechSchema], responses=SPEECH_LIST_RESPONSES)
+def get_public_speeches(
+    request: Request,
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    fields: Literal["full", "summary"] = Query("full"),
+    db: Session = Depends(get_db)
+):
     try:
-        speeches = db.query(GeneratedSpeech).filter(GeneratedSpeech.user_id == None).all()
-        return speeches
+        # Public speeches are append-only, so the newest id and the row count
+        # identify the feed's state; both come from the feed index alone
+        newest_id, total, last_modified = (
+            db.query(func.max(GeneratedSpeech.id), func.count(GeneratedSpeech.id), func.max(GeneratedSpeech.created_at))
+            .filter(GeneratedSpeech.user_id == None)
+            .one()
+        )
+        etag = make_etag("public_speeches", newest_id, total, limit, cursor, fields)
+        headers = cache_headers(etag, last_modified, PUBLIC_LIST_MAX_AGE)
+        if is_not_modified(request, etag, last_modified):
+            return not_modified(headers)
+        return speech_page(db, None, limit, cursor, fields, response, headers)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching public speeches: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
 
-@app.get("/my_speeches/", response_model=List[GeneratedSpeechSchema])
-def get_my_speeches(db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+@app.get("/my_speeches/", response_model=List[GeneratedSpeechSchema], responses=SPEECH_LIST_RESPONSES)
+def get_my_speeches(
+    response: Response,
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = Query(None),
+    fields: Literal["full", "summary"] = Query("full"),
+    db: Session = Depends(get_db),
+    user: User = Depends(get_current_user)
+):
     try:
-        speeches = db.query(GeneratedSpeech).filter(GeneratedSpeech.user_id == user.id).all()
-        return speeches
+        return speech_page(db, user.id, limit, cursor, fields, response)
+    except HTTPException:
+        raise
     except Exception as e:
         logging.error(f"Error fetching user speeches: {e}")
         raise HTTPException(status_code=500, detail="Internal Server Error")
@@ -268,6 +659,8 @@ def get_my_speeches(db: Session = Depends(get_db), user: User = Depends(get_curr
 
 @app.get("/public_speeches/{speech_id}/", response_model=GeneratedSpeechSchema)
 def get_public_speech(
+    request: Request,
+    response: Response,
     speech_id: int = Path(..., description="The ID of the public speech to retrieve"),
     db: Session = Depends(get_db)
 ):
@@ -275,9 +668,17 @@ def get_public_speech(
     Retrieve a single public speech by its ID.
     Public speeches have user_id set to None.
     """
+    # Speeches never change once written, so the id alone validates the cached copy
+    etag = make_etag("public_speech", speech_id)
+    if request.headers.get('if-none-match') or request.headers.get('if-modified-since'):
+        row = db.query(GeneratedSpeech.created_at).filter(GeneratedSpeech.id == speech_id, GeneratedSpeech.user_id == None).first()
+        if row and is_not_modified(request, etag, row.created_at):
+            return not_modified(cache_headers(etag, row.created_at, PUBLIC_SPEECH_MAX_AGE))
+
     speech = db.query(GeneratedSpeech).filter(GeneratedSpeech.id == speech_id, GeneratedSpeech.user_id == None).first()
     if not speech:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Public speech not found")
+    response.headers.update(cache_headers(etag, speech.created_at, PUBLIC_SPEECH_MAX_AGE))
     return speech
 
 @app.get("/my_speeches/{speech_id}/", response_model=GeneratedSpeechSchema)
@@ -297,16 +698,15 @@ def get_my_speech(
 # New Endpoints for Schedule Management
 
 @app.post("/schedule/", response_model=List[ScheduleSchema], status_code=status.HTTP_201_CREATED)
-def set_schedule(schedules: List[ScheduleCreate], db: Session = Depends(get_db), user: User = Depends(get_current_user)):
+def set_schedule(schedules: List[ScheduleCreate], db: Session = Depends(get_db), user: User = Depends(get_current_user_for_update)):
     """
     Create or update schedules for the authenticated user.
     This endpoint replaces existing schedules with the provided list.
     """
     try:
         # Validate day_of_week
-        valid_days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
         for s in schedules:
-            if s.day_of_week not in valid_days:
+            if s.day_of_week not in DAYS_OF_WEEK:
                 raise HTTPException(status_code=400, detail=f"Invalid day_of_week: {s.day_of_week}")
 
         # Ensure no duplicate days
@@ -322,7 +722,8 @@ def set_schedule(schedules: List[ScheduleCreate], db: Session = Depends(get_db),
             Schedule(
                 user_id=user.id,
                 day_of_week=s.day_of_week,
-                time_of_day=s.time_of_day
+                time_of_day=s.time_of_day,
+                next_fire_at=compute_next_fire_at(s.day_of_week, s.time_of_day, user.timezone)
             ) for s in schedules
         ]
         db.add_all(new_schedules)
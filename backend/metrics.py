@@ -0,0 +1,36 @@
+# backend/metrics.py
+import threading
+from collections import defaultdict
+
+class Metrics:
+    """
+    In-process counters and timing summaries. Each gunicorn worker and the
+    scheduler keep their own; GET /metrics/ reports the serving worker's view.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(int)
+        self._timings = {}
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] += value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = self._timings[name] = {"count": 0, "total_seconds": 0.0, "max_seconds": 0.0}
+            timing["count"] += 1
+            timing["total_seconds"] += seconds
+            timing["max_seconds"] = max(timing["max_seconds"], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            timings = {}
+            for name, timing in self._timings.items():
+                timings[name] = dict(timing, avg_seconds=timing["total_seconds"] / timing["count"])
+            return {"counters": dict(self._counters), "timings": timings}
+
+metrics = Metrics()
@@ -1,5 +1,5 @@
 # models.py
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Time, Enum, Text
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, ForeignKey, Time, Enum, Text, Index, LargeBinary, Float
 from sqlalchemy.orm import relationship
 from database import Base
 from datetime import datetime
@@ -43,6 +43,9 @@ class GeneratedSpeech(Base):
 
     user = relationship("User", back_populates="generated_speeches")
 
+    # Keyset pages of the public feed (user_id IS NULL) and of each user's history
+    __table_args__ = (Index('ix_generated_speeches_user_id_created_at_id', 'user_id', 'created_at', 'id'),)
+
 class User(Base):
     __tablename__ = 'users'
     id = Column(Integer, primary_key=True, index=True)
@@ -71,4 +74,69 @@ class Schedule(Base):
     user_id = Column(Integer, ForeignKey('users.id'))
     day_of_week = Column(String)
     time_of_day = Column(Time)
-    user = relationship("User", back_populates="schedules")
\ No newline at end of file
+    # Next delivery time in UTC, precomputed so the scheduler can range-scan it
+    next_fire_at = Column(DateTime, index=True)
+    # Lets the scheduler daemon pick up changed schedules incrementally
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+    user = relationship("User", back_populates="schedules")
+
+class SpeechJob(Base):
+    __tablename__ = 'speech_jobs'
+    id = Column(String(32), primary_key=True)
+    kind = Column(String, nullable=False)  # 'personal' or 'public'
+    user_id = Column(Integer, ForeignKey('users.id'), nullable=True)
+    status = Column(String, nullable=False, default='queued')  # queued, running, succeeded, failed
+    request_payload = Column(Text, nullable=False)
+    generated_speech_id = Column(Integer, ForeignKey('generated_speeches.id'), nullable=True)
+    error = Column(String, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    generated_speech = relationship("GeneratedSpeech")
+
+    # Workers look for the oldest runnable job in a given status
+    __table_args__ = (Index('ix_speech_jobs_status_run_after', 'status', 'run_after'),)
+
+class AudioCacheEntry(Base):
+    __tablename__ = 'audio_cache'
+    # sha256 of (text, voice, output format); also names the blob
+    key = Column(String(64), primary_key=True)
+    speech_url = Column(String, nullable=False)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+class EmailOutbox(Base):
+    __tablename__ = 'email_outbox'
+    id = Column(Integer, primary_key=True)
+    to_address = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    body = Column(Text, nullable=False)
+    speech_url = Column(String, nullable=True)
+    generated_speech_id = Column(Integer, ForeignKey('generated_speeches.id'), nullable=True)
+    attachment_name = Column(String, nullable=True)
+    attachment_data = Column(LargeBinary, nullable=True)  # cleared once sent
+    status = Column(String, nullable=False, default='pending')  # pending, sending, sent, failed, cancelled
+    attempts = Column(Integer, nullable=False, default=0)
+    # When a pending email may be sent, or when a send's lease runs out
+    next_attempt_at = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(String, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    # A pre-generated scheduled speech is only sent if its schedule still has
+    # the next_fire_at it was given when this delivery was claimed
+    schedule_id = Column(Integer, nullable=True)
+    schedule_next_fire_at = Column(DateTime, nullable=True)
+    generated_speech = relationship("GeneratedSpeech")
+
+    # The dispatcher looks for due emails in a given status
+    __table_args__ = (Index('ix_email_outbox_status_next_attempt_at', 'status', 'next_attempt_at'),)
+
+class RateLimitBucket(Base):
+    __tablename__ = 'rate_limit_buckets'
+    # One token bucket per provider and deployment, shared by every process
+    name = Column(String, primary_key=True)
+    tokens = Column(Float, nullable=False)
+    updated_at = Column(DateTime, nullable=False)
+    # Bumped on every update, so concurrent takers can't both spend the same token
+    version = Column(Integer, nullable=False, default=0)
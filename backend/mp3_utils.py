@@ -0,0 +1,84 @@
+# backend/mp3_utils.py
+"""
+Just enough MPEG audio (Layer III) parsing to join separately synthesized
+clips into one stream: leading ID3v2 tags, Xing/Info/VBRI header frames and
+trailing ID3v1 tags or garbage are dropped, so players see one continuous run
+of audio frames.
+"""
+
+# Bitrates in kbit/s, indexed by the header's bitrate bits
+_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+# Sample rates in Hz by version bits: 0b11 MPEG-1, 0b10 MPEG-2, 0b00 MPEG-2.5
+_SAMPLE_RATES = {
+    0b11: (44100, 48000, 32000),
+    0b10: (22050, 24000, 16000),
+    0b00: (11025, 12000, 8000),
+}
+_HEADER_SIZE = 4
+_VBR_TAGS = (b'Xing', b'Info', b'VBRI')
+
+def frame_length(header):
+    """
+    Length in bytes of the Layer III frame starting with the 4-byte `header`,
+    or None if it is not a valid frame header.
+    """
+    if len(header) < _HEADER_SIZE or header[0] != 0xFF or header[1] & 0xE0 != 0xE0:
+        return None
+    version = (header[1] >> 3) & 0b11
+    layer = (header[1] >> 1) & 0b11
+    bitrate_index = header[2] >> 4
+    sample_rate_index = (header[2] >> 2) & 0b11
+    if version == 0b01 or layer != 0b01 or bitrate_index in (0, 15) or sample_rate_index == 3:
+        return None
+    padding = (header[2] >> 1) & 1
+    bitrate = _BITRATES[1 if version == 0b11 else 2][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][sample_rate_index]
+    # MPEG-1 frames hold 1152 samples, MPEG-2/2.5 frames 576
+    samples_per_byte = 144 if version == 0b11 else 72
+    return samples_per_byte * bitrate // sample_rate + padding
+
+def _skip_id3v2(data):
+    if data[:3] != b'ID3' or len(data) < 10:
+        return 0
+    # Syncsafe size: 7 bits per byte
+    size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+    footer = 10 if data[5] & 0x10 else 0
+    return 10 + size + footer
+
+def iter_frames(data):
+    """Yield (offset, length) of each audio frame in `data`, skipping tags and junk."""
+    view = memoryview(data)
+    offset = _skip_id3v2(data)
+    while offset + _HEADER_SIZE <= len(data):
+        length = frame_length(view[offset:offset + _HEADER_SIZE])
+        if length is None or offset + length > len(data):
+            # Resynchronize on the next frame header
+            offset = data.find(b'\xff', offset + 1)
+            if offset < 0:
+                return
+            continue
+        yield offset, length
+        offset += length
+
+def _is_vbr_header(frame):
+    # The tag sits after the side information, whose size depends on the
+    # version and channel mode; it is always within the first 40 bytes
+    return any(tag in frame[:_HEADER_SIZE + 36] for tag in _VBR_TAGS)
+
+def concat_mp3(segments):
+    """
+    Join MP3 clips into one clip containing only their audio frames, in order.
+    All clips are expected to share a sample rate and channel mode, as clips
+    synthesized with the same output format do.
+    """
+    output = bytearray()
+    for data in segments:
+        for index, (offset, length) in enumerate(iter_frames(data)):
+            frame = data[offset:offset + length]
+            if index == 0 and _is_vbr_header(frame):
+                continue
+            output += frame
+    return bytes(output)
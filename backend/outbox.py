@@ -0,0 +1,262 @@
+# backend/outbox.py
+import asyncio
+import datetime
+import logging
+import os
+import random
+import time
+from dotenv import load_dotenv
+from database import SessionLocal
+from models import EmailOutbox, Schedule
+from email_utils import send_email, get_email_client, email_breaker, EMAIL_ATTACHMENT_MAX_BYTES, EMAIL_SEND_DEADLINE_SECONDS
+from resilience import CircuitOpenError, DeadlineExceededError
+from metrics import metrics
+
+load_dotenv()
+
+EMAIL_OUTBOX_BATCH_SIZE = int(os.getenv('EMAIL_OUTBOX_BATCH_SIZE', '50'))
+EMAIL_OUTBOX_POLL_SECONDS = float(os.getenv('EMAIL_OUTBOX_POLL_SECONDS', '2'))
+EMAIL_OUTBOX_MAX_ATTEMPTS = int(os.getenv('EMAIL_OUTBOX_MAX_ATTEMPTS', '6'))
+# Retries wait BACKOFF * 2^(attempt - 1) seconds, with jitter, up to MAX_BACKOFF
+EMAIL_OUTBOX_BACKOFF_SECONDS = int(os.getenv('EMAIL_OUTBOX_BACKOFF_SECONDS', '30'))
+EMAIL_OUTBOX_MAX_BACKOFF_SECONDS = int(os.getenv('EMAIL_OUTBOX_MAX_BACKOFF_SECONDS', '3600'))
+# A send not finished within the lease is assumed lost with its process and is
+# retried; a send past EMAIL_SEND_DEADLINE_SECONDS keeps its lease while it runs
+EMAIL_OUTBOX_LEASE_SECONDS = int(os.getenv('EMAIL_OUTBOX_LEASE_SECONDS', '300'))
+
+def enqueue_email(db, to_address, subject, body, speech_url=None, attachment=None, generated_speech=None, send_after=None, schedule=None):
+    """
+    Add an email to the outbox in the caller's transaction; it is only sent
+    once the caller commits. `attachment` is a (file_name, data) pair. An
+    email for a claimed `schedule` is cancelled instead of sent if the
+    schedule has changed by then, and not added at all (None is returned)
+    if it already has.
+    """
+    if schedule is not None:
+        # Locks the schedule until the caller commits, so cancel_scheduled_emails
+        # either sees this email or has already moved the schedule
+        current = db.query(Schedule.next_fire_at).filter(Schedule.id == schedule.id).with_for_update().scalar()
+        if current != schedule.next_fire_at:
+            metrics.increment('email.cancelled')
+            logging.info(f"Not queueing the email for schedule {schedule.id}, it changed while the speech was generated")
+            return None
+    attachment_name, attachment_data = attachment or (None, None)
+    if speech_url and attachment_data is not None and len(attachment_data) > EMAIL_ATTACHMENT_MAX_BYTES:
+        # send_email would only link to it, so don't store the clip in the outbox
+        metrics.increment('email.attachments.link_only')
+        attachment_name, attachment_data = None, None
+    email = EmailOutbox(
+        to_address=to_address,
+        subject=subject,
+        body=body,
+        speech_url=speech_url,
+        attachment_name=attachment_name,
+        attachment_data=attachment_data,
+        generated_speech=generated_speech,
+        status='pending',
+        attempts=0,
+        next_attempt_at=send_after or datetime.datetime.utcnow(),
+        schedule_id=schedule.id if schedule is not None else None,
+        schedule_next_fire_at=schedule.next_fire_at if schedule is not None else None
+    )
+    db.add(email)
+    return email
+
+def cancel_scheduled_emails(db, user_id):
+    """
+    Cancel the user's pending scheduled emails, in the caller's transaction,
+    e.g. when their preferences change after the speech was pre-generated.
+    Each schedule is moved back to the fire time of its cancelled email, so
+    the scheduler generates that delivery again.
+    """
+    schedules = {schedule.id: schedule for schedule in db.query(Schedule).filter(Schedule.user_id == user_id).with_for_update()}
+    if not schedules:
+        return 0
+    pending = db.query(EmailOutbox).filter(EmailOutbox.status == 'pending', EmailOutbox.schedule_id.in_(list(schedules))).all()
+    cancelled = 0
+    for email in pending:
+        # Conditional, in case a dispatcher has just claimed it
+        if not db.query(EmailOutbox).filter(EmailOutbox.id == email.id, EmailOutbox.status == 'pending').update(
+            {EmailOutbox.status: 'cancelled', EmailOutbox.last_error: "Preferences changed"},
+            synchronize_session=False
+        ):
+            continue
+        cancelled += 1
+        schedule = schedules[email.schedule_id]
+        # Unless it was moved since, e.g. by a timezone change
+        if schedule.next_fire_at == email.schedule_next_fire_at:
+            schedule.next_fire_at = email.next_attempt_at
+    if cancelled:
+        metrics.increment('email.cancelled', cancelled)
+    return cancelled
+
+def cancel_stale_emails(db, emails):
+    """
+    Cancel the claimed emails whose schedule was replaced or moved since the
+    speech was generated, in the caller's transaction, and return the others.
+    """
+    schedule_ids = {email.schedule_id for email in emails if email.schedule_id is not None}
+    if not schedule_ids:
+        return emails
+    current = dict(db.query(Schedule.id, Schedule.next_fire_at).filter(Schedule.id.in_(schedule_ids)))
+    stale = [
+        email.id for email in emails
+        if email.schedule_id is not None and current.get(email.schedule_id) != email.schedule_next_fire_at
+    ]
+    if not stale:
+        return emails
+    db.query(EmailOutbox).filter(EmailOutbox.id.in_(stale), EmailOutbox.status == 'sending').update(
+        {EmailOutbox.status: 'cancelled', EmailOutbox.last_error: "Schedule changed"},
+        synchronize_session=False
+    )
+    metrics.increment('email.cancelled', len(stale))
+    logging.info(f"Cancelled {len(stale)} scheduled emails whose schedule changed")
+    return [email for email in emails if email.id not in stale]
+
+def retry_delay(attempts):
+    delay = min(EMAIL_OUTBOX_BACKOFF_SECONDS * 2 ** (attempts - 1), EMAIL_OUTBOX_MAX_BACKOFF_SECONDS)
+    return datetime.timedelta(seconds=delay * random.uniform(0.5, 1.0))
+
+def claim_due_emails(db, now, limit):
+    """
+    Lease up to `limit` due emails to this process. Each claim is conditional
+    on the row still being due, so concurrent dispatchers never send the same
+    email twice within a lease.
+    """
+    due = (EmailOutbox.status.in_(('pending', 'sending')), EmailOutbox.next_attempt_at <= now)
+    candidates = [row.id for row in db.query(EmailOutbox.id).filter(*due).order_by(EmailOutbox.next_attempt_at).limit(limit)]
+    lease_until = now + datetime.timedelta(seconds=EMAIL_OUTBOX_LEASE_SECONDS)
+    claimed_ids = []
+    for email_id in candidates:
+        claimed = (
+            db.query(EmailOutbox)
+            .filter(EmailOutbox.id == email_id, *due)
+            .update(
+                {EmailOutbox.status: 'sending', EmailOutbox.next_attempt_at: lease_until, EmailOutbox.attempts: EmailOutbox.attempts + 1},
+                synchronize_session=False
+            )
+        )
+        if claimed:
+            claimed_ids.append(email_id)
+    db.commit()
+    if not claimed_ids:
+        return []
+    emails = cancel_stale_emails(db, db.query(EmailOutbox).filter(EmailOutbox.id.in_(claimed_ids)).all())
+    # Detach before committing the cancellations, so the emails stay loaded
+    db.expunge_all()
+    db.commit()
+    return emails
+
+def record_result(db, email, sent, now):
+    values = {EmailOutbox.last_error: None if sent else "Send failed"}
+    if sent:
+        values.update({EmailOutbox.status: 'sent', EmailOutbox.sent_at: now, EmailOutbox.attachment_data: None})
+    elif email.attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS:
+        values[EmailOutbox.status] = 'failed'
+    else:
+        values.update({EmailOutbox.status: 'pending', EmailOutbox.next_attempt_at: now + retry_delay(email.attempts)})
+    # Only the lease holder records a result
+    db.query(EmailOutbox).filter(EmailOutbox.id == email.id, EmailOutbox.status == 'sending').update(values, synchronize_session=False)
+    db.commit()
+
+def release_email(db, email, retry_at):
+    """
+    Give a claimed email back unsent, e.g. while the email circuit is open,
+    without using up one of its attempts.
+    """
+    db.query(EmailOutbox).filter(EmailOutbox.id == email.id, EmailOutbox.status == 'sending').update(
+        {
+            EmailOutbox.status: 'pending',
+            EmailOutbox.next_attempt_at: retry_at,
+            EmailOutbox.attempts: EmailOutbox.attempts - 1,
+            EmailOutbox.last_error: "Email service unavailable"
+        },
+        synchronize_session=False
+    )
+    db.commit()
+
+class OutboxDispatcher:
+    """
+    Drains the email_outbox table, sending up to `concurrency` emails at once
+    through one shared EmailClient.
+    """
+
+    def __init__(self, concurrency, batch_size=EMAIL_OUTBOX_BATCH_SIZE, poll_seconds=EMAIL_OUTBOX_POLL_SECONDS):
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.poll_seconds = poll_seconds
+
+    async def dispatch_once(self):
+        """Send one batch of due emails and return how many were claimed."""
+        db = SessionLocal()
+        try:
+            emails = claim_due_emails(db, datetime.datetime.utcnow(), self.batch_size)
+        finally:
+            db.close()
+        if emails:
+            semaphore = asyncio.Semaphore(self.concurrency)
+            await asyncio.gather(*(self._send(email, semaphore) for email in emails))
+        return len(emails)
+
+    async def drain(self):
+        """Send everything that is due now, e.g. at the end of a cron tick."""
+        while await self.dispatch_once():
+            pass
+
+    async def run(self, stop_event):
+        while not stop_event.is_set():
+            try:
+                claimed = await self.dispatch_once()
+            except Exception as e:
+                logging.error(f"Email outbox dispatcher error: {e}")
+                claimed = 0
+            if not claimed:
+                try:
+                    await asyncio.wait_for(stop_event.wait(), timeout=self.poll_seconds)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _send(self, email, semaphore):
+        attachments = [(email.attachment_name, email.attachment_data)] if email.attachment_data else None
+        retry_after = None
+        async with semaphore:
+            started_at = time.monotonic()
+            sending = []
+
+            def start_sending():
+                sending.append(asyncio.ensure_future(asyncio.to_thread(
+                    send_email, email.to_address, email.subject, email.body, email.speech_url, attachments, get_email_client()
+                )))
+                # The deadline stops waiting for the send, but not the send itself
+                return asyncio.shield(sending[0])
+
+            try:
+                sent = await email_breaker.call(start_sending, deadline=EMAIL_SEND_DEADLINE_SECONDS, is_failure=lambda sent: not sent)
+            except CircuitOpenError as e:
+                logging.warning(f"Email {email.id} not sent: {e}")
+                retry_after = e.retry_after
+            except DeadlineExceededError as e:
+                # The send may still go through, so keep the lease until it is
+                # known rather than retry it and send the email twice
+                logging.warning(f"Email {email.id} is slow to send: {e}")
+                try:
+                    sent = await sending[0]
+                except Exception:
+                    sent = False
+            metrics.observe('email.send', time.monotonic() - started_at)
+
+        now = datetime.datetime.utcnow()
+        db = SessionLocal()
+        try:
+            if retry_after is not None:
+                metrics.increment('email.deferred')
+                release_email(db, email, now + datetime.timedelta(seconds=retry_after))
+                return
+            if sent:
+                metrics.increment('email.sent')
+                metrics.observe('email.delivery_delay', (now - email.created_at).total_seconds())
+            else:
+                metrics.increment('email.failed' if email.attempts >= EMAIL_OUTBOX_MAX_ATTEMPTS else 'email.retried')
+            record_result(db, email, sent, now)
+        finally:
+            db.close()
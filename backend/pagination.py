@@ -0,0 +1,47 @@
+# backend/pagination.py
+import base64
+import datetime
+import os
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_
+
+load_dotenv()
+
+DEFAULT_PAGE_SIZE = int(os.getenv('DEFAULT_PAGE_SIZE', '50'))
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '200'))
+# Characters of speech_text included in ?fields=summary list items
+SPEECH_PREVIEW_LENGTH = int(os.getenv('SPEECH_PREVIEW_LENGTH', '200'))
+
+class InvalidCursorError(ValueError):
+    pass
+
+def encode_cursor(created_at, row_id):
+    raw = f"{created_at.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii').rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode('utf-8')
+        created_at, row_id = raw.split('|')
+        return datetime.datetime.fromisoformat(created_at), int(row_id)
+    except (ValueError, UnicodeDecodeError) as e:
+        raise InvalidCursorError(f"Invalid cursor: {cursor}") from e
+
+def paginate_newest_first(query, model, limit, cursor=None):
+    """
+    Return (rows, next_cursor) for one page of `query`, newest first. Pages
+    are keyed on (created_at, id), so each page is an index range scan that
+    starts where the previous one ended rather than an ever-growing OFFSET.
+    """
+    if cursor:
+        created_at, row_id = decode_cursor(cursor)
+        query = query.filter(or_(
+            model.created_at < created_at,
+            and_(model.created_at == created_at, model.id < row_id)
+        ))
+    # Fetch one extra row to learn whether there is a next page
+    rows = query.order_by(model.created_at.desc(), model.id.desc()).limit(limit + 1).all()
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
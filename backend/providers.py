@@ -0,0 +1,216 @@
+# backend/providers.py
+"""
+Offline stand-ins for the Azure OpenAI, Azure Speech and Azure Communication
+Email clients, implementing the subset of each SDK interface this app uses.
+They are selected with LLM_BACKEND=fake, TTS_BACKEND=fake and
+EMAIL_BACKEND=local (the blob store has BLOB_STORAGE_BACKEND=local), so the
+whole pipeline can be load-tested and benchmarked without network access.
+
+Each fake takes a FakeProfile for its latency, jitter and error rate. The
+profiles are seeded, so a run is reproducible.
+"""
+import asyncio
+import datetime
+import hashlib
+import itertools
+import json
+import os
+import random
+import threading
+import time
+from types import SimpleNamespace
+from dotenv import load_dotenv
+from azure.cognitiveservices.speech import CancellationErrorCode, ResultReason
+
+load_dotenv()
+
+FAKE_SEED = int(os.getenv('FAKE_SEED', '0'))
+LOCAL_MAIL_DIR = os.path.abspath(os.getenv('LOCAL_MAIL_DIR', './mail'))
+
+CANNED_SPEECHES = (
+    "Every small step you take today builds the strength you will rely on tomorrow. "
+    "You have already come further than you think. Keep going, one honest effort at a time.",
+    "Today is not about being perfect. It is about showing up. "
+    "Do the next right thing, then the one after that, and let momentum carry you.",
+    "The work you put in when nobody is watching is the work that changes everything. "
+    "Trust the process, stay curious, and finish what you started.",
+)
+
+# One silent MPEG-2 Layer III frame: 32 kbit/s, 16 kHz, mono, 144 bytes, 36 ms.
+# It matches the app's Audio16Khz32KBitRateMonoMp3 output format.
+SILENT_FRAME = b'\xff\xf3\x48\xc0' + bytes(140)
+FRAME_SECONDS = 0.036
+# Speaking rate used to size the fake audio
+CHARS_PER_SECOND = 15
+
+class FakeProviderError(Exception):
+    """An injected failure, carrying the HTTP status a real service would return."""
+
+    def __init__(self, status_code=500):
+        super().__init__(f"Injected provider failure ({status_code})")
+        self.status_code = status_code
+
+class FakeProfile:
+    """Latency, jitter and failure rates for one fake provider."""
+
+    def __init__(self, latency=0.0, jitter=0.0, error_rate=0.0, throttle_rate=0.0, seed=FAKE_SEED):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls, prefix):
+        """Read e.g. FAKE_LLM_LATENCY_SECONDS, FAKE_LLM_JITTER_SECONDS, FAKE_LLM_ERROR_RATE, FAKE_LLM_THROTTLE_RATE."""
+        return cls(
+            latency=float(os.getenv(f'{prefix}_LATENCY_SECONDS', '0')),
+            jitter=float(os.getenv(f'{prefix}_JITTER_SECONDS', '0')),
+            error_rate=float(os.getenv(f'{prefix}_ERROR_RATE', '0')),
+            throttle_rate=float(os.getenv(f'{prefix}_THROTTLE_RATE', '0'))
+        )
+
+    def delay(self, base=0.0):
+        with self._lock:
+            jitter = self._random.uniform(-self.jitter, self.jitter) if self.jitter else 0.0
+        return max(base + self.latency + jitter, 0.0)
+
+    def outcome(self):
+        """None for success, else the status code of an injected failure."""
+        with self._lock:
+            roll = self._random.random()
+        if roll < self.throttle_rate:
+            return 429
+        if roll < self.throttle_rate + self.error_rate:
+            return 500
+        return None
+
+# Shared by every client of a kind, so each seeded sequence runs across the process
+fake_llm_profile = FakeProfile.from_env('FAKE_LLM')
+fake_tts_profile = FakeProfile.from_env('FAKE_TTS')
+fake_email_profile = FakeProfile.from_env('FAKE_EMAIL')
+
+def canned_speech(messages):
+    """The same prompt always gets the same speech."""
+    digest = hashlib.sha256(json.dumps(messages, sort_keys=True).encode('utf-8')).digest()
+    return CANNED_SPEECHES[digest[0] % len(CANNED_SPEECHES)]
+
+class FakeChatCompletions:
+    def __init__(self, profile, token_seconds, repeat):
+        self.profile = profile
+        self.token_seconds = token_seconds
+        self.repeat = repeat
+
+    async def create(self, model, messages, stream=False):
+        status_code = self.profile.outcome()
+        await asyncio.sleep(self.profile.delay())
+        if status_code is not None:
+            raise FakeProviderError(status_code)
+        text = " ".join([canned_speech(messages)] * self.repeat)
+        if not stream:
+            await asyncio.sleep(self.token_seconds * len(text.split()))
+            return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=text))])
+        return self._stream(text)
+
+    async def _stream(self, text):
+        words = text.split(" ")
+        for index, word in enumerate(words):
+            await asyncio.sleep(self.token_seconds)
+            content = word if index == len(words) - 1 else word + " "
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=content))])
+
+class FakeChatClient:
+    """Stands in for AsyncAzureOpenAI: `client.chat.completions.create(...)`, optionally streamed."""
+
+    def __init__(self, profile=None, token_seconds=None, repeat=None):
+        profile = profile or fake_llm_profile
+        if token_seconds is None:
+            token_seconds = float(os.getenv('FAKE_LLM_TOKEN_SECONDS', '0.02'))
+        # Repeat the canned speech to model longer ones
+        if repeat is None:
+            repeat = int(os.getenv('FAKE_LLM_REPEAT', '1'))
+        self.chat = SimpleNamespace(completions=FakeChatCompletions(profile, token_seconds, repeat))
+
+class _Event:
+    def __init__(self):
+        self._callbacks = []
+
+    def connect(self, callback):
+        self._callbacks.append(callback)
+
+    def fire(self, result):
+        for callback in self._callbacks:
+            callback(SimpleNamespace(result=result))
+
+class FakeSpeechSynthesizer:
+    """
+    Stands in for azure.cognitiveservices.speech.SpeechSynthesizer with no
+    audio config. It blocks like the real one, and returns valid silent MP3
+    audio as long as the text would take to speak. The audio is also delivered
+    through `synthesizing` events as it is "produced".
+    """
+
+    CHUNK_FRAMES = 28  # About a second of audio per synthesizing event
+
+    def __init__(self, profile=None, char_seconds=None):
+        self.profile = profile or fake_tts_profile
+        if char_seconds is None:
+            char_seconds = float(os.getenv('FAKE_TTS_CHAR_SECONDS', '0.002'))
+        self.char_seconds = char_seconds
+        self.synthesizing = _Event()
+
+    def speak_text_async(self, text):
+        return SimpleNamespace(get=lambda: self._speak(text))
+
+    def _speak(self, text):
+        status_code = self.profile.outcome()
+        frames = max(1, round(len(text) / CHARS_PER_SECOND / FRAME_SECONDS))
+        total_seconds = self.profile.delay(len(text) * self.char_seconds)
+        if status_code is not None:
+            time.sleep(total_seconds / 2)
+            error_code = CancellationErrorCode.TooManyRequests if status_code == 429 else CancellationErrorCode.ServiceError
+            return SimpleNamespace(
+                reason=ResultReason.Canceled,
+                audio_data=b'',
+                cancellation_details=SimpleNamespace(error_code=error_code, error_details="Injected provider failure")
+            )
+
+        chunk_count = -(-frames // self.CHUNK_FRAMES)
+        for chunk in range(chunk_count):
+            time.sleep(total_seconds / chunk_count)
+            chunk_frames = min(self.CHUNK_FRAMES, frames - chunk * self.CHUNK_FRAMES)
+            self.synthesizing.fire(SimpleNamespace(audio_data=SILENT_FRAME * chunk_frames))
+        return SimpleNamespace(
+            reason=ResultReason.SynthesizingAudioCompleted,
+            audio_data=SILENT_FRAME * frames,
+            cancellation_details=None
+        )
+
+class LocalEmailClient:
+    """
+    Stands in for azure.communication.email.EmailClient: each message is
+    written to LOCAL_MAIL_DIR as JSON instead of being sent.
+    """
+
+    def __init__(self, directory=None, profile=None):
+        self.directory = directory or LOCAL_MAIL_DIR
+        self.profile = profile or fake_email_profile
+        self._sequence = itertools.count()
+        os.makedirs(self.directory, exist_ok=True)
+
+    def begin_send(self, message):
+        return SimpleNamespace(result=lambda: self._send(message))
+
+    def _send(self, message):
+        status_code = self.profile.outcome()
+        time.sleep(self.profile.delay())
+        if status_code is not None:
+            raise FakeProviderError(status_code)
+        stamp = datetime.datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        path = os.path.join(self.directory, f"{stamp}-{os.getpid()}-{next(self._sequence)}.json")
+        # Write then rename so readers never see a partial message
+        with open(f"{path}.tmp", 'w') as f:
+            json.dump(message, f, indent=2)
+        os.replace(f"{path}.tmp", path)
+        return {"id": os.path.basename(path), "status": "Succeeded"}
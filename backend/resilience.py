@@ -0,0 +1,185 @@
+# backend/resilience.py
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from dotenv import load_dotenv
+from metrics import metrics
+
+load_dotenv()
+
+# A breaker opens when at least CIRCUIT_MIN_CALLS calls in the last
+# CIRCUIT_WINDOW_SECONDS failed at CIRCUIT_ERROR_RATE or more, and stays open
+# for CIRCUIT_OPEN_SECONDS before letting a single probe call through
+CIRCUIT_ERROR_RATE = float(os.getenv('CIRCUIT_ERROR_RATE', '0.5'))
+CIRCUIT_MIN_CALLS = int(os.getenv('CIRCUIT_MIN_CALLS', '10'))
+CIRCUIT_WINDOW_SECONDS = int(os.getenv('CIRCUIT_WINDOW_SECONDS', '60'))
+CIRCUIT_OPEN_SECONDS = int(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+
+# Every breaker in the process, by name, for GET /metrics/
+breakers = {}
+
+class CircuitOpenError(Exception):
+    def __init__(self, name, retry_after):
+        super().__init__(f"{name} is unavailable, failing fast")
+        self.name = name
+        self.retry_after = retry_after
+
+class DeadlineExceededError(Exception):
+    def __init__(self, name, seconds):
+        super().__init__(f"{name} did not respond within {seconds}s")
+        self.name = name
+        self.seconds = seconds
+
+class CircuitBreaker:
+    """
+    Per-process circuit breaker for one dependency. Closed, calls go through
+    and their outcomes are counted; open, calls fail at once with
+    CircuitOpenError; half open, one probe call decides whether to close again.
+    With `register` the breaker is reported by GET /metrics/.
+    """
+
+    def __init__(self, name, error_rate=CIRCUIT_ERROR_RATE, min_calls=CIRCUIT_MIN_CALLS,
+                 window_seconds=CIRCUIT_WINDOW_SECONDS, open_seconds=CIRCUIT_OPEN_SECONDS, clock=time.monotonic, register=True):
+        self.name = name
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.window_seconds = window_seconds
+        self.open_seconds = open_seconds
+        self._clock = clock
+        self._outcomes = deque()
+        self._opened_at = None
+        self._probing = False
+        if register:
+            breakers[name] = self
+
+    @property
+    def state(self):
+        if self._opened_at is None:
+            return 'closed'
+        if self._clock() - self._opened_at < self.open_seconds:
+            return 'open'
+        return 'half_open'
+
+    def _trim(self, now):
+        while self._outcomes and self._outcomes[0][0] <= now - self.window_seconds:
+            self._outcomes.popleft()
+
+    def snapshot(self):
+        self._trim(self._clock())
+        failures = sum(1 for _, ok in self._outcomes if not ok)
+        return {
+            "state": self.state,
+            "calls": len(self._outcomes),
+            "failures": failures,
+            "retry_after": self.retry_after() if self.state == 'open' else None
+        }
+
+    def retry_after(self):
+        return max(int(self.open_seconds - (self._clock() - self._opened_at)), 1)
+
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now."""
+        state = self.state
+        if state == 'open' or (state == 'half_open' and self._probing):
+            metrics.increment(f'breaker.{self.name}.rejected')
+            raise CircuitOpenError(self.name, self.retry_after() if state == 'open' else self.open_seconds)
+        if state == 'half_open':
+            self._probing = True
+
+    def record(self, ok):
+        now = self._clock()
+        if self._opened_at is not None:
+            # The outcome of the probe call, or of a call started before opening
+            if self._probing:
+                self._probing = False
+                if ok:
+                    logging.info(f"Circuit {self.name} closed")
+                    self._opened_at = None
+                    self._outcomes.clear()
+                else:
+                    self._opened_at = now
+            return
+
+        self._outcomes.append((now, ok))
+        self._trim(now)
+        failures = sum(1 for _, outcome in self._outcomes if not outcome)
+        if len(self._outcomes) >= self.min_calls and failures >= self.error_rate * len(self._outcomes):
+            logging.warning(f"Circuit {self.name} opened: {failures} of {len(self._outcomes)} calls failed")
+            metrics.increment(f'breaker.{self.name}.opened')
+            self._opened_at = now
+
+    def cancel_call(self):
+        """The call allowed by before_call() never reached the dependency."""
+        self._probing = False
+
+    async def call(self, make_call, deadline=None, is_failure=None, ignore=()):
+        """
+        Await `make_call()` within `deadline` seconds and return its result.
+        Exceptions, a missed deadline and results for which `is_failure` is
+        true count as failures; exceptions in `ignore` and cancellation of the
+        caller don't count at all.
+        """
+        self.before_call()
+        try:
+            result = await with_deadline(make_call(), deadline, self.name)
+        except ignore:
+            self.cancel_call()
+            raise
+        except asyncio.CancelledError:
+            self.cancel_call()
+            raise
+        except BaseException:
+            self.record(False)
+            raise
+        self.record(not (is_failure and is_failure(result)))
+        return result
+
+async def with_deadline(awaitable, seconds, name):
+    """
+    Await `awaitable` for at most `seconds` (None or 0 for no deadline). A
+    blocking call running on a thread can't be interrupted; its result is
+    simply no longer waited for.
+    """
+    if not seconds:
+        return await awaitable
+    try:
+        return await asyncio.wait_for(awaitable, seconds)
+    except asyncio.TimeoutError:
+        metrics.increment(f'deadline.{name}.exceeded')
+        raise DeadlineExceededError(name, seconds)
+
+def hedged(make_call, after, is_failure=None, name='hedge'):
+    """
+    Wrap an idempotent call so that a second attempt starts if the first has
+    not finished within `after` seconds; the first good result wins. With
+    `after` unset the call is made once.
+    """
+    if not after:
+        return make_call
+
+    async def call():
+        attempts = [asyncio.ensure_future(make_call())]
+        try:
+            done, _ = await asyncio.wait(attempts, timeout=after)
+            if not done:
+                metrics.increment(f'hedge.{name}.launched')
+                attempts.append(asyncio.ensure_future(make_call()))
+            pending = set(attempts)
+            result = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for attempt in done:
+                    if attempt.exception() is None and not (is_failure and is_failure(attempt.result())):
+                        if attempt is not attempts[0]:
+                            metrics.increment(f'hedge.{name}.won')
+                        return attempt.result()
+                    result = attempt
+            # Every attempt failed: report the last one
+            return result.result()
+        finally:
+            for attempt in attempts:
+                attempt.cancel()
+
+    return call
@@ -0,0 +1,44 @@
+# backend/schedule_utils.py
+import datetime
+import pytz
+
+DAYS_OF_WEEK = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday']
+
+def get_timezone(timezone_name):
+    try:
+        return pytz.timezone(timezone_name)
+    except pytz.UnknownTimeZoneError:
+        return pytz.UTC
+
+def compute_next_fire_at(day_of_week, time_of_day, timezone_name, not_before=None):
+    """
+    Return the first occurrence of (day_of_week, time_of_day) in the user's
+    timezone that is at or after `not_before`, as a naive UTC datetime.
+    """
+    if not_before is None:
+        not_before = datetime.datetime.utcnow()
+    if not_before.tzinfo is None:
+        not_before = pytz.utc.localize(not_before)
+    not_before = not_before.astimezone(pytz.utc)
+
+    user_timezone = get_timezone(timezone_name)
+    local_start = not_before.astimezone(user_timezone)
+    days_ahead = (DAYS_OF_WEEK.index(day_of_week) - local_start.weekday()) % 7
+
+    # The candidate in the current week may already be in the past, and a DST
+    # shift can move it by an hour, so look at most one week further.
+    for weeks in range(2):
+        candidate_date = local_start.date() + datetime.timedelta(days=days_ahead + 7 * weeks)
+        local_candidate = user_timezone.localize(
+            datetime.datetime.combine(candidate_date, time_of_day), is_dst=False
+        )
+        candidate = local_candidate.astimezone(pytz.utc)
+        if candidate >= not_before:
+            return candidate.replace(tzinfo=None)
+
+def refresh_next_fire_at(schedules, timezone_name, not_before=None):
+    """Recompute next_fire_at for the given schedules, e.g. after a timezone change."""
+    for schedule in schedules:
+        schedule.next_fire_at = compute_next_fire_at(
+            schedule.day_of_week, schedule.time_of_day, timezone_name, not_before
+        )
@@ -1,118 +1,398 @@
 # backend/scheduler.py
+import argparse
 import asyncio
 import datetime
+import heapq
+import signal
+from concurrent.futures import ThreadPoolExecutor
 from database import SessionLocal
 from models import User, Schedule, Preference, GeneratedSpeech
 import os
 from dotenv import load_dotenv
 import azure.cognitiveservices.speech as speechsdk
-from openai import AzureOpenAI
-import openai
-from azure_storage import upload_file_to_blob
-from email_utils import send_email
+from llm_utils import generate_prompt, generate_speech_text, stream_speech_text, cached_speech_text
+from tts_utils import tts_executor, DEFAULT_OUTPUT_FORMAT, TTS_PIPELINE_ENABLED, SpeechPipeline
+from audio_cache import audio_cache_key, audio_blob_name, lookup_audio, record_audio
+from azure_storage import upload_bytes_to_blob, run_upload
+from outbox import OutboxDispatcher, enqueue_email
+from schedule_utils import compute_next_fire_at
 import logging
-import pytz
 
 load_dotenv()
 
 OPENAI_API_KEY = os.getenv('OPENAI_API_KEY')
-SPEECH_KEY = os.getenv('AZURE_SPEECH_SUBSCRIPTION_KEY')
-SPEECH_REGION = os.getenv('AZURE_SPEECH_REGION')
 SAS_URL = os.getenv('AZURE_CONTAINER_SAS_URL')
 
+# Concurrency limits for a scheduler tick
+MAX_CONCURRENT_DELIVERIES = int(os.getenv('SCHEDULER_MAX_CONCURRENCY', '32'))
+LLM_CONCURRENCY = int(os.getenv('SCHEDULER_LLM_CONCURRENCY', '16'))
+TTS_CONCURRENCY = int(os.getenv('SCHEDULER_TTS_CONCURRENCY', '8'))
+UPLOAD_CONCURRENCY = int(os.getenv('SCHEDULER_UPLOAD_CONCURRENCY', '16'))
+EMAIL_CONCURRENCY = int(os.getenv('SCHEDULER_EMAIL_CONCURRENCY', '16'))
+
+# Daemon mode
+POLL_SECONDS = int(os.getenv('SCHEDULER_POLL_SECONDS', '30'))
+REFRESH_OVERLAP_SECONDS = int(os.getenv('SCHEDULER_REFRESH_OVERLAP_SECONDS', '60'))
+SPREAD_SECONDS = int(os.getenv('SCHEDULER_SPREAD_SECONDS', '60'))
+# Generate deliveries this long before their fire time and email them at it (0 disables)
+LOOKAHEAD_SECONDS = int(os.getenv('SCHEDULER_LOOKAHEAD_SECONDS', '0'))
+
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-def generate_prompt(user, preferences):
-    system_prompt = f"You are speaking to {user.first_name}"
-    if user.user_profile:
-        system_prompt += f", whose motivational profile is:\n{user.user_profile}\n"
-    system_prompt += f"\nYou are a motivational coach with the following profile:\n{preferences.persona}:{preferences.tone}\n\nYou reply only in plain text.\nDon't use markdown."
-    prompt = f"\nPlease write a motivational speech for {user.first_name} in the {preferences.persona} style and focus on using the correct triggers from {user.first_name}'s profile to target the speech for just him/her."
+class DeliveryLimits:
+    """Caps on concurrent deliveries in a tick, overall and per pipeline stage."""
+
+    def __init__(self, total=None, llm=None, tts=None, upload=None, email=None):
+        total = total or MAX_CONCURRENT_DELIVERIES
+        llm = llm or LLM_CONCURRENCY
+        tts = tts or TTS_CONCURRENCY
+        upload = upload or UPLOAD_CONCURRENCY
+        email = email or EMAIL_CONCURRENCY
+        self.total = asyncio.Semaphore(total)
+        self.llm = asyncio.Semaphore(llm)
+        self.tts = asyncio.Semaphore(tts)
+        self.upload = asyncio.Semaphore(upload)
+        # Emails go through the outbox dispatcher, which sends this many at once
+        self.email_concurrency = email
+        # Upload and email run blocking SDK calls on the default executor;
+        # TTS has its own pool, sized by TTS_WORKERS
+        self.threads = upload + email
 
-    return [
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": prompt}
-            ]
+def limited_synthesize(limits):
+    async def synthesize(text, voice, output_format):
+        async with limits.tts:
+            return await tts_executor.synthesize(text, voice, output_format)
+    return synthesize
 
-async def generate_speech(user, preferences, db):
+async def generate_speech(user, preferences, db, limits, send_after=None, schedule=None):
+    pipeline = None
     try:
         # Generate speech text using Azure OpenAI
-        client = AzureOpenAI(
-            api_key = os.getenv("AZURE_OPENAI_API_KEY"),
-            api_version = "2024-02-15-preview",
-            azure_endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        )
+        messages = generate_prompt(user, preferences)
+        # A cached text is synthesized whole, or its clip reused, without a pipeline
+        speech_text = cached_speech_text(messages, 'scheduled') if TTS_PIPELINE_ENABLED else None
+        if speech_text is None:
+            async with limits.llm:
+                if TTS_PIPELINE_ENABLED:
+                    # Synthesize each sentence while the rest is being generated
+                    pipeline = SpeechPipeline(preferences.voice, synthesize=limited_synthesize(limits))
+                    async for delta in stream_speech_text(messages, cache_scope='scheduled'):
+                        pipeline.feed(delta)
+                    speech_text = pipeline.text
+                else:
+                    speech_text = await generate_speech_text(messages, cache_scope='scheduled')
 
-        response = client.chat.completions.create(
-            model=os.getenv("AZURE_OPENAI_DEPLOYMENT"),
-            messages=generate_prompt(user, preferences)
-        )
-        speech_text = response.choices[0].message.content
-        
-
-        # Convert text to speech using Azure TTS
-        speech_config = speechsdk.SpeechConfig(subscription=SPEECH_KEY, region=SPEECH_REGION)
-        speech_config.speech_synthesis_voice_name = f"en-US-{preferences.voice.value}Neural"
-        speech_config.set_speech_synthesis_output_format(speechsdk.SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3)
-        filename = f"speech_{user.id}_{datetime.datetime.now().isoformat()}.mp3"
-        audio_config = speechsdk.audio.AudioOutputConfig(filename=filename)
-        synthesizer = speechsdk.SpeechSynthesizer(speech_config=speech_config, audio_config=audio_config)
-        result = synthesizer.speak_text_async(speech_text).get()
-        if result.reason != speechsdk.ResultReason.SynthesizingAudioCompleted:
-            logging.error(f"Speech synthesis failed for user {user.id}")
-            return
+        # Reuse the clip if this text was already synthesized with the same voice
+        cache_key = audio_cache_key(speech_text, preferences.voice, DEFAULT_OUTPUT_FORMAT)
+        url = lookup_audio(db, cache_key)
+        attachment = None
+        if url is not None and pipeline is not None:
+            pipeline.cancel()
+        elif url is None:
+            # Convert text to speech using Azure TTS
+            if pipeline is not None:
+                audio_data = await pipeline.finish()
+            else:
+                async with limits.tts:
+                    result = await tts_executor.synthesize(speech_text, preferences.voice)
+                audio_data = result.audio_data if result.reason == speechsdk.ResultReason.SynthesizingAudioCompleted else None
+            if audio_data is None:
+                logging.error(f"Speech synthesis failed for user {user.id}")
+                return
 
-        # Upload file to Azure Blob Storage
-        blob_name = filename
-        url = upload_file_to_blob(filename, blob_name)
-        if not url:
-            logging.error(f"Failed to upload speech for user {user.id}")
-            return
+            # Upload the in-memory clip to Azure Blob Storage
+            blob_name = audio_blob_name(cache_key)
+            async with limits.upload:
+                url = await run_upload(upload_bytes_to_blob, audio_data, blob_name)
+            if not url:
+                logging.error(f"Failed to upload speech for user {user.id}")
+                return
+            record_audio(db, cache_key, url)
+            attachment = (f"speech_{user.id}_{datetime.date.today().isoformat()}.mp3", audio_data)
 
-        # Save to generated_speeches table
+        # Save to generated_speeches table, with the email to the user in the
+        # same transaction; the outbox dispatcher sends it
         generated_speech = GeneratedSpeech(
             user_id=user.id,
             speech_text=speech_text,
             speech_url=url
         )
         db.add(generated_speech)
-        db.commit()
-
-        # Send email to user
         subject = "Your Motivational Speech"
         body = "Here's your motivational speech for today:\n\n" + speech_text
-        attachments = [filename]
-        send_email(user.email, subject, body, url, attachments)
-
-        # Clean up the audio file
-        os.remove(filename)
+        if enqueue_email(db, user.email, subject, body, url, attachment, generated_speech, send_after, schedule) is None:
+            # The preferences changed meanwhile and the delivery will be generated again
+            db.rollback()
+            return
+        db.commit()
 
-        logging.info(f"Motivational speech generated and sent to user {user.id}")
+        logging.info(f"Motivational speech generated and queued for user {user.id}")
     except Exception as e:
+        if pipeline is not None:
+            pipeline.cancel()
         logging.error(f"Error generating speech for user {user.id}: {e}")
 
-def main():
-    db = SessionLocal()
-    now = datetime.datetime.now(pytz.utc)
-    users = db.query(User).all()
-    for user in users:
+async def deliver(user, preferences, limits, send_after=None, schedule=None):
+    async with limits.total:
+        # Each delivery writes through its own session; the session only holds a
+        # connection while it commits, not across the slow LLM/TTS stages
+        db = SessionLocal()
         try:
-            user_timezone = pytz.timezone(user.timezone)
-        except pytz.UnknownTimeZoneError:
-            user_timezone = pytz.UTC
-
-        user_time = now.astimezone(user_timezone)
-        schedules = db.query(Schedule).filter(Schedule.user_id == user.id).all()
-        for schedule in schedules:
-            if user_time.strftime('%A') == schedule.day_of_week:
-                if user_time.time().hour == schedule.time_of_day.hour:
-                    preferences = db.query(Preference).filter(Preference.user_id == user.id).first()
-                    if preferences:
-                        asyncio.run(generate_speech(user, preferences, db))
-                    else:
-                        logging.warning(f"No preferences set for user {user.id}")
+            await generate_speech(user, preferences, db, limits, send_after=send_after, schedule=schedule)
+        finally:
+            db.close()
+
+def use_worker_threads(limits):
+    asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=limits.threads))
+
+async def run_deliveries(deliveries, limits=None):
+    """
+    Run (user, preferences) deliveries concurrently on one event loop, sending
+    their emails as they are queued and draining the outbox at the end.
+    """
+    limits = limits or DeliveryLimits()
+    use_worker_threads(limits)
+    dispatcher = OutboxDispatcher(concurrency=limits.email_concurrency)
+    stop_dispatcher = asyncio.Event()
+    dispatching = asyncio.create_task(dispatcher.run(stop_dispatcher))
+    try:
+        await asyncio.gather(*(deliver(user, preferences, limits) for user, preferences in deliveries))
+    finally:
+        stop_dispatcher.set()
+        await dispatching
+    await dispatcher.drain()
+
+def get_due_schedules(db, window_end):
+    """
+    Return (schedule, user, preferences) rows whose next_fire_at falls before
+    window_end, as a single range scan over ix_schedules_next_fire_at.
+    """
+    return (
+        db.query(Schedule, User, Preference)
+        .join(User, Schedule.user_id == User.id)
+        .outerjoin(Preference, Preference.user_id == User.id)
+        .filter(Schedule.next_fire_at < window_end)
+        .order_by(Schedule.next_fire_at)
+        .all()
+    )
+
+def split_deliveries(rows):
+    """The (schedule, user, preferences) rows that can be delivered: those with preferences."""
+    deliveries = []
+    for schedule, user, preferences in rows:
+        if preferences:
+            deliveries.append((schedule, user, preferences))
+        else:
+            logging.warning(f"No preferences set for user {user.id}")
+    return deliveries
+
+def main():
+    # The due rows are read once and handed to the deliveries, so keep them loaded
+    db = SessionLocal(expire_on_commit=False)
+    # Cron runs this hourly, so everything scheduled before the end of the current hour is due
+    now = datetime.datetime.utcnow()
+    window_end = now.replace(minute=0, second=0, microsecond=0) + datetime.timedelta(hours=1)
+    due = get_due_schedules(db, window_end)
+
+    # Advance before delivering so a failed delivery isn't retried every tick
+    for schedule, user, preferences in due:
+        schedule.next_fire_at = compute_next_fire_at(
+            schedule.day_of_week, schedule.time_of_day, user.timezone, not_before=window_end
+        )
+    db.commit()
     db.close()
 
+    asyncio.run(run_deliveries([(user, preferences) for schedule, user, preferences in split_deliveries(due)]))
+
+def spread_offset(schedule_id):
+    """Deterministic per-schedule delay so deliveries due in the same minute don't all fire at :00."""
+    if SPREAD_SECONDS <= 0:
+        return datetime.timedelta(0)
+    # Knuth multiplicative hash keeps neighbouring ids apart
+    return datetime.timedelta(seconds=(schedule_id * 2654435761) % 2**32 % SPREAD_SECONDS)
+
+def pregenerate_offset(schedule_id):
+    """
+    Deterministic point in the first half of the lookahead window at which to
+    generate a delivery, so pre-generation runs at a flat rate instead of
+    peaking before each hour. The second half is slack for slow providers.
+    """
+    window = LOOKAHEAD_SECONDS // 2
+    if window <= 0:
+        return datetime.timedelta(0)
+    return datetime.timedelta(seconds=(schedule_id * 2654435761) % 2**32 % window)
+
+def release_time(schedule_id, next_fire_at):
+    """When the daemon starts a delivery: ahead of its fire time with a lookahead, else spread within its minute."""
+    if LOOKAHEAD_SECONDS > 0:
+        return next_fire_at - datetime.timedelta(seconds=LOOKAHEAD_SECONDS) + pregenerate_offset(schedule_id)
+    return next_fire_at + spread_offset(schedule_id)
+
+class FireQueue:
+    """
+    Min-heap of upcoming deliveries ordered by release time. Superseded entries
+    stay in the heap and are skipped when they surface.
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._next_fire_at = {}
+
+    def __len__(self):
+        return len(self._next_fire_at)
+
+    def push(self, schedule_id, next_fire_at):
+        if next_fire_at is None:
+            self._next_fire_at.pop(schedule_id, None)
+            return
+        if self._next_fire_at.get(schedule_id) == next_fire_at:
+            return
+        self._next_fire_at[schedule_id] = next_fire_at
+        heapq.heappush(self._heap, (release_time(schedule_id, next_fire_at), schedule_id, next_fire_at))
+
+    def _drop_stale(self):
+        while self._heap:
+            release_at, schedule_id, next_fire_at = self._heap[0]
+            if self._next_fire_at.get(schedule_id) == next_fire_at:
+                return
+            heapq.heappop(self._heap)
+
+    def next_release(self):
+        self._drop_stale()
+        return self._heap[0][0] if self._heap else None
+
+    def pop_due(self, now):
+        """Remove and return {schedule_id: next_fire_at} for every entry released by now."""
+        due = {}
+        while True:
+            self._drop_stale()
+            if not self._heap or self._heap[0][0] > now:
+                return due
+            release_at, schedule_id, next_fire_at = heapq.heappop(self._heap)
+            del self._next_fire_at[schedule_id]
+            due[schedule_id] = next_fire_at
+
+def load_schedules(db, queue, since=None):
+    """
+    Push schedules into the queue and return the new updated_at watermark. With
+    `since` set, only schedules changed after it are read.
+    """
+    query = db.query(Schedule.id, Schedule.next_fire_at, Schedule.updated_at)
+    if since is not None:
+        # Overlap the previous poll so rows committed late, or stamped by a
+        # slightly slower clock, are still picked up
+        query = query.filter(Schedule.updated_at > since - datetime.timedelta(seconds=REFRESH_OVERLAP_SECONDS))
+    watermark = since
+    for schedule_id, next_fire_at, updated_at in query:
+        queue.push(schedule_id, next_fire_at)
+        if updated_at and (watermark is None or updated_at > watermark):
+            watermark = updated_at
+    return watermark
+
+def claim_schedules(db, due, now):
+    """
+    Advance next_fire_at for the due schedules and return the rows this process
+    won. The update is conditional on the value we saw, so a schedule that was
+    replaced, deleted or claimed elsewhere in the meantime is skipped.
+    """
+    rows = (
+        db.query(Schedule, User, Preference)
+        .join(User, Schedule.user_id == User.id)
+        .outerjoin(Preference, Preference.user_id == User.id)
+        .filter(Schedule.id.in_(list(due)))
+        .all()
+    )
+    claimed = []
+    for schedule, user, preferences in rows:
+        expected = due[schedule.id]
+        next_fire_at = compute_next_fire_at(
+            schedule.day_of_week, schedule.time_of_day, user.timezone,
+            not_before=max(expected + datetime.timedelta(seconds=1), now)
+        )
+        updated = (
+            db.query(Schedule)
+            .filter(Schedule.id == schedule.id, Schedule.next_fire_at == expected)
+            .update({Schedule.next_fire_at: next_fire_at}, synchronize_session=False)
+        )
+        if updated:
+            schedule.next_fire_at = next_fire_at
+            claimed.append((schedule, user, preferences))
+    db.commit()
+    return claimed
+
+async def run_daemon(stop_event=None):
+    """Keep upcoming fire times in memory and deliver each one at its minute."""
+    stop_event = stop_event or asyncio.Event()
+    limits = DeliveryLimits()
+    use_worker_threads(limits)
+    in_flight = set()
+    dispatcher = OutboxDispatcher(concurrency=limits.email_concurrency)
+    # Stopped separately, once the deliveries in flight have queued their emails
+    stop_dispatcher = asyncio.Event()
+    dispatching = asyncio.create_task(dispatcher.run(stop_dispatcher))
+
+    queue = FireQueue()
+    db = SessionLocal(expire_on_commit=False)
+    try:
+        watermark = load_schedules(db, queue)
+        db.commit()
+        logging.info(f"Scheduler daemon started with {len(queue)} schedules")
+        next_refresh = datetime.datetime.utcnow() + datetime.timedelta(seconds=POLL_SECONDS)
+
+        while not stop_event.is_set():
+            now = datetime.datetime.utcnow()
+            if now >= next_refresh:
+                watermark = load_schedules(db, queue, since=watermark)
+                db.commit()
+                next_refresh = now + datetime.timedelta(seconds=POLL_SECONDS)
+
+            due = queue.pop_due(now)
+            if due:
+                claimed = claim_schedules(db, due, now)
+                db.expunge_all()
+                for schedule, user, preferences in claimed:
+                    queue.push(schedule.id, schedule.next_fire_at)
+                for schedule, user, preferences in split_deliveries(claimed):
+                    # A pre-generated speech is only emailed at its scheduled minute,
+                    # and not at all if the schedule changes before then
+                    send_after = due[schedule.id] if LOOKAHEAD_SECONDS > 0 else None
+                    task = asyncio.create_task(deliver(user, preferences, limits, send_after, schedule))
+                    in_flight.add(task)
+                    task.add_done_callback(in_flight.discard)
+
+            wake_at = next_refresh
+            next_release = queue.next_release()
+            if next_release is not None and next_release < wake_at:
+                wake_at = next_release
+            timeout = max((wake_at - datetime.datetime.utcnow()).total_seconds(), 0)
+            try:
+                await asyncio.wait_for(stop_event.wait(), timeout=timeout)
+            except asyncio.TimeoutError:
+                pass
+    finally:
+        db.close()
+        if in_flight:
+            logging.info(f"Scheduler daemon stopping, waiting for {len(in_flight)} deliveries")
+            await asyncio.gather(*in_flight)
+        stop_dispatcher.set()
+        await dispatching
+
+def daemon():
+    async def run():
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, stop_event.set)
+        await run_daemon(stop_event)
+
+    asyncio.run(run())
+
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Generate and send scheduled motivational speeches.")
+    parser.add_argument('--daemon', action='store_true', help="Run continuously and deliver at minute precision instead of once per cron tick")
+    args = parser.parse_args()
+    if args.daemon:
+        daemon()
+    else:
+        main()
@@ -46,6 +46,14 @@ class GeneratedSpeechSchema(GeneratedSpeechBase):
 
     model_config = ConfigDict(from_attributes=True)
 
+# Returned by the speech lists with ?fields=summary
+class GeneratedSpeechSummarySchema(BaseModel):
+    id: int
+    user_id: Optional[int] = None
+    speech_url: str
+    speech_preview: str
+    created_at: datetime
+
 class PreferencesUpdate(BaseModel):
     first_name: str
     user_profile: Optional[str] = None
@@ -96,7 +104,9 @@ class UserSchema(UserBase):
     email: str
     preferences: Optional[PreferenceSchema] = None
     schedules: List[ScheduleSchema] = []
+    # Only the most recent speeches; the count covers the whole history
     generated_speeches: List[GeneratedSpeechSchema] = []
+    generated_speeches_count: Optional[int] = None
     created_at: datetime
 
     model_config = ConfigDict(from_attributes=True)
@@ -108,4 +118,15 @@ class SpeechRequest(BaseModel):
     tone: str
     voice: VoiceEnum
 
-    model_config = ConfigDict(from_attributes=True)
\ No newline at end of file
+    model_config = ConfigDict(from_attributes=True)
+
+class SpeechJobSchema(BaseModel):
+    id: str
+    status: str
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+    queue_seconds: Optional[float] = None
+    run_seconds: Optional[float] = None
+    error: Optional[str] = None
+    result: Optional[GeneratedSpeechSchema] = None
@@ -0,0 +1,275 @@
+# backend/tts_utils.py
+import asyncio
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from azure.cognitiveservices.speech import CancellationErrorCode, ResultReason, SpeechConfig, SpeechSynthesizer, SpeechSynthesisOutputFormat
+from metrics import metrics
+from mp3_utils import concat_mp3
+from governor import ProviderBusyError, ProviderGovernor
+from resilience import CircuitBreaker, with_deadline
+from providers import FakeSpeechSynthesizer
+
+load_dotenv()
+
+AZURE_SPEECH_SUBSCRIPTION_KEY = os.getenv('AZURE_SPEECH_SUBSCRIPTION_KEY')
+AZURE_SPEECH_REGION = os.getenv('AZURE_SPEECH_REGION')
+# 'azure' for Azure Speech, 'fake' for silent offline MP3 clips (see providers.py)
+TTS_BACKEND = os.getenv('TTS_BACKEND', 'azure')
+
+TTS_WORKERS = int(os.getenv('TTS_WORKERS', '4'))
+TTS_MAX_QUEUE = int(os.getenv('TTS_MAX_QUEUE', '16'))
+TTS_RETRY_AFTER_SECONDS = int(os.getenv('TTS_RETRY_AFTER_SECONDS', '5'))
+# Syntheses per second for the region across every process (0 disables the
+# shared limit), and the range this process's adaptive concurrency moves in
+TTS_REQUESTS_PER_SECOND = float(os.getenv('TTS_REQUESTS_PER_SECOND', '0'))
+TTS_BURST = int(os.getenv('TTS_BURST', '10'))
+TTS_MIN_CONCURRENCY = int(os.getenv('TTS_MIN_CONCURRENCY', '1'))
+TTS_MAX_CONCURRENCY = int(os.getenv('TTS_MAX_CONCURRENCY', str(TTS_WORKERS)))
+# Syntheses slower than this count as overload and halve the concurrency (0 disables)
+TTS_LATENCY_TARGET_SECONDS = float(os.getenv('TTS_LATENCY_TARGET_SECONDS', '0'))
+# Synthesize the text sentence by sentence while it is still being generated
+TTS_PIPELINE_ENABLED = os.getenv('TTS_PIPELINE_ENABLED', 'false').lower() == 'true'
+# Shorter sentences are merged with the next one, to keep the number of TTS calls down
+TTS_PIPELINE_MIN_CHARS = int(os.getenv('TTS_PIPELINE_MIN_CHARS', '80'))
+# Sentences of one pipeline synthesized at once; the rest wait their turn without taking a TTS slot
+TTS_PIPELINE_MAX_IN_FLIGHT = int(os.getenv('TTS_PIPELINE_MAX_IN_FLIGHT', str(TTS_WORKERS)))
+
+DEFAULT_OUTPUT_FORMAT = SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3
+
+# Longest wait for a synthesis, or for the next chunk of a streamed one, including the wait for a thread
+TTS_DEADLINE_SECONDS = float(os.getenv('TTS_DEADLINE_SECONDS', '60'))
+
+tts_breaker = CircuitBreaker('tts')
+
+tts_governor = ProviderGovernor(
+    f"tts:{AZURE_SPEECH_REGION}",
+    rate=TTS_REQUESTS_PER_SECOND,
+    burst=TTS_BURST,
+    min_concurrency=TTS_MIN_CONCURRENCY,
+    max_concurrency=TTS_MAX_CONCURRENCY,
+    latency_target=TTS_LATENCY_TARGET_SECONDS,
+    # Callers waiting beyond the in-flight limit get the same 503 as a full executor queue
+    max_waiting=TTS_MAX_QUEUE
+)
+
+def is_throttled(result):
+    return (
+        result.reason == ResultReason.Canceled
+        and result.cancellation_details.error_code == CancellationErrorCode.TooManyRequests
+    )
+
+class TTSQueueFullError(Exception):
+    def __init__(self, retry_after):
+        super().__init__("Speech synthesis queue is full")
+        self.retry_after = retry_after
+
+class SpeechSynthesisFailedError(Exception):
+    def __init__(self):
+        super().__init__("Speech synthesis failed")
+
+def deadline_left(started_at):
+    """What is left of TTS_DEADLINE_SECONDS since `started_at`, or None if there is no deadline."""
+    if not TTS_DEADLINE_SECONDS:
+        return None
+    return max(TTS_DEADLINE_SECONDS - (time.monotonic() - started_at), 0.001)
+
+class TTSExecutor:
+    """
+    Runs blocking Azure TTS synthesis on a dedicated thread pool. At most
+    `workers` clips are synthesized at once and at most `max_queue` more wait
+    for a thread; beyond that synthesize() fails fast with TTSQueueFullError.
+    The TTS governor applies the same bound to callers waiting for it.
+    """
+
+    def __init__(self, workers=TTS_WORKERS, max_queue=TTS_MAX_QUEUE):
+        self.workers = workers
+        self.max_queue = max_queue
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tts')
+        self._lock = threading.Lock()
+        self._pending = 0
+
+    @property
+    def pending(self):
+        return self._pending
+
+    def _release(self, future):
+        with self._lock:
+            self._pending -= 1
+
+    def _queue_full(self):
+        metrics.increment('tts.rejected')
+        return TTSQueueFullError(TTS_RETRY_AFTER_SECONDS)
+
+    def _submit(self, text, voice, output_format, on_audio=None):
+        with self._lock:
+            if self._pending >= self.workers + self.max_queue:
+                raise self._queue_full()
+            self._pending += 1
+        future = self._executor.submit(self._synthesize, text, voice, output_format, time.monotonic(), on_audio)
+        # Release the slot when the thread finishes, even if the caller stops waiting
+        future.add_done_callback(self._release)
+        return asyncio.wrap_future(future)
+
+    async def synthesize(self, text, voice, output_format=DEFAULT_OUTPUT_FORMAT):
+        """
+        Synthesize `text` with the given VoiceEnum voice and return the SDK
+        result. The audio is kept in memory on result.audio_data.
+        """
+        # The deadline includes the wait for the governor
+        started_at = time.monotonic()
+        try:
+            async with tts_governor.acquire(timeout=deadline_left(started_at)) as permit:
+                result = await tts_breaker.call(
+                    lambda: self._submit(text, voice, output_format),
+                    deadline=deadline_left(started_at),
+                    is_failure=lambda result: result.reason != ResultReason.SynthesizingAudioCompleted,
+                    # Our own back-pressure, not a failure of the service
+                    ignore=(TTSQueueFullError,)
+                )
+                if is_throttled(result):
+                    permit.throttle()
+                return result
+        except ProviderBusyError:
+            raise self._queue_full()
+
+    async def stream(self, text, voice, output_format=DEFAULT_OUTPUT_FORMAT):
+        """
+        Synthesize `text` and yield the audio in chunks as the synthesizer
+        produces them. Raises SpeechSynthesisFailedError at the end if the
+        synthesis did not complete.
+        """
+        loop = asyncio.get_running_loop()
+        chunks = asyncio.Queue()
+        started_at = time.monotonic()
+        try:
+            async with tts_governor.acquire(timeout=deadline_left(started_at)) as permit:
+                tts_breaker.before_call()
+                try:
+                    done = self._submit(text, voice, output_format, lambda data: loop.call_soon_threadsafe(chunks.put_nowait, data))
+                except TTSQueueFullError:
+                    tts_breaker.cancel_call()
+                    raise
+                try:
+                    # Scheduled after every chunk callback, so it always arrives last
+                    done.add_done_callback(lambda future: chunks.put_nowait(None))
+                    # The first chunk is due within what is left after waiting for the governor
+                    deadline = deadline_left(started_at)
+                    while (data := await with_deadline(chunks.get(), deadline, 'tts')) is not None:
+                        yield data
+                        deadline = TTS_DEADLINE_SECONDS
+                    result = await done
+                except (GeneratorExit, asyncio.CancelledError):
+                    tts_breaker.cancel_call()
+                    raise
+                except BaseException:
+                    tts_breaker.record(False)
+                    raise
+                tts_breaker.record(result.reason == ResultReason.SynthesizingAudioCompleted)
+                if is_throttled(result):
+                    permit.throttle()
+        except ProviderBusyError:
+            raise self._queue_full()
+        if result.reason != ResultReason.SynthesizingAudioCompleted:
+            raise SpeechSynthesisFailedError()
+
+    def _synthesize(self, text, voice, output_format, submitted_at, on_audio=None):
+        started_at = time.monotonic()
+        metrics.observe('tts.queue_wait', started_at - submitted_at)
+
+        if TTS_BACKEND == 'fake':
+            synthesizer = FakeSpeechSynthesizer()
+        else:
+            speech_config = SpeechConfig(subscription=AZURE_SPEECH_SUBSCRIPTION_KEY, region=AZURE_SPEECH_REGION)
+            speech_config.set_speech_synthesis_output_format(output_format)
+            speech_config.speech_synthesis_voice_name = f"en-US-{getattr(voice, 'value', voice)}Neural"
+            # No audio config: the SDK returns the clip on the result instead of writing it anywhere
+            synthesizer = SpeechSynthesizer(speech_config=speech_config, audio_config=None)
+        if on_audio is not None:
+            # Each synthesizing event carries the audio produced since the previous one
+            synthesizer.synthesizing.connect(lambda evt: on_audio(evt.result.audio_data))
+        result = synthesizer.speak_text_async(text).get()
+
+        metrics.observe('tts.synthesis', time.monotonic() - started_at)
+        return result
+
+tts_executor = TTSExecutor()
+
+# A sentence ends with terminal punctuation, optionally closing quotes or
+# brackets, and then whitespace
+_SENTENCE_END = re.compile(r'[.!?]+["\')\]]*\s+')
+
+class SpeechPipeline:
+    """
+    Synthesizes a text that is still being generated. Each sentence fed in
+    starts synthesizing as soon as it is complete, and finish() joins the
+    clips into one MP3, so the total latency approaches the longer of text
+    generation and synthesis rather than their sum. At most `max_in_flight`
+    sentences are synthesizing at a time, so one long text can't take every
+    TTS slot.
+    """
+
+    def __init__(self, voice, output_format=DEFAULT_OUTPUT_FORMAT, synthesize=None, min_chars=TTS_PIPELINE_MIN_CHARS,
+                 max_in_flight=TTS_PIPELINE_MAX_IN_FLIGHT):
+        self.voice = voice
+        self.output_format = output_format
+        self.min_chars = min_chars
+        self._synthesize = synthesize or tts_executor.synthesize
+        self._in_flight = asyncio.Semaphore(max(max_in_flight, 1))
+        self._parts = []
+        self._pending = ""
+        self._tasks = []
+
+    @property
+    def text(self):
+        return "".join(self._parts)
+
+    def feed(self, delta):
+        self._parts.append(delta)
+        self._pending += delta
+        end = 0
+        for match in _SENTENCE_END.finditer(self._pending):
+            if match.end() - end >= self.min_chars or not self._tasks:
+                self._start(self._pending[end:match.end()])
+                end = match.end()
+        self._pending = self._pending[end:]
+
+    def _start(self, segment):
+        segment = segment.strip()
+        if segment:
+            self._tasks.append(asyncio.ensure_future(self._synthesize_segment(segment)))
+
+    async def _synthesize_segment(self, segment):
+        async with self._in_flight:
+            return await self._synthesize(segment, self.voice, self.output_format)
+
+    def cancel(self):
+        """Drop the clip. Sentences still waiting are never synthesized; ones already on a TTS thread run to completion."""
+        for task in self._tasks:
+            task.cancel()
+
+    async def finish(self):
+        """
+        Synthesize what is left of the text and return the whole clip, or None
+        if any sentence failed to synthesize.
+        """
+        self._start(self._pending)
+        self._pending = ""
+        metrics.increment('tts.pipeline.clips')
+        metrics.increment('tts.pipeline.segments', len(self._tasks))
+        # Time from the end of the text to the audio being ready
+        started_at = time.monotonic()
+        try:
+            results = await asyncio.gather(*self._tasks)
+        except BaseException:
+            self.cancel()
+            raise
+        metrics.observe('tts.pipeline.tail', time.monotonic() - started_at)
+        if any(result.reason != ResultReason.SynthesizingAudioCompleted for result in results):
+            logging.error("Speech synthesis failed for a pipelined segment")
+            return None
+        return concat_mp3(result.audio_data for result in results)
@@ -1,33 +1,131 @@
 # backend/utils.py
 import os
+import threading
+import time
 from datetime import datetime, timedelta
 import jwt
-from models import User
+from models import User, Preference, Schedule, GeneratedSpeech
+from schemas import UserSchema
 from dotenv import load_dotenv
-from sqlalchemy.orm import Session, joinedload
+from sqlalchemy import func
+from sqlalchemy.orm import Session, make_transient_to_detached
 
 load_dotenv()
 
 SECRET_KEY = os.getenv('SECRET_KEY')
 ALGORITHM = 'HS256'
 
+# How long a worker may reuse a user's columns without re-reading them; other
+# workers only see profile changes once their copy expires
+PRINCIPAL_CACHE_TTL_SECONDS = int(os.getenv('PRINCIPAL_CACHE_TTL_SECONDS', '30'))
+
+# Relationships /me and PATCH /preferences/ can expand with ?include=
+USER_RELATIONSHIPS = ('preferences', 'schedules', 'generated_speeches')
+RECENT_SPEECHES_LIMIT = int(os.getenv('RECENT_SPEECHES_LIMIT', '10'))
+
 def create_access_token(data: dict, expires_delta: timedelta = timedelta(hours=1)):
     to_encode = data.copy()
     expire = datetime.utcnow() + expires_delta
     to_encode.update({"exp": expire})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
-def verify_token(token: str, db: Session):
+class PrincipalCache:
+    """
+    Per-worker cache of User column values keyed by the token's `sub`, so an
+    authenticated request doesn't have to query the users table every time.
+    The values may be stale, so endpoints that write to the user or act on its
+    columns must load it fresh instead.
+    """
+
+    def __init__(self, ttl_seconds=PRINCIPAL_CACHE_TTL_SECONDS, clock=time.monotonic):
+        self.ttl_seconds = ttl_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self._entries = {}
+
+    def get(self, user_id, db: Session):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] <= self._clock():
+                self._entries.pop(user_id, None)
+                return None
+            values = entry[1]
+        # Attach a copy to this request's session without a SELECT; relationships
+        # still lazy-load through the session if an endpoint touches them
+        user = User(**values)
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+
+    def put(self, user):
+        values = {attr.key: getattr(user, attr.key) for attr in User.__mapper__.column_attrs}
+        with self._lock:
+            self._entries[user.id] = (self._clock() + self.ttl_seconds, values)
+
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+principal_cache = PrincipalCache()
+
+def verify_token(token: str, db: Session, options=(), fresh=False):
+    """
+    Return the token's user, or None if the token is invalid. Only the user's
+    own columns are loaded unless loader `options` ask for relationships. With
+    `fresh` the user is read from the database rather than the principal cache.
+    """
     try:
         payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
         user_id = payload.get("sub")
         if user_id is None:
             return None
-        user = db.query(User).options(
-            joinedload(User.preferences),
-            joinedload(User.schedules),
-            joinedload(User.generated_speeches)
-        ).filter(User.id == user_id).first()
+        user_id = int(user_id)
+        if not options and not fresh and PRINCIPAL_CACHE_TTL_SECONDS > 0:
+            user = principal_cache.get(user_id, db)
+            if user is not None:
+                return user
+        user = db.query(User).options(*options).filter(User.id == user_id).first()
+        if user is not None and PRINCIPAL_CACHE_TTL_SECONDS > 0:
+            principal_cache.put(user)
         return user
-    except jwt.PyJWTError:
-        return None
\ No newline at end of file
+    except (jwt.PyJWTError, ValueError):
+        return None
+
+def parse_include(include):
+    """Relationships named in a comma-separated ?include=, all of them by default."""
+    if include is None:
+        return set(USER_RELATIONSHIPS)
+    requested = {name.strip() for name in include.split(',') if name.strip()}
+    unknown = requested.difference(USER_RELATIONSHIPS)
+    if unknown:
+        raise ValueError(f"Unknown include: {', '.join(sorted(unknown))}")
+    return requested
+
+def build_user_response(db: Session, user, include, speeches_limit=RECENT_SPEECHES_LIMIT):
+    """
+    Serialize the user with only the requested relationships, each loaded by
+    its own indexed query. Speeches are limited to the most recent ones plus
+    a total count. Fields that weren't requested are left unset, so endpoints
+    can drop them with response_model_exclude_unset.
+    """
+    data = {
+        "id": user.id,
+        "first_name": user.first_name,
+        "user_profile": user.user_profile,
+        "timezone": user.timezone,
+        "email": user.email,
+        "created_at": user.created_at
+    }
+    if 'preferences' in include:
+        data["preferences"] = db.query(Preference).filter(Preference.user_id == user.id).first()
+    if 'schedules' in include:
+        data["schedules"] = db.query(Schedule).filter(Schedule.user_id == user.id).all()
+    if 'generated_speeches' in include:
+        data["generated_speeches"] = (
+            db.query(GeneratedSpeech)
+            .filter(GeneratedSpeech.user_id == user.id)
+            .order_by(GeneratedSpeech.created_at.desc(), GeneratedSpeech.id.desc())
+            .limit(speeches_limit)
+            .all()
+        )
+        data["generated_speeches_count"] = db.query(func.count(GeneratedSpeech.id)).filter(GeneratedSpeech.user_id == user.id).scalar()
+    return UserSchema.model_validate(data)
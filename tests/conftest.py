@@ -1,13 +1,16 @@
 # tests/conftest.py
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event, text
 from sqlalchemy.orm import sessionmaker
-from unittest.mock import patch
+from sqlalchemy.pool import StaticPool
+from unittest.mock import patch, MagicMock
+from azure.cognitiveservices.speech import ResultReason
 import os
 
-from backend.main import app
-from backend.database import Base, get_db
+# The app imports its modules by their top-level names, so take Base and
+# get_db from it rather than from backend.database
+from backend.main import app, Base, get_db
 
 # Load test environment variables
 from dotenv import load_dotenv
@@ -41,25 +44,67 @@ def override_get_db():
 
 app.dependency_overrides[get_db] = override_get_db
 
+# Code that opens its own sessions (the job workers, streamed speeches) uses
+# the test database too
+@pytest.fixture(scope="session", autouse=True)
+def testing_session_local():
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for module in ('backend.main', 'jobs', 'outbox', 'governor'):
+            monkeypatch.setattr(f'{module}.SessionLocal', TestingSessionLocal)
+        yield
+
+# A session on the test database, to check what background tasks stored
+@pytest.fixture
+def test_db():
+    db = TestingSessionLocal()
+    yield db
+    db.close()
+
+# An empty in-memory database for unit tests, with every statement it runs
+@pytest.fixture
+def memory_db(mocker):
+    memory_engine = create_engine("sqlite://", connect_args={"check_same_thread": False}, poolclass=StaticPool)
+    Base.metadata.create_all(bind=memory_engine)
+    statements = []
+    event.listen(memory_engine, "before_cursor_execute", lambda conn, cursor, statement, *args: statements.append(statement))
+    factory = sessionmaker(bind=memory_engine)
+    for module in ('backend.jobs', 'backend.outbox', 'backend.governor'):
+        mocker.patch(f'{module}.SessionLocal', factory)
+    yield factory, statements
+    memory_engine.dispose()
+
 @pytest.fixture(scope="module")
 def client():
     with TestClient(app) as c:
         yield c
 
+# Start every test with an empty audio cache so mocked synthesis is exercised
+@pytest.fixture(autouse=True)
+def clear_audio_cache():
+    db = TestingSessionLocal()
+    try:
+        db.execute(text("DELETE FROM audio_cache"))
+        db.commit()
+    finally:
+        db.close()
+
 # Mock external services
 @pytest.fixture(autouse=True)
 def mock_external_services(mocker):
     # Mock MSAL ConfidentialClientApplication
     mocker.patch('backend.auth.msal.ConfidentialClientApplication')
     
-    # Mock AzureOpenAI
-    mocker.patch('backend.main.AzureOpenAI')
+    # Mock Azure OpenAI text generation
+    mocker.patch('backend.main.generate_speech_text', return_value="Generated speech text")
     
-    # Mock Azure SpeechSynthesizer
-    mocker.patch('backend.main.SpeechSynthesizer')
+    # Mock Azure TTS synthesis
+    mocker.patch(
+        'backend.main.tts_executor.synthesize',
+        return_value=MagicMock(reason=ResultReason.SynthesizingAudioCompleted)
+    )
     
-    # Mock upload_file_to_blob
-    mocker.patch('backend.main.upload_file_to_blob', return_value='https://mocked_blob_url.com/speech.wav')
+    # Mock upload_bytes_to_blob
+    mocker.patch('backend.main.upload_bytes_to_blob', return_value='https://mocked_blob_url.com/speech.wav')
     
     # Mock send_email
     mocker.patch('backend.main.send_email')
@@ -0,0 +1,55 @@
+# tests/test_audio_cache.py
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from azure.cognitiveservices.speech import ResultReason, SpeechSynthesisOutputFormat
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from backend.audio_cache import AudioCacheEntry, audio_cache_key, audio_blob_name, lookup_audio, record_audio
+
+def test_audio_cache_key_depends_on_text_voice_and_format():
+    mp3 = SpeechSynthesisOutputFormat.Audio16Khz32KBitRateMonoMp3
+    key = audio_cache_key("Hello", "Jenny", mp3)
+
+    assert key == audio_cache_key("Hello", "Jenny", mp3)
+    assert key != audio_cache_key("Hello!", "Jenny", mp3)
+    assert key != audio_cache_key("Hello", "Guy", mp3)
+    assert key != audio_cache_key("Hello", "Jenny", SpeechSynthesisOutputFormat.Audio24Khz48KBitRateMonoMp3)
+    assert audio_blob_name(key) == f"audio/{key}.mp3"
+
+def test_record_and_lookup_audio():
+    engine = create_engine("sqlite://")
+    AudioCacheEntry.metadata.create_all(bind=engine)
+    db = sessionmaker(bind=engine)()
+    try:
+        assert lookup_audio(db, "a" * 64) is None
+        record_audio(db, "a" * 64, "https://blob/audio/a.mp3")
+        # A second worker recording the same clip is not an error
+        record_audio(db, "a" * 64, "https://blob/audio/a.mp3")
+        assert lookup_audio(db, "a" * 64) == "https://blob/audio/a.mp3"
+    finally:
+        db.close()
+
+def test_repeated_public_speech_skips_synthesis_and_upload(client: TestClient, mocker):
+    mock_synthesize = mocker.patch(
+        'backend.main.tts_executor.synthesize',
+        return_value=MagicMock(reason=ResultReason.SynthesizingAudioCompleted)
+    )
+    mock_upload = mocker.patch('backend.main.upload_bytes_to_blob', return_value='https://mocked_blob_url.com/audio/clip.mp3')
+    payload = {
+        "first_name": "Public",
+        "user_profile": "Public profile",
+        "persona": "Cheerful Friend",
+        "tone": "Friendly and Upbeat",
+        "voice": "Jenny"
+    }
+
+    first = client.post("/generate_public_speech", json=payload)
+    second = client.post("/generate_public_speech", json=payload)
+
+    assert first.status_code == second.status_code == status.HTTP_200_OK
+    assert second.json()["speech_url"] == first.json()["speech_url"]
+    mock_synthesize.assert_awaited_once()
+    mock_upload.assert_called_once()
+    assert mock_upload.call_args.args[1].startswith("audio/")
@@ -76,5 +76,6 @@ def test_get_current_user_authenticated(client: TestClient, mocker):
         "preferences": None,
         "schedules": [],
         "generated_speeches": [],
+        "generated_speeches_count": 0,
         "created_at": "2024-01-01T00:00:00"
     }
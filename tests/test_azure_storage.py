@@ -1,7 +1,7 @@
 # tests/test_azure_storage.py
 import pytest
 from unittest.mock import MagicMock, patch
-from backend.azure_storage import list_blobs, upload_file_to_blob
+from backend.azure_storage import list_blobs, upload_file_to_blob, upload_bytes_to_blob
 
 def test_list_blobs_success(mocker):
     # Mock the container_client.list_blobs method
@@ -65,3 +65,51 @@ def test_upload_file_to_blob_failure(mocker, tmp_path, caplog):
         mock_container_client.get_blob_client.assert_called_once_with("test_upload.txt")
         mock_blob_client.upload_blob.assert_called_once()
         assert "Error uploading to blob: Upload Failed" in caplog.text
+
+def test_local_container_client_round_trip(tmp_path):
+    from backend.azure_storage import LocalContainerClient
+    container = LocalContainerClient(str(tmp_path), "file:///blobs")
+
+    blob_client = container.get_blob_client("speeches/test.mp3")
+    blob_client.upload_blob(b"mp3 bytes", overwrite=True)
+
+    assert blob_client.url == "file:///blobs/speeches/test.mp3"
+    assert (tmp_path / "speeches" / "test.mp3").read_bytes() == b"mp3 bytes"
+    assert [blob.name for blob in container.list_blobs()] == ["speeches/test.mp3"]
+
+def test_local_container_client_rejects_paths_outside_container(tmp_path):
+    from backend.azure_storage import LocalContainerClient
+    container = LocalContainerClient(str(tmp_path), "file:///blobs")
+
+    with pytest.raises(ValueError):
+        container.get_blob_client("../escape.mp3")
+
+def test_upload_bytes_to_blob_sets_content_type(mocker):
+    mock_blob_client = MagicMock()
+    mock_blob_client.url = "https://mocked_blob_url.com/speech.mp3?sv=..."
+    mock_container_client = MagicMock()
+    mock_container_client.get_blob_client.return_value = mock_blob_client
+    mocker.patch('backend.azure_storage.container_client', mock_container_client)
+
+    url = upload_bytes_to_blob(b"mp3 bytes", "speech.mp3")
+
+    assert url == "https://mocked_blob_url.com/speech.mp3"
+    kwargs = mock_blob_client.upload_blob.call_args.kwargs
+    assert kwargs["content_settings"].content_type == "audio/mpeg"
+    assert kwargs["overwrite"] is True
+
+def test_local_blob_client_concurrent_uploads_of_same_blob(tmp_path):
+    from concurrent.futures import ThreadPoolExecutor
+    from backend.azure_storage import LocalContainerClient
+    container = LocalContainerClient(str(tmp_path), "file:///blobs")
+    data = b"\xff" * 256 * 1024
+
+    def upload(_):
+        container.get_blob_client("audio/same.mp3").upload_blob(data, overwrite=True)
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(upload, range(40)))
+
+    assert (tmp_path / "audio" / "same.mp3").read_bytes() == data
+    assert [blob.name for blob in container.list_blobs()] == ["audio/same.mp3"]
+    assert not list((tmp_path / "audio").glob("*.tmp"))
@@ -74,4 +74,41 @@ def test_send_email_generic_error(mocker, caplog):
     with caplog.at_level('ERROR'):
         send_email("recipient@example.com", "Test Subject", "Test Content", attachments=[])
         # Check that the error was logged
-        assert "Error sending email to recipient@example.com: Generic Error" in caplog.text
\ No newline at end of file
+        assert "Error sending email to recipient@example.com: Generic Error" in caplog.text
+def test_send_email_with_in_memory_attachment(mocker):
+    # Mock the EmailClient and its methods
+    mock_client = MagicMock()
+    mocker.patch('backend.email_utils.EmailClient.from_connection_string', return_value=mock_client)
+
+    # Call send_email with a (file_name, data) attachment
+    send_email("recipient@example.com", "Test Subject", "Test Content", attachments=[("speech.mp3", b"mp3 bytes")])
+
+    args, kwargs = mock_client.begin_send.call_args
+    sent_message = args[0]
+    assert sent_message["attachments"][0]["name"] == "speech.mp3"
+    assert sent_message["attachments"][0]["contentType"] == "audio/mpeg"
+    import base64
+    assert sent_message["attachments"][0]["contentInBase64"] == base64.b64encode(b"mp3 bytes").decode('utf-8')
+
+def test_send_email_reports_success_and_uses_given_client(mocker):
+    mock_from_connection_string = mocker.patch('backend.email_utils.EmailClient.from_connection_string')
+    shared_client = MagicMock()
+
+    assert send_email("recipient@example.com", "Subject", "Content", client=shared_client) is True
+    shared_client.begin_send.assert_called_once()
+    mock_from_connection_string.assert_not_called()
+
+    shared_client.begin_send.side_effect = Exception("Generic Error")
+    assert send_email("recipient@example.com", "Subject", "Content", client=shared_client) is False
+
+def test_send_email_links_large_attachments_instead(mocker):
+    mocker.patch('backend.email_utils.EMAIL_ATTACHMENT_MAX_BYTES', 10)
+    client = MagicMock()
+
+    send_email("recipient@example.com", "Subject", "Content", "https://blob/audio/a.mp3",
+               attachments=[("big.mp3", b"x" * 11), ("small.mp3", b"x" * 10)], client=client)
+
+    sent_message = client.begin_send.call_args.args[0]
+    assert [a["name"] for a in sent_message["attachments"]] == ["small.mp3"]
+    assert "https://blob/audio/a.mp3" in sent_message["content"]["plainText"]
+    assert 'href="https://blob/audio/a.mp3"' in sent_message["content"]["html"]
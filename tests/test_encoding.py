@@ -0,0 +1,55 @@
+# tests/test_encoding.py
+import gzip
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from backend.encoding import FastJSONResponse, negotiate_encoding
+
+def test_negotiate_encoding(mocker):
+    mocker.patch('backend.encoding.brotli', None)
+    assert negotiate_encoding("gzip, deflate") == "gzip"
+    assert negotiate_encoding("br, gzip;q=0.5") == "gzip"
+    assert negotiate_encoding("gzip;q=0") is None
+    assert negotiate_encoding("*") == "gzip"
+    assert negotiate_encoding("") is None
+
+def test_negotiate_encoding_prefers_brotli_when_available(mocker):
+    mocker.patch('backend.encoding.brotli', object())
+    assert negotiate_encoding("gzip, br") == "br"
+    assert negotiate_encoding("gzip, br;q=0.1") == "gzip"
+
+def test_fast_json_response_renders_compact_json():
+    response = FastJSONResponse(content={"text": "Hyvää päivää", "items": [1, 2]})
+    assert response.body.decode("utf-8") == '{"text":"Hyvää päivää","items":[1,2]}'
+
+def test_large_json_responses_are_gzipped(client: TestClient, mocker):
+    mocker.patch('backend.main.generate_speech_text', return_value="Keep going. " * 200)
+    assert client.post("/generate_public_speech", json={
+        "first_name": "Public",
+        "user_profile": "Public profile",
+        "persona": "Cheerful Friend",
+        "tone": "Friendly and Upbeat",
+        "voice": "Jenny"
+    }).status_code == status.HTTP_200_OK
+
+    response = client.get("/public_speeches/", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert int(response.headers["content-length"]) < len(response.content)
+    assert response.json()[0]["speech_text"].startswith("Keep going.")
+
+    # The compressed representation carries a weak validator that still revalidates
+    etag = response.headers["etag"]
+    assert etag.startswith('W/"')
+    revalidated = client.get("/public_speeches/", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert revalidated.status_code == status.HTTP_304_NOT_MODIFIED
+    assert revalidated.headers["etag"] == etag
+
+def test_small_responses_are_not_compressed(client: TestClient):
+    response = client.get("/jobs/missing", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+
+def test_identity_requested(client: TestClient):
+    response = client.get("/public_speeches/", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in response.headers
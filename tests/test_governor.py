@@ -0,0 +1,79 @@
+# tests/test_governor.py
+import asyncio
+import datetime
+import threading
+import pytest
+from unittest.mock import MagicMock
+from backend import governor as backend_governor
+from backend.governor import AdaptiveConcurrency, ProviderGovernor, drain_bucket, take_token
+
+def test_take_token_refills_at_the_shared_rate(memory_db):
+    factory, _ = memory_db
+    db = factory()
+    now = datetime.datetime(2024, 1, 1, 9, 0)
+    try:
+        assert [take_token(db, "tts:test", 2, 2, now) for _ in range(2)] == [0, 0]
+        # Empty: the next token is half a second away at 2 per second
+        assert take_token(db, "tts:test", 2, 2, now) == pytest.approx(0.5)
+        assert take_token(db, "tts:test", 2, 2, now + datetime.timedelta(seconds=0.5)) == 0
+
+        # A throttled provider pauses every process for the given time
+        drain_bucket(db, "tts:test", 2, 10, now + datetime.timedelta(seconds=0.5))
+        assert take_token(db, "tts:test", 2, 2, now + datetime.timedelta(seconds=1)) == pytest.approx(10)
+    finally:
+        db.close()
+
+def test_adaptive_concurrency_increases_additively_and_halves_on_overload():
+    concurrency = AdaptiveConcurrency(min_limit=1, max_limit=8, latency_target=5)
+    concurrency.limit = 4.0
+
+    for _ in range(4):
+        concurrency.on_success(1)
+    assert concurrency.limit == pytest.approx(4.92, abs=0.01)
+
+    concurrency.on_success(10)
+    assert concurrency.limit == pytest.approx(2.46, abs=0.01)
+    for _ in range(5):
+        concurrency.on_overload()
+    assert concurrency.limit == 1
+
+def test_governor_backs_off_on_429():
+    governor = ProviderGovernor("openai:test", rate=0, burst=1, min_concurrency=1, max_concurrency=4, register=False)
+
+    class RateLimited(Exception):
+        status_code = 429
+        response = MagicMock(headers={"retry-after": "3"})
+
+    async def call():
+        async with governor.acquire():
+            raise RateLimited()
+
+    with pytest.raises(RateLimited):
+        asyncio.run(call())
+    assert governor.concurrency.limit == 2
+    assert governor.concurrency.in_flight == 0
+
+def test_governor_takes_tokens_off_the_event_loop(memory_db, mocker):
+    governor = ProviderGovernor("openai:test", rate=100, burst=1, min_concurrency=1, max_concurrency=1, register=False)
+    threads = []
+
+    def take_token(db, name, rate, burst, now):
+        threads.append(threading.get_ident())
+        # Lose the race for the bucket once, then get a token
+        return None if len(threads) == 1 else 0
+    mocker.patch('backend.governor.take_token', take_token)
+    jitter = mocker.spy(backend_governor.random, 'uniform')
+
+    async def call():
+        async with governor.acquire():
+            return threading.get_ident()
+
+    loop_thread = asyncio.run(call())
+    assert len(threads) == 2
+    assert loop_thread not in threads
+    jitter.assert_called_once_with(0, 0.01)
+
+def test_unregistered_governor_is_not_reported():
+    from backend.governor import governors
+    ProviderGovernor("openai:unregistered", rate=0, burst=1, min_concurrency=1, max_concurrency=1, register=False)
+    assert "openai:unregistered" not in governors
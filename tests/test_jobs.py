@@ -0,0 +1,155 @@
+# tests/test_jobs.py
+import asyncio
+import datetime
+import time
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+from unittest.mock import MagicMock
+from backend.jobs import JobWorkerPool, SpeechJob, claim_next_job, enqueue_job, requeue_stale_jobs
+
+payload = {
+    "first_name": "Public",
+    "user_profile": "Public profile",
+    "persona": "Cheerful Friend",
+    "tone": "Friendly and Upbeat",
+    "voice": "Jenny"
+}
+
+def wait_for_job(client, job_id, timeout=5):
+    deadline = time.monotonic() + timeout
+    while True:
+        response = client.get(f"/jobs/{job_id}")
+        if response.json()["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            return response
+        time.sleep(0.05)
+
+def test_generate_public_speech_async_mode(client: TestClient, mocker):
+    response = client.post("/generate_public_speech", params={"async_mode": "true"}, json=payload)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job_id = response.json()["id"]
+    assert response.json()["status"] == "queued"
+    assert response.headers["location"] == f"/jobs/{job_id}"
+
+    response = wait_for_job(client, job_id)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["status"] == "succeeded"
+    assert data["queue_seconds"] is not None
+    assert data["run_seconds"] is not None
+    assert data["result"]["speech_text"] == "Generated speech text"
+    assert data["result"]["speech_url"] == "https://mocked_blob_url.com/speech.wav"
+    assert data["result"]["user_id"] is None
+
+def test_async_job_records_failure(client: TestClient, mocker):
+    mocker.patch('backend.main.upload_bytes_to_blob', return_value=None)
+
+    response = client.post("/generate_public_speech", params={"async_mode": "true"}, json=payload)
+    response = wait_for_job(client, response.json()["id"])
+
+    assert response.json()["status"] == "failed"
+    assert response.json()["error"] == "Failed to upload speech to storage"
+    assert response.json()["result"] is None
+
+def test_personal_job_hidden_from_other_users(client: TestClient, mocker):
+    owner = MagicMock()
+    owner.id = 1
+    mocker.patch('backend.main.verify_token', return_value=owner)
+    client.cookies.set("access_token", "mock_access_token")
+
+    response = client.post("/generate_speech", params={"async_mode": "true"}, json=payload)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    job_id = response.json()["id"]
+    assert wait_for_job(client, job_id).json()["status"] == "succeeded"
+
+    other_user = MagicMock()
+    other_user.id = 2
+    mocker.patch('backend.main.verify_token', return_value=other_user)
+    response = client.get(f"/jobs/{job_id}")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+def test_get_job_not_found(client: TestClient):
+    response = client.get("/jobs/doesnotexist")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Job not found"}
+
+@pytest.fixture
+def job_db(memory_db):
+    session_factory, statements = memory_db
+    db = session_factory()
+    yield db, statements
+    db.close()
+
+def test_idle_poll_and_sweep_do_not_write(job_db):
+    db, statements = job_db
+    now = datetime.datetime.utcnow()
+
+    assert claim_next_job(db, now) is None
+    requeue_stale_jobs(db, now)
+
+    assert not [statement for statement in statements if not statement.lstrip().upper().startswith("SELECT")]
+
+def test_stale_jobs_are_requeued_until_out_of_attempts(job_db, mocker):
+    db, _ = job_db
+    mocker.patch('backend.jobs.SPEECH_JOB_MAX_ATTEMPTS', 3)
+    now = datetime.datetime.utcnow()
+    started_at = now - datetime.timedelta(hours=1)
+    db.add(SpeechJob(id="retry", kind="public", status="running", request_payload="{}", attempts=1, started_at=started_at))
+    db.add(SpeechJob(id="spent", kind="public", status="running", request_payload="{}", attempts=3, started_at=started_at))
+    db.add(SpeechJob(id="fresh", kind="public", status="running", request_payload="{}", attempts=1, started_at=now))
+    db.commit()
+
+    requeue_stale_jobs(db, now)
+
+    assert db.get(SpeechJob, "retry").status == "queued"
+    assert db.get(SpeechJob, "spent").status == "failed"
+    assert db.get(SpeechJob, "spent").error == "Timed out"
+    assert db.get(SpeechJob, "fresh").status == "running"
+
+def test_transient_errors_are_retried_with_backoff(job_db, mocker):
+    db, _ = job_db
+    mocker.patch('backend.jobs.SPEECH_JOB_MAX_ATTEMPTS', 3)
+    mocker.patch('backend.jobs.SPEECH_JOB_RETRY_BACKOFF_SECONDS', 10)
+
+    class Transient(Exception):
+        pass
+
+    handler = mocker.AsyncMock(side_effect=[Transient(), Transient(), 42])
+    pool = JobWorkerPool(handler, retry_on=(Transient,))
+    job = enqueue_job(db, "public", None, "{}")
+
+    def run_after_retry():
+        # Skip the backoff instead of waiting for it
+        db.expire_all()
+        queued = db.get(SpeechJob, job.id)
+        assert queued.status == "queued"
+        delay = (queued.run_after - datetime.datetime.utcnow()).total_seconds()
+        queued.run_after = datetime.datetime.utcnow()
+        db.commit()
+        return delay
+
+    assert asyncio.run(pool._run_one()) is True
+    assert run_after_retry() == pytest.approx(10, abs=1)
+    assert asyncio.run(pool._run_one()) is True
+    assert run_after_retry() == pytest.approx(20, abs=1)
+    assert asyncio.run(pool._run_one()) is True
+
+    db.expire_all()
+    finished = db.get(SpeechJob, job.id)
+    assert finished.status == "succeeded"
+    assert finished.generated_speech_id == 42
+    assert finished.attempts == 3
+
+def test_transient_errors_fail_the_job_after_max_attempts(job_db, mocker):
+    db, _ = job_db
+    mocker.patch('backend.jobs.SPEECH_JOB_MAX_ATTEMPTS', 1)
+
+    class Transient(Exception):
+        pass
+
+    pool = JobWorkerPool(mocker.AsyncMock(side_effect=Transient()), retry_on=(Transient,))
+    job = enqueue_job(db, "public", None, "{}")
+
+    assert asyncio.run(pool._run_one()) is True
+    db.expire_all()
+    assert db.get(SpeechJob, job.id).status == "failed"
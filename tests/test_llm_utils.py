@@ -0,0 +1,178 @@
+# tests/test_llm_utils.py
+import asyncio
+import pytest
+from unittest.mock import AsyncMock, MagicMock
+from backend.llm_utils import generate_prompt, generate_speech_text, stream_speech_text, get_openai_client, SpeechTextCache
+
+def test_generate_prompt_includes_profile_and_persona():
+    user = MagicMock(first_name="Test", user_profile="Loves running")
+    preferences = MagicMock(persona="Coach Carter", tone="Inspirational")
+
+    messages = generate_prompt(user, preferences)
+
+    assert [m["role"] for m in messages] == ["system", "user"]
+    assert "Loves running" in messages[0]["content"]
+    assert "Coach Carter:Inspirational" in messages[0]["content"]
+    assert "for Test in the Coach Carter style" in messages[1]["content"]
+
+def test_generate_speech_text_awaits_async_client(mocker):
+    mock_client = MagicMock()
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock(message=MagicMock(content="Generated speech text"))]
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
+    mocker.patch('backend.llm_utils.get_openai_client', return_value=mock_client)
+
+    speech_text = asyncio.run(generate_speech_text([{"role": "user", "content": "Hi"}]))
+
+    assert speech_text == "Generated speech text"
+    mock_client.chat.completions.create.assert_awaited_once()
+
+def test_get_openai_client_is_shared_within_a_loop(mocker):
+    mock_client_class = mocker.patch('backend.llm_utils.AsyncAzureOpenAI')
+
+    async def get_twice():
+        return get_openai_client(), get_openai_client()
+
+    first, second = asyncio.run(get_twice())
+    assert first is second
+    mock_client_class.assert_called_once()
+
+def test_speech_text_cache_expires_and_evicts():
+    now = [0.0]
+    cache = SpeechTextCache(ttl_seconds=10, max_entries=2, clock=lambda: now[0])
+    cache.put("a", "text a")
+    cache.put("b", "text b")
+    assert cache.get("a") == "text a"
+
+    # "b" is now least recently used, so it is evicted first
+    cache.put("c", "text c")
+    assert cache.get("b") is None
+    assert cache.get("a") == "text a"
+
+    now[0] = 10
+    assert cache.get("a") is None
+    assert len(cache) == 1
+
+def test_speech_text_cache_key_ignores_whitespace():
+    messages = [{"role": "user", "content": "Hi  Test\n"}]
+    same = [{"role": "user", "content": "Hi Test"}]
+    other = [{"role": "user", "content": "Hi Other"}]
+
+    assert SpeechTextCache.key_for(messages) == SpeechTextCache.key_for(same)
+    assert SpeechTextCache.key_for(messages) != SpeechTextCache.key_for(other)
+
+def test_generate_speech_text_uses_cache_for_allowed_scopes(mocker):
+    mock_client = MagicMock()
+    mock_response = MagicMock()
+    mock_response.choices = [MagicMock(message=MagicMock(content="Generated speech text"))]
+    mock_client.chat.completions.create = AsyncMock(return_value=mock_response)
+    mocker.patch('backend.llm_utils.get_openai_client', return_value=mock_client)
+    mocker.patch('backend.llm_utils.text_cache', SpeechTextCache())
+    mocker.patch('backend.llm_utils.SPEECH_TEXT_CACHE_SCOPES', {'public'})
+    messages = [{"role": "user", "content": "Cache me"}]
+
+    async def generate(scope):
+        return [await generate_speech_text(messages, cache_scope=scope) for _ in range(2)]
+
+    assert asyncio.run(generate('public')) == ["Generated speech text"] * 2
+    assert mock_client.chat.completions.create.await_count == 1
+
+    asyncio.run(generate('personal'))
+    assert mock_client.chat.completions.create.await_count == 3
+
+def test_stream_speech_text_yields_deltas_and_caches_text(mocker):
+    async def chunks():
+        yield MagicMock(choices=[])
+        for content in ("Keep ", None, "going"):
+            yield MagicMock(choices=[MagicMock(delta=MagicMock(content=content))])
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=lambda **kwargs: chunks())
+    mocker.patch('backend.llm_utils.get_openai_client', return_value=mock_client)
+    mocker.patch('backend.llm_utils.text_cache', SpeechTextCache())
+    mocker.patch('backend.llm_utils.SPEECH_TEXT_CACHE_SCOPES', {'public'})
+    messages = [{"role": "user", "content": "Stream me"}]
+
+    async def collect():
+        return [delta async for delta in stream_speech_text(messages, cache_scope='public')]
+
+    assert asyncio.run(collect()) == ["Keep ", "going"]
+    assert mock_client.chat.completions.create.call_args.kwargs["stream"] is True
+    assert asyncio.run(collect()) == ["Keep going"]
+    assert mock_client.chat.completions.create.await_count == 1
+
+def test_cancelled_stream_is_not_counted_against_the_llm(mocker):
+    from backend.llm_utils import CircuitBreaker
+    breaker = CircuitBreaker('llm', min_calls=1, register=False)
+    mocker.patch('backend.llm_utils.llm_breaker', breaker)
+
+    async def chunks():
+        yield MagicMock(choices=[MagicMock(delta=MagicMock(content="Keep "))])
+        await asyncio.sleep(1)
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = AsyncMock(side_effect=lambda **kwargs: chunks())
+    mocker.patch('backend.llm_utils.get_openai_client', return_value=mock_client)
+
+    async def cancel_mid_stream():
+        started = asyncio.Event()
+
+        async def read():
+            async for _ in stream_speech_text([{"role": "user", "content": "Stream me"}]):
+                started.set()
+        reading = asyncio.ensure_future(read())
+        await started.wait()
+        reading.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await reading
+
+    asyncio.run(cancel_mid_stream())
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()["calls"] == 0
+
+def blocking_llm(mocker, max_concurrency, max_waiting):
+    """Patch in a governor and a client whose completions block until the returned event is set."""
+    from backend.llm_utils import CircuitBreaker, ProviderGovernor
+    governor = ProviderGovernor('openai:test', rate=0, burst=1, min_concurrency=1, max_concurrency=max_concurrency,
+                                max_waiting=max_waiting, register=False)
+    mocker.patch('backend.llm_utils.llm_governor', governor)
+    mocker.patch('backend.llm_utils.llm_breaker', CircuitBreaker('llm', register=False))
+    release = asyncio.Event()
+
+    async def create(**kwargs):
+        await release.wait()
+        return MagicMock(choices=[MagicMock(message=MagicMock(content="Done"))])
+    mock_client = MagicMock()
+    mock_client.chat.completions.create = create
+    mocker.patch('backend.llm_utils.get_openai_client', return_value=mock_client)
+    return release
+
+def test_llm_rejects_calls_beyond_its_queue(mocker):
+    from backend.llm_utils import LLMQueueFullError
+
+    async def run():
+        release = blocking_llm(mocker, max_concurrency=1, max_waiting=1)
+        calls = [asyncio.ensure_future(generate_speech_text([{"role": "user", "content": f"Speech {i}"}])) for i in range(3)]
+        await asyncio.sleep(0.01)
+        release.set()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert results.count("Done") == 2
+    assert [type(result) for result in results if result != "Done"] == [LLMQueueFullError]
+
+def test_llm_deadline_includes_the_wait_for_the_governor(mocker):
+    from backend.main import DeadlineExceededError
+    mocker.patch('backend.llm_utils.LLM_DEADLINE_SECONDS', 0.05)
+
+    async def run():
+        blocking_llm(mocker, max_concurrency=1, max_waiting=1)
+        # Holds the only slot past the deadline
+        first = asyncio.ensure_future(generate_speech_text([{"role": "user", "content": "First"}]))
+        await asyncio.sleep(0)
+        # Timed out while still waiting for the governor, not in the call
+        with pytest.raises(DeadlineExceededError) as excinfo:
+            await generate_speech_text([{"role": "user", "content": "Second"}])
+        assert excinfo.value.name == 'openai:test'
+        with pytest.raises(DeadlineExceededError):
+            await first
+
+    asyncio.run(run())
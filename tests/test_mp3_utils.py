@@ -0,0 +1,26 @@
+# tests/test_mp3_utils.py
+from backend.mp3_utils import concat_mp3, frame_length, iter_frames
+
+# MPEG-2 Layer III, 32 kbit/s, 16 kHz, mono: 144-byte frames
+HEADER = b'\xff\xf3\x48\xc0'
+
+def frame(fill):
+    return HEADER + bytes([fill]) * 140
+
+def test_frame_length_reads_header():
+    assert frame_length(HEADER) == 144
+    # MPEG-1, 128 kbit/s, 44.1 kHz, padded
+    assert frame_length(b'\xff\xfb\x92\x00') == 418
+    assert frame_length(b'\xff\xf3\xf8\xc0') is None
+    assert frame_length(b'ID3\x04') is None
+
+def test_concat_mp3_keeps_only_audio_frames():
+    id3v2 = b'ID3\x04\x00\x00\x00\x00\x00\x05' + b'tags!'
+    xing = HEADER + bytes(9) + b'Xing' + bytes(127)
+    first = id3v2 + xing + frame(1) + frame(2)
+    second = frame(3) + b'TAG' + bytes(125)
+
+    joined = concat_mp3([first, second])
+
+    assert joined == frame(1) + frame(2) + frame(3)
+    assert [length for _, length in iter_frames(joined)] == [144] * 3
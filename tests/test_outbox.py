@@ -0,0 +1,192 @@
+# tests/test_outbox.py
+import asyncio
+import datetime
+import time
+import pytest
+from backend.outbox import EmailOutbox, OutboxDispatcher, Schedule, cancel_scheduled_emails, enqueue_email
+
+@pytest.fixture
+def session_factory(memory_db, mocker):
+    factory, _ = memory_db
+    mocker.patch('backend.outbox.get_email_client')
+    return factory
+
+def queue_email(factory, **kwargs):
+    db = factory()
+    email = enqueue_email(db, "user@example.com", "Subject", "Body", "https://blob/audio/a.mp3", **kwargs)
+    db.commit()
+    email_id = email.id
+    db.close()
+    return email_id
+
+def test_dispatcher_sends_queued_email(session_factory, mocker):
+    mock_send = mocker.patch('backend.outbox.send_email', return_value=True)
+    email_id = queue_email(session_factory, attachment=("speech.mp3", b"mp3 bytes"))
+
+    asyncio.run(OutboxDispatcher(concurrency=4).drain())
+
+    args = mock_send.call_args.args
+    assert args[:4] == ("user@example.com", "Subject", "Body", "https://blob/audio/a.mp3")
+    assert args[4] == [("speech.mp3", b"mp3 bytes")]
+    email = session_factory().get(EmailOutbox, email_id)
+    assert email.status == "sent"
+    assert email.attempts == 1
+    assert email.sent_at is not None
+    assert email.attachment_data is None
+
+def test_failed_send_is_retried_with_backoff_then_given_up(session_factory, mocker):
+    mocker.patch('backend.outbox.send_email', return_value=False)
+    mocker.patch('backend.outbox.EMAIL_OUTBOX_MAX_ATTEMPTS', 2)
+    email_id = queue_email(session_factory)
+
+    asyncio.run(OutboxDispatcher(concurrency=4).drain())
+    db = session_factory()
+    email = db.get(EmailOutbox, email_id)
+    assert email.status == "pending"
+    assert email.next_attempt_at > datetime.datetime.utcnow()
+
+    # Make the retry due now
+    email.next_attempt_at = datetime.datetime.utcnow()
+    db.commit()
+    db.close()
+    asyncio.run(OutboxDispatcher(concurrency=4).drain())
+    email = session_factory().get(EmailOutbox, email_id)
+    assert email.status == "failed"
+    assert email.attempts == 2
+
+def test_expired_lease_is_reclaimed(session_factory, mocker):
+    mock_send = mocker.patch('backend.outbox.send_email', return_value=True)
+    email_id = queue_email(session_factory)
+    db = session_factory()
+    email = db.get(EmailOutbox, email_id)
+    email.status = "sending"
+    email.attempts = 1
+    email.next_attempt_at = datetime.datetime.utcnow() - datetime.timedelta(seconds=1)
+    db.commit()
+    db.close()
+
+    asyncio.run(OutboxDispatcher(concurrency=4).drain())
+
+    mock_send.assert_called_once()
+    assert session_factory().get(EmailOutbox, email_id).status == "sent"
+
+def test_future_email_is_not_sent_yet(session_factory, mocker):
+    mock_send = mocker.patch('backend.outbox.send_email', return_value=True)
+    queue_email(session_factory, send_after=datetime.datetime.utcnow() + datetime.timedelta(hours=1))
+
+    asyncio.run(OutboxDispatcher(concurrency=4).drain())
+
+    mock_send.assert_not_called()
+
+def add_schedule(factory, next_fire_at, user_id=7):
+    db = factory()
+    schedule = Schedule(user_id=user_id, day_of_week="Monday", time_of_day=datetime.time(9, 0), next_fire_at=next_fire_at)
+    db.add(schedule)
+    db.commit()
+    db.refresh(schedule)
+    db.close()
+    return schedule
+
+def test_pregenerated_email_is_cancelled_if_its_schedule_changed(session_factory, mocker):
+    mock_send = mocker.patch('backend.outbox.send_email', return_value=True)
+    next_week = datetime.datetime(2030, 1, 8, 9, 0)
+    unchanged = add_schedule(session_factory, next_week)
+    moved = add_schedule(session_factory, next_week)
+    deleted = add_schedule(session_factory, next_week)
+    unchanged_id = queue_email(session_factory, schedule=unchanged)
+    moved_id = queue_email(session_factory, schedule=moved)
+    deleted_id = queue_email(session_factory, schedule=deleted)
+
+    db = session_factory()
+    db.get(Schedule, moved.id).next_fire_at = datetime.datetime(2030, 1, 8, 10, 0)
+    db.delete(db.get(Schedule, deleted.id))
+    db.commit()
+    db.close()
+
+    asyncio.run(OutboxDispatcher(concurrency=4).drain())
+
+    mock_send.assert_called_once()
+    db = session_factory()
+    assert db.get(EmailOutbox, unchanged_id).status == "sent"
+    assert db.get(EmailOutbox, moved_id).status == "cancelled"
+    assert db.get(EmailOutbox, deleted_id).status == "cancelled"
+    assert db.get(EmailOutbox, deleted_id).last_error == "Schedule changed"
+
+def test_cancel_scheduled_emails_only_cancels_the_users_pending_emails(session_factory):
+    fire_at = datetime.datetime(2030, 1, 8, 9, 0)
+    own_id = queue_email(session_factory, schedule=add_schedule(session_factory, fire_at, user_id=7), send_after=fire_at)
+    other_id = queue_email(session_factory, schedule=add_schedule(session_factory, fire_at, user_id=8), send_after=fire_at)
+    unscheduled_id = queue_email(session_factory, send_after=fire_at)
+
+    db = session_factory()
+    assert cancel_scheduled_emails(db, 7) == 1
+    db.commit()
+
+    assert db.get(EmailOutbox, own_id).status == "cancelled"
+    assert db.get(EmailOutbox, other_id).status == "pending"
+    assert db.get(EmailOutbox, unscheduled_id).status == "pending"
+    db.close()
+
+def test_cancelled_delivery_is_generated_again(session_factory):
+    this_week, next_week = datetime.datetime(2030, 1, 1, 9, 0), datetime.datetime(2030, 1, 8, 9, 0)
+    # Both were claimed for this week, and advanced to next week
+    rearmed = add_schedule(session_factory, next_week)
+    moved = add_schedule(session_factory, next_week)
+    queue_email(session_factory, schedule=rearmed, send_after=this_week)
+    queue_email(session_factory, schedule=moved, send_after=this_week)
+
+    db = session_factory()
+    # A timezone change has already moved this one
+    db.get(Schedule, moved.id).next_fire_at = datetime.datetime(2030, 1, 1, 7, 0)
+    assert cancel_scheduled_emails(db, 7) == 2
+    db.commit()
+
+    assert db.get(Schedule, rearmed.id).next_fire_at == this_week
+    assert db.get(Schedule, moved.id).next_fire_at == datetime.datetime(2030, 1, 1, 7, 0)
+    db.close()
+
+def test_email_for_a_schedule_changed_during_generation_is_not_queued(session_factory):
+    schedule = add_schedule(session_factory, datetime.datetime(2030, 1, 8, 9, 0))
+    db = session_factory()
+    db.get(Schedule, schedule.id).next_fire_at = datetime.datetime(2030, 1, 1, 9, 0)
+    db.commit()
+
+    assert enqueue_email(db, "user@example.com", "Subject", "Body", schedule=schedule) is None
+    db.commit()
+    assert db.query(EmailOutbox).count() == 0
+    db.close()
+
+def test_send_past_its_deadline_is_awaited_not_retried(session_factory, mocker):
+    from backend.email_utils import CircuitBreaker
+
+    def slow_send(*args):
+        time.sleep(0.2)
+        return True
+    mock_send = mocker.patch('backend.outbox.send_email', side_effect=slow_send)
+    mocker.patch('backend.outbox.EMAIL_SEND_DEADLINE_SECONDS', 0.05)
+    mocker.patch('backend.outbox.email_breaker', CircuitBreaker('email', register=False))
+    email_id = queue_email(session_factory)
+
+    asyncio.run(OutboxDispatcher(concurrency=4).drain())
+
+    mock_send.assert_called_once()
+    email = session_factory().get(EmailOutbox, email_id)
+    assert email.status == "sent"
+    assert email.attempts == 1
+
+def test_open_circuit_defers_email_without_using_an_attempt(session_factory, mocker):
+    from backend.email_utils import CircuitBreaker
+    breaker = CircuitBreaker('email', min_calls=1, open_seconds=30, register=False)
+    breaker.before_call()
+    breaker.record(False)
+    mocker.patch('backend.outbox.email_breaker', breaker)
+    mock_send = mocker.patch('backend.outbox.send_email', return_value=True)
+    email_id = queue_email(session_factory)
+
+    asyncio.run(OutboxDispatcher(concurrency=4).drain())
+
+    mock_send.assert_not_called()
+    email = session_factory().get(EmailOutbox, email_id)
+    assert email.status == "pending"
+    assert email.attempts == 0
+    assert email.next_attempt_at > datetime.datetime.utcnow() + datetime.timedelta(seconds=20)
@@ -2,7 +2,9 @@
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
+import datetime
 from unittest.mock import MagicMock
+from backend.main import User, Preference, Schedule, compute_next_fire_at, create_access_token, principal_cache
 
 def test_update_preferences_success(client: TestClient, mocker):
     # Mock verify_token to return a user
@@ -45,4 +47,67 @@ def test_update_preferences_success(client: TestClient, mocker):
     assert response.json()["timezone"] == "UTC"
     assert response.json()["preferences"]["persona"] == "Coach Carter"
     assert response.json()["preferences"]["tone"] == "Inspirational"
-    assert response.json()["preferences"]["voice"] == "Ava"
\ No newline at end of file
+    assert response.json()["preferences"]["voice"] == "Ava"
+
+def test_update_preferences_expands_only_included_relationships(client: TestClient, mocker):
+    mock_user = MagicMock(id=4242, first_name="Test", user_profile=None, timezone="UTC", email="test@example.com")
+    mock_user.created_at = datetime.datetime(2024, 1, 1)
+    mocker.patch('backend.main.verify_token', return_value=mock_user)
+    client.cookies.set("access_token", "mock_access_token")
+
+    payload = {
+        "first_name": "Included",
+        "user_profile": "Profile",
+        "timezone": "UTC",
+        "persona": "Coach Carter",
+        "tone": "Inspirational",
+        "voice": "Ava"
+    }
+    response = client.patch("/preferences/", params={"include": "preferences"}, json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    data = response.json()
+    assert data["preferences"]["persona"] == "Coach Carter"
+    assert "schedules" not in data
+    assert "generated_speeches" not in data
+
+    response = client.patch("/preferences/", params={"include": "generated_speeches", "speeches_limit": 1}, json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["generated_speeches"] == []
+    assert response.json()["generated_speeches_count"] == 0
+
+def test_update_preferences_unknown_include(client: TestClient, mocker):
+    mocker.patch('backend.main.verify_token', return_value=MagicMock(id=4242))
+    client.cookies.set("access_token", "mock_access_token")
+    payload = {"first_name": "Test", "timezone": "UTC", "persona": "Coach Carter", "tone": "Inspirational", "voice": "Ava"}
+
+    response = client.patch("/preferences/", params={"include": "friends"}, json=payload)
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+def test_update_preferences_reads_the_user_fresh(client: TestClient, test_db):
+    eight = datetime.time(8, 0)
+    test_db.add(User(id=7001, microsoft_id="fresh-oid", first_name="Fresh", email="fresh@example.com", timezone="UTC"))
+    test_db.add(Schedule(user_id=7001, day_of_week="Monday", time_of_day=eight, next_fire_at=compute_next_fire_at("Monday", eight, "UTC")))
+    test_db.commit()
+    try:
+        client.cookies.set("access_token", create_access_token(data={"sub": "7001"}))
+        # This worker caches the user, then another one moves it to Helsinki
+        assert client.get("/schedule/").status_code == status.HTTP_200_OK
+        test_db.get(User, 7001).timezone = "Europe/Helsinki"
+        test_db.query(Schedule).filter(Schedule.user_id == 7001).one().next_fire_at = compute_next_fire_at("Monday", eight, "Europe/Helsinki")
+        test_db.commit()
+
+        payload = {"first_name": "Fresh", "timezone": "UTC", "persona": "Coach Carter", "tone": "Inspirational", "voice": "Ava"}
+        response = client.patch("/preferences/", params={"include": ""}, json=payload)
+        assert response.status_code == status.HTTP_200_OK
+
+        test_db.expire_all()
+        assert test_db.get(User, 7001).timezone == "UTC"
+        schedule = test_db.query(Schedule).filter(Schedule.user_id == 7001).one()
+        assert schedule.next_fire_at == compute_next_fire_at("Monday", eight, "UTC")
+    finally:
+        principal_cache.invalidate(7001)
+        test_db.rollback()
+        for model in (Schedule, Preference):
+            test_db.query(model).filter(model.user_id == 7001).delete()
+        test_db.query(User).filter(User.id == 7001).delete()
+        test_db.commit()
@@ -0,0 +1,51 @@
+# tests/test_providers.py
+import asyncio
+import json
+from azure.cognitiveservices.speech import CancellationErrorCode, ResultReason
+from backend.mp3_utils import iter_frames
+from backend.providers import FakeChatClient, FakeProfile, FakeSpeechSynthesizer
+
+def test_fake_chat_client_is_deterministic_and_streams():
+    client = FakeChatClient(FakeProfile(), token_seconds=0)
+    messages = [{"role": "user", "content": "Motivate me"}]
+
+    async def run():
+        response = await client.chat.completions.create(model="fake", messages=messages)
+        stream = await client.chat.completions.create(model="fake", messages=messages, stream=True)
+        return response.choices[0].message.content, "".join([chunk.choices[0].delta.content async for chunk in stream])
+
+    text, streamed = asyncio.run(run())
+    assert text == streamed
+    assert text == asyncio.run(run())[0]
+
+def test_fake_speech_synthesizer_produces_valid_mp3_in_chunks():
+    synthesizer = FakeSpeechSynthesizer(FakeProfile(), char_seconds=0)
+    chunks = []
+    synthesizer.synthesizing.connect(lambda evt: chunks.append(evt.result.audio_data))
+
+    result = synthesizer.speak_text_async("You can do it. " * 10).get()
+
+    assert result.reason == ResultReason.SynthesizingAudioCompleted
+    assert len(chunks) > 1
+    assert b"".join(chunks) == result.audio_data
+    assert sum(length for _, length in iter_frames(result.audio_data)) == len(result.audio_data)
+
+def test_fake_profile_injects_failures_reproducibly():
+    outcomes = [FakeProfile(throttle_rate=1).outcome(), FakeProfile(error_rate=1).outcome(), FakeProfile().outcome()]
+    assert outcomes == [429, 500, None]
+
+    result = FakeSpeechSynthesizer(FakeProfile(throttle_rate=1), char_seconds=0).speak_text_async("Hi").get()
+    assert result.reason == ResultReason.Canceled
+    assert result.cancellation_details.error_code == CancellationErrorCode.TooManyRequests
+
+def test_local_email_client_captures_messages(tmp_path, mocker):
+    mocker.patch('backend.email_utils.EMAIL_BACKEND', 'local')
+    from backend.email_utils import LocalEmailClient, send_email
+    mocker.patch('backend.email_utils.LocalEmailClient', side_effect=lambda: LocalEmailClient(str(tmp_path)))
+
+    assert send_email("user@example.com", "Subject", "Body") is True
+
+    captured = [json.loads(path.read_text()) for path in tmp_path.glob("*.json")]
+    assert len(captured) == 1
+    assert captured[0]["recipients"]["to"] == [{"address": "user@example.com"}]
+    assert captured[0]["content"]["subject"] == "Subject"
@@ -0,0 +1,90 @@
+# tests/test_resilience.py
+import asyncio
+import pytest
+from backend.resilience import CircuitBreaker, CircuitOpenError, DeadlineExceededError, hedged, with_deadline
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+def test_breaker_opens_on_error_rate_and_closes_after_a_good_probe():
+    clock = Clock()
+    breaker = CircuitBreaker('test', error_rate=0.5, min_calls=4, window_seconds=60, open_seconds=30, clock=clock, register=False)
+
+    for ok in (True, False, True, False):
+        breaker.before_call()
+        breaker.record(ok)
+    assert breaker.state == 'open'
+    with pytest.raises(CircuitOpenError) as excinfo:
+        breaker.before_call()
+    assert excinfo.value.retry_after == 30
+
+    clock.now = 31
+    assert breaker.state == 'half_open'
+    breaker.before_call()
+    # Only one probe at a time
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+    breaker.record(True)
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()["calls"] == 0
+
+def test_breaker_counts_missed_deadlines_and_failed_results():
+    breaker = CircuitBreaker('test', error_rate=1, min_calls=2, register=False)
+
+    async def slow():
+        await asyncio.sleep(1)
+
+    async def run():
+        with pytest.raises(DeadlineExceededError):
+            await breaker.call(slow, deadline=0.01)
+        assert await breaker.call(lambda: asyncio.sleep(0, result=None), is_failure=lambda url: not url) is None
+
+    asyncio.run(run())
+    assert breaker.state == 'open'
+
+def test_breaker_ignores_cancelled_calls():
+    clock = Clock()
+    breaker = CircuitBreaker('test', error_rate=0.5, min_calls=2, open_seconds=30, clock=clock, register=False)
+
+    async def cancel_in_flight():
+        calls = [asyncio.ensure_future(breaker.call(lambda: asyncio.sleep(1))) for _ in range(4)]
+        await asyncio.sleep(0)
+        for call in calls:
+            call.cancel()
+        await asyncio.gather(*calls, return_exceptions=True)
+
+    asyncio.run(cancel_in_flight())
+    assert breaker.state == 'closed'
+    assert breaker.snapshot()["calls"] == 0
+
+    # A cancelled probe lets the next call probe instead
+    for _ in range(2):
+        breaker.before_call()
+        breaker.record(False)
+    clock.now = 31
+    asyncio.run(cancel_in_flight())
+    assert breaker.state == 'half_open'
+    breaker.before_call()
+
+def test_hedged_call_returns_the_first_good_result():
+    calls = []
+
+    async def upload():
+        calls.append(len(calls))
+        # The first attempt stalls, the hedge finishes quickly
+        await asyncio.sleep(1 if len(calls) == 1 else 0)
+        return f"url-{len(calls)}"
+
+    result = asyncio.run(with_deadline(hedged(upload, 0.01, is_failure=lambda url: not url)(), 0.5, 'test'))
+
+    assert result == "url-2"
+    assert calls == [0, 1]
+
+def test_unregistered_breaker_is_not_reported():
+    from backend.resilience import breakers
+    CircuitBreaker('unregistered', register=False)
+    assert 'unregistered' not in breakers
@@ -0,0 +1,42 @@
+# tests/test_schedule_utils.py
+import datetime
+import pytest
+from backend.schedule_utils import compute_next_fire_at, refresh_next_fire_at
+from unittest.mock import MagicMock
+
+def test_compute_next_fire_at_later_same_day():
+    # Monday 2024-01-01 08:00 UTC
+    not_before = datetime.datetime(2024, 1, 1, 8, 0)
+    next_fire_at = compute_next_fire_at("Monday", datetime.time(9, 30), "UTC", not_before)
+    assert next_fire_at == datetime.datetime(2024, 1, 1, 9, 30)
+
+def test_compute_next_fire_at_rolls_over_to_next_week():
+    not_before = datetime.datetime(2024, 1, 1, 10, 0)
+    next_fire_at = compute_next_fire_at("Monday", datetime.time(9, 30), "UTC", not_before)
+    assert next_fire_at == datetime.datetime(2024, 1, 8, 9, 30)
+
+def test_compute_next_fire_at_converts_from_user_timezone():
+    # 09:00 in Helsinki is 07:00 UTC in winter
+    not_before = datetime.datetime(2024, 1, 1, 0, 0)
+    next_fire_at = compute_next_fire_at("Wednesday", datetime.time(9, 0), "Europe/Helsinki", not_before)
+    assert next_fire_at == datetime.datetime(2024, 1, 3, 7, 0)
+
+def test_compute_next_fire_at_local_day_differs_from_utc_day():
+    # Monday 08:00 in Tokyo is Sunday 23:00 UTC
+    not_before = datetime.datetime(2024, 1, 1, 0, 0)
+    next_fire_at = compute_next_fire_at("Monday", datetime.time(8, 0), "Asia/Tokyo", not_before)
+    assert next_fire_at == datetime.datetime(2024, 1, 7, 23, 0)
+
+def test_compute_next_fire_at_unknown_timezone_falls_back_to_utc():
+    not_before = datetime.datetime(2024, 1, 1, 0, 0)
+    next_fire_at = compute_next_fire_at("Monday", datetime.time(9, 0), "Not/AZone", not_before)
+    assert next_fire_at == datetime.datetime(2024, 1, 1, 9, 0)
+
+def test_refresh_next_fire_at_updates_all_schedules():
+    schedules = [
+        MagicMock(day_of_week="Monday", time_of_day=datetime.time(9, 0)),
+        MagicMock(day_of_week="Friday", time_of_day=datetime.time(18, 0)),
+    ]
+    refresh_next_fire_at(schedules, "America/New_York", datetime.datetime(2024, 1, 1, 0, 0))
+    assert schedules[0].next_fire_at == datetime.datetime(2024, 1, 1, 14, 0)
+    assert schedules[1].next_fire_at == datetime.datetime(2024, 1, 5, 23, 0)
@@ -0,0 +1,165 @@
+# tests/test_scheduler.py
+import asyncio
+import datetime
+import pytest
+from unittest.mock import MagicMock
+from backend.scheduler import DeliveryLimits, FireQueue, run_deliveries
+
+def test_run_deliveries_respects_global_limit(mocker):
+    in_flight = 0
+    peak = 0
+
+    async def fake_generate_speech(user, preferences, db, limits, send_after=None, schedule=None):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    mocker.patch('backend.scheduler.generate_speech', side_effect=fake_generate_speech)
+    mocker.patch('backend.scheduler.SessionLocal', side_effect=lambda: MagicMock())
+
+    async def run():
+        limits = DeliveryLimits(total=3, llm=1, tts=1, upload=1, email=1)
+        await run_deliveries([(MagicMock(id=i), MagicMock()) for i in range(10)], limits)
+
+    asyncio.run(run())
+    assert peak == 3
+
+def test_run_deliveries_uses_one_session_per_delivery(mocker):
+    sessions = []
+
+    def make_session():
+        session = MagicMock()
+        sessions.append(session)
+        return session
+
+    mock_generate = mocker.patch('backend.scheduler.generate_speech')
+    mocker.patch('backend.scheduler.SessionLocal', side_effect=make_session)
+
+    asyncio.run(run_deliveries([(MagicMock(id=i), MagicMock()) for i in range(4)]))
+
+    assert len(sessions) == 4
+    assert [call.args[2] for call in mock_generate.call_args_list] == sessions
+    for session in sessions:
+        session.close.assert_called_once()
+
+def test_fire_queue_pops_due_entries_in_time_order(mocker):
+    mocker.patch('backend.scheduler.SPREAD_SECONDS', 0)
+    base = datetime.datetime(2024, 1, 1, 9, 0)
+    queue = FireQueue()
+    queue.push(1, base + datetime.timedelta(minutes=2))
+    queue.push(2, base)
+    queue.push(3, base + datetime.timedelta(minutes=10))
+
+    assert queue.next_release() == base
+    due = queue.pop_due(base + datetime.timedelta(minutes=5))
+    assert list(due) == [2, 1]
+    assert len(queue) == 1
+    assert queue.next_release() == base + datetime.timedelta(minutes=10)
+
+def test_fire_queue_skips_superseded_entries(mocker):
+    mocker.patch('backend.scheduler.SPREAD_SECONDS', 0)
+    base = datetime.datetime(2024, 1, 1, 9, 0)
+    queue = FireQueue()
+    queue.push(1, base)
+    # The schedule was moved, e.g. after a timezone change
+    queue.push(1, base + datetime.timedelta(hours=1))
+
+    assert queue.pop_due(base + datetime.timedelta(minutes=30)) == {}
+    assert queue.pop_due(base + datetime.timedelta(hours=1)) == {1: base + datetime.timedelta(hours=1)}
+
+def test_fire_queue_spreads_releases_within_the_minute(mocker):
+    mocker.patch('backend.scheduler.SPREAD_SECONDS', 60)
+    base = datetime.datetime(2024, 1, 1, 9, 0)
+    queue = FireQueue()
+    for schedule_id in range(1, 50):
+        queue.push(schedule_id, base)
+
+    release_times = set()
+    while len(queue):
+        release_at = queue.next_release()
+        assert base <= release_at < base + datetime.timedelta(minutes=1)
+        release_times.add(release_at)
+        queue.pop_due(release_at)
+    assert len(release_times) > 1
+
+def test_fire_queue_releases_ahead_of_time_with_a_lookahead(mocker):
+    mocker.patch('backend.scheduler.LOOKAHEAD_SECONDS', 3600)
+    base = datetime.datetime(2024, 1, 1, 9, 0)
+    queue = FireQueue()
+    for schedule_id in range(1, 50):
+        queue.push(schedule_id, base)
+
+    release_times = set()
+    while len(queue):
+        release_at = queue.next_release()
+        # Spread over the first half of the hour before the fire time
+        assert base - datetime.timedelta(hours=1) <= release_at < base - datetime.timedelta(minutes=30)
+        release_times.add(release_at)
+        assert set(queue.pop_due(release_at).values()) == {base}
+    assert len(release_times) > 10
+
+def test_generate_speech_queues_email_in_the_speech_transaction(mocker):
+    from azure.cognitiveservices.speech import ResultReason
+    from backend.scheduler import generate_speech
+    mocker.patch('backend.scheduler.generate_speech_text', return_value="Speech text")
+    mocker.patch('backend.scheduler.lookup_audio', return_value=None)
+    mocker.patch('backend.scheduler.record_audio')
+    mocker.patch('backend.scheduler.tts_executor.synthesize', return_value=MagicMock(reason=ResultReason.SynthesizingAudioCompleted, audio_data=b"mp3"))
+    mocker.patch('backend.scheduler.upload_bytes_to_blob', return_value="https://blob/audio/a.mp3")
+    mock_enqueue = mocker.patch('backend.scheduler.enqueue_email')
+    db = MagicMock()
+    user = MagicMock(id=7, email="user@example.com")
+
+    asyncio.run(generate_speech(user, MagicMock(voice="Jenny"), db, DeliveryLimits()))
+
+    generated_speech = db.add.call_args.args[0]
+    args = mock_enqueue.call_args.args
+    assert args[0] is db
+    assert args[1] == "user@example.com"
+    assert args[4] == "https://blob/audio/a.mp3"
+    assert args[5][1] == b"mp3"
+    assert args[6] is generated_speech
+    db.commit.assert_called_once()
+
+def test_generate_speech_sends_pregenerated_email_at_fire_time(mocker):
+    mocker.patch('backend.scheduler.generate_speech_text', return_value="Speech text")
+    mocker.patch('backend.scheduler.lookup_audio', return_value="https://blob/audio/a.mp3")
+    mock_enqueue = mocker.patch('backend.scheduler.enqueue_email')
+    from backend.scheduler import generate_speech
+    fire_at = datetime.datetime(2024, 1, 1, 9, 0)
+
+    asyncio.run(generate_speech(MagicMock(id=7), MagicMock(voice="Jenny"), MagicMock(), DeliveryLimits(), send_after=fire_at))
+
+    assert mock_enqueue.call_args.args[7] == fire_at
+
+def test_run_daemon_raises_when_loading_schedules_fails(mocker):
+    from backend.scheduler import run_daemon
+    mocker.patch('backend.scheduler.SessionLocal', side_effect=lambda **kwargs: MagicMock())
+    mocker.patch('backend.scheduler.load_schedules', side_effect=RuntimeError("database is down"))
+
+    async def dispatch_until_stopped(stop_event):
+        await stop_event.wait()
+
+    mocker.patch('backend.scheduler.OutboxDispatcher.run', side_effect=dispatch_until_stopped)
+
+    async def run():
+        # Crash so the supervisor restarts the daemon, instead of hanging
+        await asyncio.wait_for(run_daemon(), timeout=5)
+
+    with pytest.raises(RuntimeError, match="database is down"):
+        asyncio.run(run())
+
+def test_generate_speech_ties_pregenerated_email_to_its_schedule(mocker):
+    mocker.patch('backend.scheduler.generate_speech_text', return_value="Speech text")
+    mocker.patch('backend.scheduler.lookup_audio', return_value="https://blob/audio/a.mp3")
+    mock_enqueue = mocker.patch('backend.scheduler.enqueue_email')
+    from backend.scheduler import generate_speech
+    fire_at = datetime.datetime(2024, 1, 1, 9, 0)
+    schedule = MagicMock(id=3, next_fire_at=datetime.datetime(2024, 1, 8, 9, 0))
+
+    asyncio.run(generate_speech(MagicMock(id=7), MagicMock(voice="Jenny"), MagicMock(), DeliveryLimits(), send_after=fire_at, schedule=schedule))
+
+    # The outbox cancels the email if the schedule changes before fire_at
+    assert mock_enqueue.call_args.args[8] is schedule
@@ -1,8 +1,12 @@
 # tests/test_speech_generation.py
+import json
+import time
 import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock
+from azure.cognitiveservices.speech import ResultReason
+from backend.main import GeneratedSpeech
 
 def test_generate_speech_success(client: TestClient, mocker):
     # Mock verify_token to return a user
@@ -47,20 +51,14 @@ def test_generate_speech_synthesis_failure(client: TestClient, mocker, caplog):
     # Set access_token cookie
     client.cookies.set("access_token", "mock_access_token")
 
-    # Mock AzureOpenAI client and its response
-    mock_azure_openai = MagicMock()
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock(message=MagicMock(content="Generated speech text"))]
-    mock_azure_openai.chat.completions.create.return_value = mock_response
-    mocker.patch('backend.main.AzureOpenAI', return_value=mock_azure_openai)
+    # Mock Azure OpenAI text generation
+    mocker.patch('backend.main.generate_speech_text', return_value="Generated speech text")
 
-    # Mock SpeechSynthesizer to simulate failure
-    mock_synthesizer = MagicMock()
-    mock_synthesizer.speak_text_async.return_value.get.return_value.reason = "SynthesizingAudioFailed"
-    mocker.patch('backend.main.SpeechSynthesizer', return_value=mock_synthesizer)
+    # Mock TTS synthesis to simulate failure
+    mocker.patch('backend.main.tts_executor.synthesize', return_value=MagicMock(reason=ResultReason.Canceled))
 
-    # Mock upload_file_to_blob should not be called
-    mock_upload = mocker.patch('backend.main.upload_file_to_blob')
+    # Mock upload_bytes_to_blob should not be called
+    mock_upload = mocker.patch('backend.main.upload_bytes_to_blob')
 
     # Mock database session
     mock_db = MagicMock()
@@ -79,7 +77,7 @@ def test_generate_speech_synthesis_failure(client: TestClient, mocker, caplog):
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
     assert response.json() == {"detail": "Speech synthesis failed"}
 
-    # Assert that upload_file_to_blob was not called
+    # Assert that upload_bytes_to_blob was not called
     mock_upload.assert_not_called()
 
     # Check that the error was logged
@@ -98,20 +96,17 @@ def test_generate_speech_upload_failure(client: TestClient, mocker, caplog):
     # Set access_token cookie
     client.cookies.set("access_token", "mock_access_token")
 
-    # Mock AzureOpenAI client and its response
-    mock_azure_openai = MagicMock()
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock(message=MagicMock(content="Generated speech text"))]
-    mock_azure_openai.chat.completions.create.return_value = mock_response
-    mocker.patch('backend.main.AzureOpenAI', return_value=mock_azure_openai)
+    # Mock Azure OpenAI text generation
+    mocker.patch('backend.main.generate_speech_text', return_value="Generated speech text")
 
-    # Mock SpeechSynthesizer
-    mock_synthesizer = MagicMock()
-    mock_synthesizer.speak_text_async.return_value.get.return_value.reason = "SynthesizingAudioCompleted"
-    mocker.patch('backend.main.SpeechSynthesizer', return_value=mock_synthesizer)
+    # Mock TTS synthesis
+    mock_synthesize = mocker.patch(
+        'backend.main.tts_executor.synthesize',
+        return_value=MagicMock(reason=ResultReason.SynthesizingAudioCompleted)
+    )
 
-    # Mock upload_file_to_blob to return None indicating failure
-    mocker.patch('backend.main.upload_file_to_blob', return_value=None)
+    # Mock upload_bytes_to_blob to return None indicating failure
+    mocker.patch('backend.main.upload_bytes_to_blob', return_value=None)
 
     # Mock database session
     mock_db = MagicMock()
@@ -130,28 +125,25 @@ def test_generate_speech_upload_failure(client: TestClient, mocker, caplog):
     assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
     assert response.json() == {"detail": "Failed to upload speech to storage"}
 
-    # Assert that upload_file_to_blob was called
-    mock_upload = mocker.patch('backend.main.upload_file_to_blob')
+    # Assert that upload_bytes_to_blob was called
+    mock_upload = mocker.patch('backend.main.upload_bytes_to_blob')
     mock_upload.assert_called_once()
 
     # Check that the error was logged
     assert "Failed to upload speech to storage" in caplog.text
 
 def test_generate_public_speech_success(client: TestClient, mocker):
-    # Mock AzureOpenAI client and its response
-    mock_azure_openai = MagicMock()
-    mock_response = MagicMock()
-    mock_response.choices = [MagicMock(message=MagicMock(content="Public generated speech text"))]
-    mock_azure_openai.chat.completions.create.return_value = mock_response
-    mocker.patch('backend.main.AzureOpenAI', return_value=mock_azure_openai)
+    # Mock Azure OpenAI text generation
+    mock_generate_text = mocker.patch('backend.main.generate_speech_text', return_value="Public generated speech text")
 
-    # Mock SpeechSynthesizer
-    mock_synthesizer = MagicMock()
-    mock_synthesizer.speak_text_async.return_value.get.return_value.reason = "SynthesizingAudioCompleted"
-    mocker.patch('backend.main.SpeechSynthesizer', return_value=mock_synthesizer)
+    # Mock TTS synthesis
+    mock_synthesize = mocker.patch(
+        'backend.main.tts_executor.synthesize',
+        return_value=MagicMock(reason=ResultReason.SynthesizingAudioCompleted)
+    )
 
-    # Mock upload_file_to_blob to return a mocked URL
-    mocker.patch('backend.main.upload_file_to_blob', return_value='https://mocked_blob_url.com/public_speech.wav')
+    # Mock upload_bytes_to_blob to return a mocked URL
+    mocker.patch('backend.main.upload_bytes_to_blob', return_value='https://mocked_blob_url.com/public_speech.wav')
 
     # Mock database session
     mock_db = MagicMock()
@@ -173,17 +165,233 @@ def test_generate_public_speech_success(client: TestClient, mocker):
     assert data["speech_url"] == "https://mocked_blob_url.com/public_speech.wav"
     assert data["user_id"] is None
 
-    # Assert that OpenAI was called with correct parameters
-    mock_azure_openai.chat.completions.create.assert_called_once()
+    # Assert that OpenAI was called once, on the event loop
+    mock_generate_text.assert_awaited_once()
 
-    # Assert that SpeechSynthesizer was called correctly
-    mock_synthesizer.speak_text_async.assert_called_once_with("Public generated speech text")
+    # Assert that TTS was called with the generated text
+    mock_synthesize.assert_awaited_once()
+    assert mock_synthesize.call_args.args[0] == "Public generated speech text"
 
-    # Assert that upload_file_to_blob was called with correct parameters
-    mock_upload = mocker.patch('backend.main.upload_file_to_blob')
+    # Assert that upload_bytes_to_blob was called with correct parameters
+    mock_upload = mocker.patch('backend.main.upload_bytes_to_blob')
     mock_upload.assert_called_once()
 
     # Assert that a GeneratedSpeech entry was added to the database
     mock_db.add.assert_called_once()
     mock_db.commit.assert_called_once()
     mock_db.refresh.assert_called_once()
+
+def test_generate_speech_tts_queue_full(client: TestClient, mocker):
+    # Mock verify_token to return a user
+    mock_user = MagicMock()
+    mock_user.id = 1
+    mocker.patch('backend.main.verify_token', return_value=mock_user)
+
+    # Set access_token cookie
+    client.cookies.set("access_token", "mock_access_token")
+
+    # Mock TTS executor saturation
+    from backend.main import TTSQueueFullError
+    mocker.patch('backend.main.tts_executor.synthesize', side_effect=TTSQueueFullError(7))
+
+    payload = {
+        "first_name": "Test",
+        "user_profile": "Test profile",
+        "persona": "Coach Carter",
+        "tone": "Inspirational",
+        "voice": "Ava"
+    }
+
+    response = client.post("/generate_speech", json=payload)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["retry-after"] == "7"
+
+def test_generate_public_speech_llm_queue_full(client: TestClient, mocker):
+    from backend.main import LLMQueueFullError
+    mocker.patch('backend.main.generate_speech_text', side_effect=LLMQueueFullError(5))
+
+    payload = {
+        "first_name": "Public",
+        "user_profile": "Public profile",
+        "persona": "Cheerful Friend",
+        "tone": "Friendly and Upbeat",
+        "voice": "Jenny"
+    }
+
+    response = client.post("/generate_public_speech", json=payload)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["retry-after"] == "5"
+
+def read_events(response):
+    events = []
+    for block in response.text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+def test_generate_speech_stream_sends_deltas_then_speech(client: TestClient, mocker, test_db):
+    mock_user = MagicMock()
+    mock_user.id = 1
+    mocker.patch('backend.main.verify_token', return_value=mock_user)
+    client.cookies.set("access_token", "mock_access_token")
+
+    async def stream_speech_text(messages, cache_scope=None):
+        for delta in ("Hello ", "world"):
+            yield delta
+    mocker.patch('backend.main.stream_speech_text', stream_speech_text)
+
+    payload = {
+        "first_name": "Test",
+        "user_profile": "Test profile",
+        "persona": "Coach Carter",
+        "tone": "Inspirational",
+        "voice": "Ava"
+    }
+
+    response = client.post("/generate_speech/stream", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/event-stream")
+
+    events = read_events(response)
+    assert events[:2] == [("delta", {"text": "Hello "}), ("delta", {"text": "world"})]
+    event, speech = events[2]
+    assert event == "done"
+    assert speech["speech_text"] == "Hello world"
+    assert speech["speech_url"] == "https://mocked_blob_url.com/speech.wav"
+    assert speech["user_id"] == 1
+    # Stored through the producer's own session, in the test database
+    assert test_db.get(GeneratedSpeech, speech["id"]).speech_text == "Hello world"
+
+def test_generate_speech_stream_reports_busy_tts(client: TestClient, mocker):
+    mock_user = MagicMock()
+    mock_user.id = 1
+    mocker.patch('backend.main.verify_token', return_value=mock_user)
+    client.cookies.set("access_token", "mock_access_token")
+
+    async def stream_speech_text(messages, cache_scope=None):
+        yield "Busy day"
+    mocker.patch('backend.main.stream_speech_text', stream_speech_text)
+    from backend.main import TTSQueueFullError
+    mocker.patch('backend.main.tts_executor.synthesize', side_effect=TTSQueueFullError(7))
+
+    payload = {
+        "first_name": "Test",
+        "user_profile": "Test profile",
+        "persona": "Coach Carter",
+        "tone": "Inspirational",
+        "voice": "Ava"
+    }
+
+    response = client.post("/generate_speech/stream", json=payload)
+    events = read_events(response)
+    assert events[0] == ("delta", {"text": "Busy day"})
+    assert events[1][0] == "error"
+    assert events[1][1]["retry_after"] == 7
+
+def test_generate_speech_audio_streams_then_stores_clip(client: TestClient, mocker, test_db):
+    mock_user = MagicMock()
+    mock_user.id = 1
+    mocker.patch('backend.main.verify_token', return_value=mock_user)
+    client.cookies.set("access_token", "mock_access_token")
+    mocker.patch('backend.main.generate_speech_text', return_value="Streamed speech text")
+
+    async def stream(text, voice, output_format=None):
+        for data in (b"ab", b"cd"):
+            yield data
+    mocker.patch('backend.main.tts_executor.stream', stream)
+    mock_upload = mocker.patch('backend.main.upload_bytes_to_blob', return_value="https://mocked_blob_url.com/streamed.mp3")
+
+    payload = {
+        "first_name": "Test",
+        "user_profile": "Test profile",
+        "persona": "Coach Carter",
+        "tone": "Inspirational",
+        "voice": "Ava"
+    }
+
+    response = client.post("/generate_speech/audio", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "audio/mpeg"
+    assert response.content == b"abcd"
+    assert response.headers["x-speech-url"].endswith(".mp3")
+
+    deadline = time.monotonic() + 5
+    while not mock_upload.called and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert mock_upload.call_args.args[0] == b"abcd"
+    # Stored through the producer's own session, in the test database
+    stored = test_db.query(GeneratedSpeech).filter_by(speech_text="Streamed speech text")
+    while stored.first() is None and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert stored.one().speech_url == response.headers["x-speech-url"]
+
+def test_generate_speech_audio_synthesis_failure(client: TestClient, mocker):
+    mock_user = MagicMock()
+    mock_user.id = 1
+    mocker.patch('backend.main.verify_token', return_value=mock_user)
+    client.cookies.set("access_token", "mock_access_token")
+    mocker.patch('backend.main.generate_speech_text', return_value="Failing speech text")
+
+    from backend.main import SpeechSynthesisFailedError
+    async def stream(text, voice, output_format=None):
+        raise SpeechSynthesisFailedError()
+        yield
+    mocker.patch('backend.main.tts_executor.stream', stream)
+
+    payload = {
+        "first_name": "Test",
+        "user_profile": "Test profile",
+        "persona": "Coach Carter",
+        "tone": "Inspirational",
+        "voice": "Ava"
+    }
+
+    response = client.post("/generate_speech/audio", json=payload)
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR
+    assert response.json() == {"detail": "Speech synthesis failed"}
+
+def test_generate_public_speech_fails_fast_when_circuit_is_open(client: TestClient, mocker):
+    from backend.main import CircuitOpenError
+    mocker.patch('backend.main.generate_speech_text', side_effect=CircuitOpenError('llm', 12))
+
+    payload = {
+        "first_name": "Test",
+        "user_profile": "Test profile",
+        "persona": "Coach Carter",
+        "tone": "Inspirational",
+        "voice": "Ava"
+    }
+
+    response = client.post("/generate_public_speech", json=payload)
+    assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+    assert response.headers["retry-after"] == "12"
+
+    response = client.get("/metrics/")
+    assert response.json()["breakers"]["llm"]["state"] == "closed"
+
+def test_pipelined_generation_synthesizes_cached_text_whole(client: TestClient, mocker):
+    mocker.patch('backend.main.TTS_PIPELINE_ENABLED', True)
+    mocker.patch('backend.main.cached_speech_text', return_value="Cached speech text")
+    mock_pipeline = mocker.patch('backend.main.SpeechPipeline')
+    mock_stream = mocker.patch('backend.main.stream_speech_text')
+    mock_synthesize = mocker.patch(
+        'backend.main.tts_executor.synthesize',
+        return_value=MagicMock(reason=ResultReason.SynthesizingAudioCompleted)
+    )
+
+    payload = {
+        "first_name": "Public",
+        "user_profile": "Public profile",
+        "persona": "Cheerful Friend",
+        "tone": "Friendly and Upbeat",
+        "voice": "Jenny"
+    }
+
+    response = client.post("/generate_public_speech", json=payload)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["speech_text"] == "Cached speech text"
+    # The cached text never enters a pipeline, so no sentence is synthesized and thrown away
+    mock_pipeline.assert_not_called()
+    mock_stream.assert_not_called()
+    mock_synthesize.assert_awaited_once()
+    assert mock_synthesize.call_args.args[0] == "Cached speech text"
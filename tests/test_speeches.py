@@ -3,6 +3,7 @@ import pytest
 from fastapi import status
 from fastapi.testclient import TestClient
 from unittest.mock import MagicMock
+from backend.schemas import GeneratedSpeechSummarySchema
 
 def test_get_public_speeches(client: TestClient, mocker):
     # Mock database query
@@ -23,7 +24,7 @@ def test_get_public_speeches(client: TestClient, mocker):
         }
     ]
     mock_db = MagicMock()
-    mock_db.query.return_value.filter.return_value.all.return_value = mock_speeches
+    mock_db.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = mock_speeches
     mocker.patch('backend.main.get_db', return_value=iter([mock_db]))
 
     response = client.get("/public_speeches")
@@ -52,7 +53,7 @@ def test_get_my_speeches_authenticated(client: TestClient, mocker):
         }
     ]
     mock_db = MagicMock()
-    mock_db.query.return_value.filter.return_value.all.return_value = mock_speeches
+    mock_db.query.return_value.filter.return_value.order_by.return_value.limit.return_value.all.return_value = mock_speeches
     mocker.patch('backend.main.get_db', return_value=iter([mock_db]))
 
     response = client.get("/my_speeches/")
@@ -62,4 +63,102 @@ def test_get_my_speeches_authenticated(client: TestClient, mocker):
 def test_get_my_speeches_unauthenticated(client: TestClient):
     response = client.get("/my_speeches/")
     assert response.status_code == status.HTTP_401_UNAUTHORIZED
-    assert response.json() == {"detail": "Not authenticated"}
\ No newline at end of file
+    assert response.json() == {"detail": "Not authenticated"}
+
+def test_get_public_speeches_pages_with_cursor(client: TestClient):
+    payload = {
+        "first_name": "Public",
+        "user_profile": "Public profile",
+        "persona": "Cheerful Friend",
+        "tone": "Friendly and Upbeat",
+        "voice": "Jenny"
+    }
+    for _ in range(3):
+        assert client.post("/generate_public_speech", json=payload).status_code == status.HTTP_200_OK
+
+    everything = client.get("/public_speeches/", params={"limit": 200}).json()
+    paged = []
+    params = {"limit": 2}
+    while True:
+        response = client.get("/public_speeches/", params=params)
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.json()) <= 2
+        paged.extend(response.json())
+        if "x-next-cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["x-next-cursor"]
+
+    assert [speech["id"] for speech in paged] == [speech["id"] for speech in everything]
+    created = [(speech["created_at"], speech["id"]) for speech in paged]
+    assert created == sorted(created, reverse=True)
+
+def test_get_public_speeches_invalid_cursor(client: TestClient):
+    response = client.get("/public_speeches/", params={"cursor": "not-a-cursor"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+    assert response.json() == {"detail": "Invalid cursor"}
+
+def test_get_public_speeches_summary(client: TestClient, mocker):
+    mocker.patch('backend.main.generate_speech_text', return_value="A long speech. " * 100)
+    assert client.post("/generate_public_speech", json={
+        "first_name": "Public",
+        "user_profile": "Public profile",
+        "persona": "Cheerful Friend",
+        "tone": "Friendly and Upbeat",
+        "voice": "Jenny"
+    }).status_code == status.HTTP_200_OK
+
+    response = client.get("/public_speeches/", params={"fields": "summary", "limit": 1})
+    assert response.status_code == status.HTTP_200_OK
+    [speech] = response.json()
+    assert set(speech) == set(GeneratedSpeechSummarySchema.model_fields)
+    GeneratedSpeechSummarySchema.model_validate(speech)
+    assert speech["speech_preview"] == ("A long speech. " * 100)[:200]
+    assert "x-next-cursor" in response.headers
+
+def test_get_public_speeches_conditional_get(client: TestClient):
+    first = client.get("/public_speeches/")
+    assert first.status_code == status.HTTP_200_OK
+    etag = first.headers["etag"]
+    assert first.headers["cache-control"].startswith("public")
+
+    response = client.get("/public_speeches/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_304_NOT_MODIFIED
+    assert response.headers["etag"] == etag
+    assert response.content == b""
+
+    # Another page of the same feed has its own tag
+    assert client.get("/public_speeches/", params={"limit": 1}, headers={"If-None-Match": etag}).status_code == status.HTTP_200_OK
+
+    assert client.post("/generate_public_speech", json={
+        "first_name": "Public",
+        "user_profile": "Public profile",
+        "persona": "Cheerful Friend",
+        "tone": "Friendly and Upbeat",
+        "voice": "Jenny"
+    }).status_code == status.HTTP_200_OK
+    response = client.get("/public_speeches/", headers={"If-None-Match": etag})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["etag"] != etag
+
+def test_get_public_speech_conditional_get(client: TestClient):
+    speech = client.post("/generate_public_speech", json={
+        "first_name": "Public",
+        "user_profile": "Public profile",
+        "persona": "Cheerful Friend",
+        "tone": "Friendly and Upbeat",
+        "voice": "Jenny"
+    }).json()
+
+    first = client.get(f"/public_speeches/{speech['id']}/")
+    assert first.status_code == status.HTTP_200_OK
+    assert "last-modified" in first.headers
+
+    by_etag = client.get(f"/public_speeches/{speech['id']}/", headers={"If-None-Match": first.headers["etag"]})
+    assert by_etag.status_code == status.HTTP_304_NOT_MODIFIED
+    by_date = client.get(f"/public_speeches/{speech['id']}/", headers={"If-Modified-Since": first.headers["last-modified"]})
+    assert by_date.status_code == status.HTTP_304_NOT_MODIFIED
+    stale = client.get(f"/public_speeches/{speech['id']}/", headers={"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"})
+    assert stale.status_code == status.HTTP_200_OK
+
+    missing = client.get("/public_speeches/999999/", headers={"If-None-Match": first.headers["etag"]})
+    assert missing.status_code == status.HTTP_404_NOT_FOUND
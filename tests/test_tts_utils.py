@@ -0,0 +1,145 @@
+# tests/test_tts_utils.py
+import asyncio
+import threading
+import pytest
+from unittest.mock import MagicMock
+from azure.cognitiveservices.speech import ResultReason
+from backend.tts_utils import CircuitBreaker, ProviderGovernor, SpeechPipeline, TTSExecutor, TTSQueueFullError
+from backend.main import DeadlineExceededError
+
+FRAME = b'\xff\xf3\x48\xc0' + bytes(140)
+
+def test_speech_pipeline_synthesizes_sentences_as_they_complete():
+    calls = []
+
+    async def synthesize(text, voice, output_format):
+        calls.append(text)
+        return MagicMock(reason=ResultReason.SynthesizingAudioCompleted, audio_data=FRAME)
+
+    async def run():
+        pipeline = SpeechPipeline('Ava', synthesize=synthesize, min_chars=20)
+        pipeline.feed("You can do it. ")
+        await asyncio.sleep(0)
+        started_early = list(calls)
+        for delta in ("Keep going, ", "one step at a time. Short. ", "Rest well"):
+            pipeline.feed(delta)
+        return started_early, pipeline.text, await pipeline.finish()
+
+    started_early, text, audio = asyncio.run(run())
+
+    assert started_early == ["You can do it."]
+    # "Short." is below min_chars, so it is merged with the rest of the text
+    assert calls == ["You can do it.", "Keep going, one step at a time.", "Short. Rest well"]
+    assert text == "You can do it. Keep going, one step at a time. Short. Rest well"
+    assert audio == FRAME * 3
+
+def test_speech_pipeline_fails_when_a_sentence_fails():
+    async def synthesize(text, voice, output_format):
+        reason = ResultReason.Canceled if text.startswith("Bad") else ResultReason.SynthesizingAudioCompleted
+        return MagicMock(reason=reason, audio_data=FRAME)
+
+    async def run():
+        pipeline = SpeechPipeline('Ava', synthesize=synthesize, min_chars=1)
+        pipeline.feed("Good start. Bad ending.")
+        return await pipeline.finish()
+
+    assert asyncio.run(run()) is None
+
+def test_tts_executor_stream_yields_audio_as_it_is_synthesized(mocker):
+    executor = TTSExecutor(workers=1, max_queue=0)
+
+    def synthesize(text, voice, output_format, submitted_at, on_audio=None):
+        for data in (b"ab", b"cd"):
+            on_audio(data)
+        return MagicMock(reason=ResultReason.SynthesizingAudioCompleted)
+    mocker.patch.object(executor, '_synthesize', side_effect=synthesize)
+
+    async def collect():
+        return [data async for data in executor.stream("Hello", 'Ava')]
+
+    assert asyncio.run(collect()) == [b"ab", b"cd"]
+    assert executor.pending == 0
+
+def test_speech_pipeline_caps_sentences_in_flight():
+    in_flight = 0
+    peak = 0
+
+    async def synthesize(text, voice, output_format):
+        nonlocal in_flight, peak
+        in_flight += 1
+        peak = max(peak, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        return MagicMock(reason=ResultReason.SynthesizingAudioCompleted, audio_data=FRAME)
+
+    async def run():
+        pipeline = SpeechPipeline('Ava', synthesize=synthesize, min_chars=1, max_in_flight=2)
+        pipeline.feed("One. Two. Three. Four. Five. Six. ")
+        return await pipeline.finish()
+
+    assert asyncio.run(run()) == FRAME * 6
+    assert peak == 2
+
+def test_cancelled_speech_pipeline_does_not_start_waiting_sentences():
+    calls = []
+
+    async def synthesize(text, voice, output_format):
+        calls.append(text)
+        await asyncio.sleep(1)
+
+    async def run():
+        pipeline = SpeechPipeline('Ava', synthesize=synthesize, min_chars=1, max_in_flight=1)
+        pipeline.feed("One. Two. Three. ")
+        await asyncio.sleep(0)
+        pipeline.cancel()
+        await asyncio.sleep(0)
+
+    asyncio.run(run())
+    assert calls == ["One."]
+
+def blocking_executor(mocker, max_concurrency, max_waiting, workers, max_queue):
+    mocker.patch('backend.tts_utils.tts_governor', ProviderGovernor(
+        "tts:test", rate=0, burst=1, min_concurrency=1, max_concurrency=max_concurrency, max_waiting=max_waiting, register=False
+    ))
+    breaker = mocker.patch('backend.tts_utils.tts_breaker', CircuitBreaker('tts:test', register=False))
+    executor = TTSExecutor(workers=workers, max_queue=max_queue)
+    release = threading.Event()
+
+    def synthesize(text, voice, output_format, submitted_at, on_audio=None):
+        release.wait(5)
+        return MagicMock(reason=ResultReason.SynthesizingAudioCompleted)
+    mocker.patch.object(executor, '_synthesize', side_effect=synthesize)
+    return executor, release, breaker
+
+def test_tts_executor_rejects_calls_beyond_its_queue_when_saturated(mocker):
+    executor, release, _ = blocking_executor(mocker, max_concurrency=2, max_waiting=3, workers=2, max_queue=3)
+
+    async def run():
+        calls = [asyncio.ensure_future(executor.synthesize("Hello", 'Ava')) for _ in range(10)]
+        await asyncio.sleep(0.05)
+        release.set()
+        return await asyncio.gather(*calls, return_exceptions=True)
+
+    results = asyncio.run(run())
+
+    # 2 synthesizing and 3 waiting; the rest get the 503 back-pressure at once
+    assert sum(isinstance(result, TTSQueueFullError) for result in results) == 5
+    assert sum(result.reason == ResultReason.SynthesizingAudioCompleted for result in results if not isinstance(result, Exception)) == 5
+    assert executor.pending == 0
+
+def test_tts_deadline_includes_the_wait_for_the_governor(mocker):
+    mocker.patch('backend.tts_utils.TTS_DEADLINE_SECONDS', 0.1)
+    executor, release, breaker = blocking_executor(mocker, max_concurrency=1, max_waiting=1, workers=1, max_queue=1)
+
+    async def run():
+        first = asyncio.ensure_future(executor.synthesize("First", 'Ava'))
+        await asyncio.sleep(0)
+        with pytest.raises(DeadlineExceededError):
+            await executor.synthesize("Second", 'Ava')
+        release.set()
+        with pytest.raises(DeadlineExceededError):
+            await first
+
+    asyncio.run(run())
+    # The waiting call never reached the service, so only the first one counts against it
+    assert breaker.snapshot()["calls"] == 1
@@ -0,0 +1,67 @@
+# tests/test_utils.py
+import pytest
+from backend import utils
+from sqlalchemy.orm import selectinload
+from backend.utils import User, PrincipalCache, create_access_token, verify_token, parse_include
+
+@pytest.fixture
+def session_factory(memory_db, mocker):
+    factory, statements = memory_db
+    mocker.patch('backend.utils.principal_cache', PrincipalCache(ttl_seconds=30))
+
+    db = factory()
+    db.add(User(id=1, microsoft_id="oid", first_name="Test", email="test@example.com", timezone="UTC"))
+    db.commit()
+    db.close()
+    statements.clear()
+    return factory, statements
+
+def test_verify_token_reuses_cached_principal(session_factory):
+    factory, statements = session_factory
+    token = create_access_token(data={"sub": "1"})
+
+    first = verify_token(token, factory())
+    assert first.first_name == "Test"
+    assert len(statements) == 1
+
+    second = verify_token(token, factory())
+    assert second.email == "test@example.com"
+    assert len(statements) == 1
+
+def test_verify_token_with_loaders_bypasses_cache(session_factory):
+    factory, statements = session_factory
+    token = create_access_token(data={"sub": "1"})
+    verify_token(token, factory())
+
+    user = verify_token(token, factory(), (selectinload(User.schedules),))
+    # The user query plus the selectin query for schedules
+    assert len(statements) == 3
+    assert user.schedules == []
+
+def test_fresh_principal_bypasses_cache(session_factory):
+    factory, statements = session_factory
+    token = create_access_token(data={"sub": "1"})
+    verify_token(token, factory())
+
+    verify_token(token, factory(), fresh=True)
+    assert len(statements) == 2
+
+def test_invalidated_principal_is_reloaded(session_factory):
+    factory, statements = session_factory
+    token = create_access_token(data={"sub": "1"})
+    verify_token(token, factory())
+
+    utils.principal_cache.invalidate(1)
+    verify_token(token, factory())
+    assert len(statements) == 2
+
+def test_verify_token_rejects_invalid_token(session_factory):
+    factory, _ = session_factory
+    assert verify_token("not-a-token", factory()) is None
+
+def test_parse_include():
+    assert parse_include(None) == {"preferences", "schedules", "generated_speeches"}
+    assert parse_include("preferences, schedules") == {"preferences", "schedules"}
+    assert parse_include("") == set()
+    with pytest.raises(ValueError):
+        parse_include("preferences,friends")